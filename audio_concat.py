@@ -1,81 +1,189 @@
+import argparse
 import os
+import shutil
 import subprocess
+import tempfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-def concat_audio_files(input_files, output_file):
+import media_probe
+import tracing
+
+# Encoder used to normalize a mismatched file to the target codec
+ENCODERS = {
+    'mp3': 'libmp3lame',
+    'aac': 'aac',
+    'opus': 'libopus',
+    'vorbis': 'libvorbis',
+    'flac': 'flac',
+    'pcm_s16le': 'pcm_s16le',
+}
+
+# Codecs whose frames carry encoder delay/padding; stream-copy joins leave audible gaps
+GAPLESS_CODECS = ('mp3', 'aac')
+
+
+def stream_signature(record):
+    """Parameters that must match for files to be stream-copied into one output"""
+    stream = media_probe.first_stream(record, 'audio')
+    if stream is None:
+        raise Exception(f"No audio stream in {record['path']}")
+    return (stream['codec_name'], stream['sample_rate'], stream['channels'])
+
+
+def _write_list(paths, list_path):
+    with open(list_path, 'w', encoding='utf-8') as f:
+        for path in paths:
+            # Single quotes must be escaped in concat lists
+            escaped = os.path.abspath(path).replace("'", r"'\''")
+            f.write(f"file '{escaped}'\n")
+
+
+def _normalize(input_file, output_file, signature):
+    """Re-encode one file to the target codec / sample rate / channel count"""
+    codec, sample_rate, channels = signature
+    command = [
+        'ffmpeg', '-y', '-v', 'error',
+        '-i', str(input_file),
+        '-map', '0:a:0', '-vn',
+        '-c:a', ENCODERS[codec],
+        '-ar', str(sample_rate),
+        '-ac', str(channels),
+        str(output_file)
+    ]
+    tracing.run(command, check=True, capture_output=True, stdin=subprocess.DEVNULL)
+    return output_file
+
+
+def _concat_copy(input_files, output_file, work_dir):
+    list_path = work_dir / 'files.txt'
+    _write_list(input_files, list_path)
+    command = [
+        'ffmpeg', '-y',
+        '-f', 'concat',           # Use concat demuxer
+        '-safe', '0',             # Don't restrict file paths
+        '-i', str(list_path),     # Input from the list file
+        '-map', '0:a',
+        '-c', 'copy',             # Copy streams without re-encoding
+        output_file               # Output file
+    ]
+    tracing.run(command, check=True, stdin=subprocess.DEVNULL)
+
+
+def _concat_gapless(input_files, output_file, signature):
+    """Decode everything once and join with the concat filter (decoders drop the padding)"""
+    codec, sample_rate, channels = signature
+    command = ['ffmpeg', '-y']
+    for path in input_files:
+        command += ['-i', str(path)]
+    # Bring every input to the target format before joining
+    layout = 'mono' if channels == 1 else 'stereo' if channels == 2 else f"{channels}c"
+    normalize = f"aresample={sample_rate},aformat=sample_rates={sample_rate}:channel_layouts={layout}"
+    chains = [f"[{i}:a:0]{normalize}[a{i}]" for i in range(len(input_files))]
+    joined = ''.join(f"[a{i}]" for i in range(len(input_files)))
+    chains.append(f"{joined}concat=n={len(input_files)}:v=0:a=1[out]")
+    command += ['-filter_complex', ';'.join(chains), '-map', '[out]']
+    if codec in ENCODERS:
+        command += ['-c:a', ENCODERS[codec]]
+    command.append(output_file)
+    tracing.run(command, check=True, stdin=subprocess.DEVNULL)
+
+
+def concat_audio_files(input_files, output_file, gapless=False, max_workers=None):
     """
     Concatenate multiple audio files into one
-    
+
+    All inputs are probed in one batch. Files that share the most common
+    container and codec / sample rate / channel count are stream-copied; only
+    the mismatched ones are re-encoded (in parallel) into that same container
+    before a single concat pass, since the concat demuxer needs every file in
+    one format.
+
     Args:
         input_files (list): List of paths to input audio files
         output_file (str): Path for the output audio file
+        gapless (bool): Decode and join with the concat filter so MP3/AAC encoder
+            padding does not leave gaps between files (one encode of the output)
+        max_workers (int): Parallel normalization jobs, defaults to the CPU count
+    Returns:
+        str: Output path, or None on failure
     """
+    work_dir = None
     try:
-        # Create a temporary file listing all input files
-        temp_list = 'temp_file_list.txt'
-        
-        # Write the file list
-        with open(temp_list, 'w') as f:
-            for audio_file in input_files:
-                f.write(f"file '{audio_file}'\n")
-        
-        # Construct the ffmpeg command
-        command = [
-            'ffmpeg',
-            '-f', 'concat',           # Use concat demuxer
-            '-safe', '0',             # Don't restrict file paths
-            '-i', temp_list,          # Input from the list file
-            '-c', 'copy',             # Copy streams without re-encoding
-            output_file               # Output file
-        ]
-        
-        # Execute the command
+        if not input_files:
+            raise Exception("No input files")
+
+        # Probe all inputs in one batch (cached per file)
+        records = media_probe.probe_many(input_files, max_workers=max_workers)
+        # Container (by demuxer) + stream parameters; the concat demuxer needs both to match
+        signatures = [(r['format_name'], stream_signature(r)) for r in records]
+        target_format, target = Counter(signatures).most_common(1)[0][0]
+        mismatched = [i for i, s in enumerate(signatures) if s != (target_format, target)]
+        # Normalized files are written with the suffix (and so the muxer) of a matching input
+        suffix = Path(input_files[signatures.index((target_format, target))]).suffix
+
         print("Starting audio concatenation...")
-        subprocess.run(command, check=True)
+        if gapless or (mismatched and target[0] not in ENCODERS):
+            # One decode + one encode, also handles any mismatched inputs
+            _concat_gapless(input_files, output_file, target)
+        else:
+            work_dir = Path(tempfile.mkdtemp(prefix='audio_concat_'))
+            files = list(input_files)
+            if mismatched:
+                print(f"Normalizing {len(mismatched)} of {len(files)} files to "
+                      f"{target[0]} {target[1]} Hz {target[2]} ch")
+                with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count() or 1) as pool:
+                    normalized = pool.map(
+                        lambda i: _normalize(files[i], work_dir / f"{i:04d}{suffix}", target), mismatched
+                    )
+                    for i, path in zip(mismatched, normalized):
+                        files[i] = path
+            elif target[0] in GAPLESS_CODECS:
+                print(f"Note: stream-copying {target[0]} may leave small gaps between files, use gapless=True to avoid them")
+            _concat_copy(files, output_file, work_dir)
+
         print(f"Successfully concatenated audio files to: {output_file}")
-        
+        return output_file
+
     except subprocess.CalledProcessError as e:
         print(f"Error occurred while concatenating: {e}")
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
     finally:
-        # Clean up the temporary file
-        if os.path.exists(temp_list):
-            os.remove(temp_list)
+        # Clean up the temporary files
+        if work_dir is not None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return None
 
 def main():
-    print("Audio File Concatenation Tool")
-    print("-" * 30)
-    
-    # Get input files
+    parser = argparse.ArgumentParser(description='Audio File Concatenation Tool')
+    parser.add_argument('inputs', nargs='+', help='Input audio files, in order')
+    parser.add_argument('-o', '--output', required=True, help='Output audio file')
+    parser.add_argument('--gapless', action='store_true',
+                        help='Decode and re-encode once so MP3/AAC padding leaves no gaps')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='Parallel normalization jobs')
+    args = parser.parse_args()
+
     input_files = []
-    while True:
-        file_path = input("Enter path to audio file (or press Enter to finish): ").strip()
-        if not file_path:
-            break
-        
+    for file_path in args.inputs:
         if os.path.exists(file_path):
             input_files.append(file_path)
         else:
             print(f"Warning: File '{file_path}' does not exist. Skipping.")
-    
+
     if not input_files:
         print("No valid input files provided.")
-        return
-    
-    # Get output file path
-    output_file = input("Enter the output file path: ").strip()
-    if not output_file:
-        print("No output file specified.")
-        return
-    
+        exit(1)
+
     # Ensure output directory exists
-    output_dir = os.path.dirname(output_file)
+    output_dir = os.path.dirname(args.output)
     if output_dir and not os.path.exists(output_dir):
         os.makedirs(output_dir)
-    
+
     # Perform concatenation
-    concat_audio_files(input_files, output_file)
+    if concat_audio_files(input_files, args.output, args.gapless, args.jobs) is None:
+        exit(1)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,207 @@
+"""把音频精确适配到目标时长。
+
+原来的 merge_video_audio 用 ``int(视频时长 / 音频时长 + 0.5)`` 算 -stream_loop
+次数再靠 -shortest 截断，循环次数取整后要么不够（结尾静音）要么多解码了
+整段不用的音频。这里在一个滤镜图里完成循环、交叉淡化和按采样点截断：
+
+    音频比目标长    atrim 截到目标时长
+    音频比目标短    无交叉淡化时输入侧 -stream_loop -1 无限循环，atrim 按采样点截断，
+                    解码量恰好等于目标时长；
+                    有交叉淡化时 asplit 成 n 份，用 acrossfade 首尾相接，再 atrim
+
+结果编码为 AAC（可以直接 -c:a copy 放进 MP4），按
+（音频内容, 目标时长, 交叉淡化, 淡出, 码率）缓存，默认在 ./tmp/audio_fit，
+可用 AUDIO_FIT_CACHE 修改。
+
+只需要截断（音频不比目标短、没有淡出）时不再重编码：音轨经
+encoding_profiles.prepare_audio 编码成 AAC 一次（已是 AAC 时直接用原文件），
+不同目标时长都从这份 AAC 流复制截断，误差不超过一个 AAC 帧（ALIGNED_TOLERANCE）。
+
+用法:
+    python audio_fit.py music.mp3 12.5 -o fitted.m4a --crossfade 1.5
+"""
+import argparse
+import math
+import os
+import shutil
+import subprocess
+import threading
+from pathlib import Path
+from typing import Dict, List
+
+import encoding_profiles
+import media_probe
+import tracing
+
+# 目标时长按毫秒取整参与缓存键
+DURATION_PRECISION = 3
+
+# 与目标时长相差不超过一个 AAC 帧（1024 采样 @ 44.1kHz ≈ 23ms）时视为已经对齐
+ALIGNED_TOLERANCE = 0.025
+
+_locks: Dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def cache_dir() -> Path:
+    return Path(os.getenv("AUDIO_FIT_CACHE", "./tmp/audio_fit"))
+
+
+def build_filter(audio_duration: float, target: float, crossfade: float = 0.0, fade_out: float = 0.0):
+    """
+    生成适配用的滤镜图
+
+    Returns:
+        (滤镜图字符串, 输入侧参数列表)；滤镜图输出标签为 [out]
+    """
+    if audio_duration <= 0 or target <= 0:
+        raise ValueError(f"时长必须为正数: 音频 {audio_duration}, 目标 {target}")
+    if crossfade < 0 or fade_out < 0:
+        raise ValueError("交叉淡化和淡出时长不能为负数")
+
+    input_args: List[str] = []
+    chain: List[str] = []
+    if audio_duration >= target:
+        source = "[0:a]"
+    elif crossfade <= 0:
+        # 输入侧无限循环，atrim 截到目标时长后 ffmpeg 就停止解码
+        input_args = ["-stream_loop", "-1"]
+        source = "[0:a]"
+    else:
+        # 交叉淡化不能超过半段音频，否则相邻两次重复会互相重叠
+        crossfade = min(crossfade, audio_duration / 2)
+        step = audio_duration - crossfade
+        copies = max(math.ceil((target - crossfade) / step), 2)
+        labels = [f"[c{i}]" for i in range(copies)]
+        chain.append(f"[0:a]asplit={copies}{''.join(labels)}")
+        previous = labels[0]
+        for i, label in enumerate(labels[1:], 1):
+            output = f"[x{i}]"
+            chain.append(f"{previous}{label}acrossfade=d={crossfade:.6f}:c1=tri:c2=tri{output}")
+            previous = output
+        source = previous
+
+    filters = [f"atrim=end={target:.6f}", "asetpts=N/SR/TB"]
+    if fade_out > 0:
+        fade_out = min(fade_out, target)
+        filters.append(f"afade=t=out:st={target - fade_out:.6f}:d={fade_out:.6f}")
+    chain.append(f"{source}{','.join(filters)}[out]")
+    return ";".join(chain), input_args
+
+
+def fit_audio(audio_path, target_duration: float, crossfade: float = 0.0, fade_out: float = 0.0,
+              profile=None, output_path=None) -> str:
+    """
+    把音频循环/截断/交叉淡化到恰好 target_duration 秒，返回 AAC 音频路径
+
+    Args:
+        audio_path: 输入音频
+        target_duration: 目标时长（秒），通常是视频时长
+        crossfade: 循环衔接处的交叉淡化时长（秒），0 表示直接首尾相接
+        fade_out: 结尾淡出时长（秒）
+        profile: 编码档位，决定 AAC 码率（见 encoding_profiles）
+        output_path: 指定输出路径时把结果复制过去，否则返回缓存中的文件
+    """
+    record = media_probe.probe(audio_path)
+    stream = media_probe.first_stream(record, "audio")
+    if stream is None:
+        raise ValueError(f"文件中没有音频流: {audio_path}")
+    audio_duration = stream.get("duration") or record["duration"]
+    target = round(float(target_duration), DURATION_PRECISION)
+
+    if not fade_out and audio_duration - target >= -ALIGNED_TOLERANCE:
+        # 只需截断：同一音轨只编码一次 AAC，各目标时长都从它流复制
+        prepared = encoding_profiles.prepare_audio(audio_path, profile)
+        if abs(audio_duration - target) <= ALIGNED_TOLERANCE:
+            fitted = prepared
+        else:
+            fitted = str(_cut_cached(prepared, target))
+    else:
+        fitted = str(_fit_cached(audio_path, audio_duration, target, crossfade, fade_out, profile))
+
+    if output_path is not None:
+        shutil.copyfile(fitted, output_path)
+        return str(output_path)
+    return fitted
+
+
+def _fit_cached(audio_path, audio_duration, target, crossfade, fade_out, profile) -> Path:
+    from result_cache import file_digest
+
+    bitrate = encoding_profiles.get_profile(profile)["audio_bitrate"]
+    name = f"{file_digest(audio_path)[:32]}-{target:.3f}s-xf{crossfade:g}-fo{fade_out:g}-{bitrate}.m4a"
+
+    def command(tmp_path):
+        graph, input_args = build_filter(audio_duration, target, crossfade, fade_out)
+        return [
+            "ffmpeg", "-y", "-v", "error",
+            *input_args, "-i", str(audio_path),
+            "-filter_complex", graph,
+            "-map", "[out]",
+            *encoding_profiles.audio_args(profile),
+            str(tmp_path),
+        ]
+
+    return _cached(name, command)
+
+
+def _cut_cached(aac_path, target) -> Path:
+    """把 AAC 音轨流复制截断到 target 秒（按 AAC 帧对齐，不重编码）"""
+    from result_cache import file_digest
+
+    name = f"{file_digest(aac_path)[:32]}-{target:.3f}s-copy.m4a"
+
+    def command(tmp_path):
+        return [
+            "ffmpeg", "-y", "-v", "error",
+            "-i", str(aac_path),
+            "-map", "0:a:0", "-vn",
+            "-t", f"{target:.6f}",
+            "-c:a", "copy",
+            str(tmp_path),
+        ]
+
+    return _cached(name, command)
+
+
+def _cached(name, command) -> Path:
+    """缓存目录中的 name 不存在时用 command(临时路径) 生成它，同名文件并发时只生成一次"""
+    out_path = cache_dir() / name
+    if out_path.exists():
+        return out_path
+
+    with _locks_guard:
+        lock = _locks.setdefault(name, threading.Lock())
+    with lock:
+        if out_path.exists():
+            return out_path
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = out_path.with_name(f".{out_path.stem}.{threading.get_ident()}.m4a")
+        cmd = command(tmp_path)
+        try:
+            result = tracing.run(cmd, capture_output=True, stdin=subprocess.DEVNULL)
+            if result.returncode != 0:
+                raise Exception(f"音频适配失败: {result.stderr.decode(errors='replace')}")
+            os.replace(tmp_path, out_path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+    return out_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='把音频循环/截断/交叉淡化到指定时长')
+    parser.add_argument('audio', help='输入音频路径')
+    parser.add_argument('duration', type=float, help='目标时长（秒）')
+    parser.add_argument('-o', '--output', help='输出路径（默认只打印缓存中的路径）')
+    parser.add_argument('--crossfade', type=float, default=0.0, help='循环衔接处的交叉淡化时长（秒）')
+    parser.add_argument('--fade-out', type=float, default=0.0, help='结尾淡出时长（秒）')
+    parser.add_argument('-p', '--profile', choices=list(encoding_profiles.PROFILES),
+                        default=encoding_profiles.DEFAULT_PROFILE, help='编码档位（决定 AAC 码率）')
+    args = parser.parse_args()
+
+    print(fit_audio(args.audio, args.duration, args.crossfade, args.fade_out, args.profile, args.output))
+
+
+if __name__ == "__main__":
+    main()
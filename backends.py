@@ -0,0 +1,500 @@
+"""生成服务的可插拔后端。
+
+流水线中的三个远程生成步骤（文生图、图生视频、图生音乐）都通过这里的后端
+调用，可以在真实服务和本地替身之间切换：
+
+    remote  DashScope 文生图、HuggingFace image-to-music Space、图生视频占位实现
+    local   纯本地的 ffmpeg 替身：按 prompt 哈希确定性生成的渐变图、
+            zoompan 推拉镜头（Ken Burns）视频、正弦音 + 粉噪声音乐
+
+本地替身不需要网络和配额，可以离线压测编排本身的吞吐量和尾延迟。
+为了模拟远程服务，每次调用前可以注入延迟和随机失败。
+
+环境变量：
+    TOOLS_BACKEND                 所有步骤的默认后端（remote / local，默认 remote）
+    TOOLS_BACKEND_IMAGE|VIDEO|MUSIC  单独指定某个步骤的后端
+    LOCAL_BACKEND_LATENCY         本地替身每次调用注入的延迟（秒，默认 0）
+    LOCAL_BACKEND_JITTER          延迟的随机抖动上限（秒，默认 0）
+    LOCAL_BACKEND_FAILURE_RATE    本地替身的随机失败概率（0~1，默认 0）
+    LOCAL_BACKEND_SEED            注入延迟和失败用的随机种子，便于复现
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import random
+import shutil
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+import tracing
+
+BACKEND_KINDS = ("image", "video", "music")
+
+
+class BackendError(Exception):
+    """后端调用失败（包括注入的失败）。"""
+
+
+class FaultInjector:
+    """在调用前注入延迟和随机失败。
+
+    Args:
+        latency: 固定延迟（秒）
+        jitter: 在固定延迟之上附加 [0, jitter) 的均匀随机延迟
+        failure_rate: 失败概率，命中时抛出 BackendError
+        seed: 随机种子，None 表示不固定
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0, seed=None):
+        if not 0.0 <= failure_rate <= 1.0:
+            raise ValueError(f"失败概率必须在 0 到 1 之间: {failure_rate}")
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "FaultInjector":
+        seed = os.getenv("LOCAL_BACKEND_SEED")
+        return cls(
+            latency=float(os.getenv("LOCAL_BACKEND_LATENCY", 0)),
+            jitter=float(os.getenv("LOCAL_BACKEND_JITTER", 0)),
+            failure_rate=float(os.getenv("LOCAL_BACKEND_FAILURE_RATE", 0)),
+            seed=int(seed) if seed else None,
+        )
+
+    def __call__(self, operation: str):
+        with self._lock:
+            delay = self.latency + (self._random.random() * self.jitter if self.jitter else 0.0)
+            failed = self._random.random() < self.failure_rate
+        if delay > 0:
+            time.sleep(delay)
+        if failed:
+            raise BackendError(f"{operation}: 注入的失败")
+
+
+def _seed(*parts) -> int:
+    """由参数得到稳定的整数种子（不受 PYTHONHASHSEED 影响）"""
+    digest = hashlib.sha256("\x00".join(str(p) for p in parts).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def _run_ffmpeg(cmd, operation: str):
+    result = tracing.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise BackendError(f"{operation} 失败: {result.stderr.decode(errors='replace')}")
+
+
+# ---- remote：真实服务 ----
+
+class DashScopeImageBackend:
+    """阿里云 DashScope qwen-image 文生图
+
+    text_to_image 走同步接口，批量生成时走异步任务接口：submit 提交任务立即返回
+    task_id，poll 查询任务状态，多个任务可以同时在服务端排队/生成。
+    """
+
+    url = "https://dashscope.aliyuncs.com/api/v1/services/aigc/multimodal-generation/generation"
+    async_url = "https://dashscope.aliyuncs.com/api/v1/services/aigc/text2image/image-synthesis"
+    task_url = "https://dashscope.aliyuncs.com/api/v1/tasks/{task_id}"
+
+    def __init__(self, size: str = "1328*1328"):
+        self.size = size
+
+    def _headers(self) -> Dict[str, str]:
+        api_key = os.getenv('DASHSCOPE_API_KEY')
+        if not api_key:
+            raise ValueError("请设置 DASHSCOPE_API_KEY 环境变量")
+        return {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}"
+        }
+
+    def submit(self, prompt: str) -> str:
+        """提交异步生成任务，返回 task_id"""
+        payload = {
+            "model": "qwen-image",
+            "input": {"prompt": prompt, "negative_prompt": ""},
+            "parameters": {"size": self.size, "n": 1, "prompt_extend": True, "watermark": True},
+        }
+        import http_client
+
+        headers = {**self._headers(), "X-DashScope-Async": "enable"}
+        response = http_client.post(self.async_url, headers=headers, json=payload)
+        response.raise_for_status()
+        task_id = response.json().get("output", {}).get("task_id")
+        if not task_id:
+            raise BackendError(f"未能从 API 响应中获取 task_id: {response.text}")
+        return task_id
+
+    def poll(self, task_id: str):
+        """查询任务状态，返回 (状态, 图像 URL 或 None)
+
+        状态为 DashScope 的 task_status：PENDING / RUNNING / SUCCEEDED / FAILED / CANCELED / UNKNOWN
+        """
+        import http_client
+
+        headers = self._headers()
+        del headers["Content-Type"]
+        response = http_client.get(self.task_url.format(task_id=task_id), headers=headers)
+        response.raise_for_status()
+        output = response.json().get("output", {})
+        status = output.get("task_status", "UNKNOWN")
+        if status == "SUCCEEDED":
+            results = output.get("results") or [{}]
+            return status, results[0].get("url")
+        if status in ("FAILED", "CANCELED", "UNKNOWN"):
+            raise BackendError(f"任务 {task_id} 状态为 {status}: {output.get('message', '')}")
+        return status, None
+
+    def text_to_image(self, prompt: str, out_path: Path) -> str:
+        import http_client
+
+        headers = self._headers()
+        payload = {
+            "model": "qwen-image",
+            "input": {
+                "messages": [
+                    {
+                        "role": "user",
+                        "content": [
+                            {
+                                "text": prompt
+                            }
+                        ]
+                    }
+                ]
+            },
+            "parameters": {
+                "negative_prompt": "",
+                "prompt_extend": True,
+                "watermark": True,
+                "size": self.size
+            }
+        }
+
+        try:
+            response = http_client.post(self.url, headers=headers, json=payload)
+            response.raise_for_status()
+            result = response.json()
+
+            # 从响应中获取图像 URL 并流式下载
+            if 'output' in result and 'results' in result['output']:
+                image_url = result['output']['results'][0].get('url')
+                if image_url:
+                    return str(http_client.download(image_url, out_path))
+
+            raise Exception("未能从 API 响应中获取图像 URL")
+        except Exception as e:
+            raise Exception(f"调用 DashScope API 失败: {str(e)}")
+
+
+class PlaceholderVideoBackend:
+    """图生视频占位实现
+    TODO: 用 Runway/Gen-2 等 API 替换伪代码
+    """
+
+    def image_to_video(self, image_path: str, prompt: str, duration_s: float, out_path: Path) -> str:
+        # 伪代码：调用 Runway 的 image->video 接口并将返回二进制写入 out_path
+        # e.g. requests.post("https://api.runwayml.com/v1/generate_video", files=..., data=...)
+        Path(out_path).write_bytes(b"MP4-DUMMY")
+        return str(out_path)
+
+
+class GradioMusicBackend:
+    """HuggingFace 的 image-to-music Space
+
+    客户端来自进程内共享的 gradio_pool（只握手一次），任务用 client.submit 提交，
+    多个线程的生成请求可以同时在 Space 上排队/运行。
+    """
+
+    def __init__(self, space: str = "fffiloni/image-to-music-v2", model: str = "ACE Step",
+                 timeout: Optional[float] = None):
+        import gradio_pool
+
+        self.space = space
+        self.model = model
+        self.timeout = timeout or float(os.getenv("GRADIO_JOB_TIMEOUT", 600))
+        self.pool = gradio_pool.get_pool(space)
+        # 后端在音乐阶段第一次缓存未命中时才创建（结果缓存命中时不会导入 gradio、也不联网）；
+        # 此时在后台预热池中其余的客户端，后续并发任务不用再排队等握手
+        self.pool.warm_up()
+
+    def image_to_music(self, image_path: str, mood: str, length_s: float, out_path: Path) -> str:
+        from gradio_client import handle_file
+
+        try:
+            with self.pool.client() as client:
+                # 调用 image-to-music API
+                # 使用 ACE Step 模型，它通常产生较好的结果
+                job = client.submit(
+                    image_in=handle_file(str(image_path)),
+                    chosen_model=self.model,
+                    api_name="/infer"
+                )
+                try:
+                    prompt, audio_path = job.result(timeout=self.timeout)
+                except TimeoutError:
+                    # 取消任务，释放 Space 上的排队名额；客户端本身没问题，留在池中继续使用
+                    job.cancel()
+                    raise
+
+            # 将生成的音频移动到指定位置（同一文件系统内只是改名，不复制数据）
+            Path(out_path).parent.mkdir(parents=True, exist_ok=True)
+            shutil.move(audio_path, out_path)
+
+            return str(out_path)
+
+        except Exception as e:
+            raise Exception(f"生成音乐失败: {str(e)}")
+
+
+# ---- local：离线替身 ----
+
+class LocalImageBackend:
+    """确定性的本地文生图：同一 prompt 总是得到同一张渐变图"""
+
+    def __init__(self, size: str = "1328x1328", inject: Optional[FaultInjector] = None):
+        self.size = size
+        self.inject = inject or FaultInjector.from_env()
+
+    def text_to_image(self, prompt: str, out_path: Path) -> str:
+        self.inject("text_to_image")
+        seed = _seed("image", prompt)
+        rng = random.Random(seed)
+        colors = ":".join(f"c{i}=0x{rng.randrange(0x1000000):06x}" for i in range(4))
+        cmd = [
+            "ffmpeg", "-y", "-v", "error",
+            "-f", "lavfi", "-i", f"gradients=s={self.size}:{colors}:nb_colors=4:seed={seed % 2**31}",
+            "-frames:v", "1",
+            str(out_path),
+        ]
+        _run_ffmpeg(cmd, "本地文生图")
+        return str(out_path)
+
+
+class LocalVideoBackend:
+    """本地图生视频：对静态图做 zoompan 推镜头（Ken Burns 效果）"""
+
+    def __init__(self, size: str = "1280x720", fps: int = 25, max_zoom: float = 1.3,
+                 inject: Optional[FaultInjector] = None):
+        self.size = size
+        self.fps = fps
+        self.max_zoom = max_zoom
+        self.inject = inject or FaultInjector.from_env()
+
+    def image_to_video(self, image_path: str, prompt: str, duration_s: float, out_path: Path) -> str:
+        self.inject("image_to_video")
+        frames = max(int(round(float(duration_s) * self.fps)), 1)
+        step = (self.max_zoom - 1.0) / frames
+        # 先放大输入再 zoompan，减少缩放时的抖动；单张图片输入时 d 即输出帧数
+        zoompan = (
+            f"scale=-2:{int(self.size.split('x')[1]) * 2},"
+            f"zoompan=z='min(zoom+{step:.6f},{self.max_zoom})'"
+            f":x='iw/2-(iw/zoom/2)':y='ih/2-(ih/zoom/2)'"
+            f":d={frames}:s={self.size}:fps={self.fps},"
+            f"format=yuv420p"
+        )
+        cmd = [
+            "ffmpeg", "-y", "-v", "error",
+            "-i", str(image_path),
+            "-vf", zoompan,
+            "-frames:v", str(frames),
+            "-c:v", "libx264", "-preset", "veryfast", "-crf", "23",
+            "-movflags", "+faststart",
+            str(out_path),
+        ]
+        _run_ffmpeg(cmd, "本地图生视频")
+        return str(out_path)
+
+
+class LocalMusicBackend:
+    """本地图生音乐：由参考图内容决定音高的正弦和弦，叠加少量粉噪声"""
+
+    def __init__(self, inject: Optional[FaultInjector] = None):
+        self.inject = inject or FaultInjector.from_env()
+
+    def image_to_music(self, image_path: str, mood: str, length_s: float, out_path: Path) -> str:
+        self.inject("image_to_music")
+        from result_cache import file_digest
+
+        rng = random.Random(_seed("music", file_digest(image_path), mood))
+        root = rng.choice([110.0, 130.81, 146.83, 164.81, 196.0, 220.0])
+        # 大三和弦（根音、三度、五度），附带粉噪声模拟底噪
+        tones = [root, root * 5 / 4, root * 3 / 2]
+        inputs = []
+        for freq in tones:
+            inputs += ["-f", "lavfi", "-i", f"sine=frequency={freq:.2f}:sample_rate=44100:duration={length_s}"]
+        inputs += ["-f", "lavfi", "-i", f"anoisesrc=color=pink:amplitude=0.05:sample_rate=44100:duration={length_s}"]
+        cmd = [
+            "ffmpeg", "-y", "-v", "error",
+            *inputs,
+            "-filter_complex", f"amix=inputs={len(tones) + 1}:normalize=1,aformat=channel_layouts=stereo",
+            "-c:a", "libmp3lame", "-b:a", "192k",
+            str(out_path),
+        ]
+        _run_ffmpeg(cmd, "本地图生音乐")
+        return str(out_path)
+
+
+# ---- 注册表 ----
+
+_REGISTRY: Dict[str, Dict[str, Callable[[], object]]] = {
+    "image": {"remote": DashScopeImageBackend, "local": LocalImageBackend},
+    "video": {"remote": PlaceholderVideoBackend, "local": LocalVideoBackend},
+    "music": {"remote": GradioMusicBackend, "local": LocalMusicBackend},
+}
+_instances: Dict[tuple, object] = {}
+_instances_lock = threading.Lock()
+
+
+def register(kind: str, name: str, factory: Callable[[], object]):
+    """注册一个后端实现，factory 为无参可调用对象（通常是类本身）"""
+    if kind not in BACKEND_KINDS:
+        raise ValueError(f"未知的后端类型: {kind}，可选: {', '.join(BACKEND_KINDS)}")
+    _REGISTRY[kind][name] = factory
+    with _instances_lock:
+        _instances.pop((kind, name), None)
+
+
+def backend_name(kind: str) -> str:
+    """当前为某个步骤选用的后端名称"""
+    return os.getenv(f"TOOLS_BACKEND_{kind.upper()}") or os.getenv("TOOLS_BACKEND", "remote")
+
+
+def get_backend(kind: str, name: Optional[str] = None):
+    """返回某个步骤的后端实例（同名后端在进程内共享一个实例）"""
+    name = name or backend_name(kind)
+    try:
+        factory = _REGISTRY[kind][name]
+    except KeyError:
+        raise ValueError(f"未注册的后端: {kind}/{name}，可选: {', '.join(_REGISTRY.get(kind, {}))}")
+    with _instances_lock:
+        instance = _instances.get((kind, name))
+        if instance is None:
+            instance = _instances[(kind, name)] = factory()
+    return instance
+
+
+def reset():
+    """丢弃已创建的后端实例，下次调用时按当前环境变量重新创建"""
+    with _instances_lock:
+        _instances.clear()
+
+
+# ---- 批量文生图 ----
+
+# 默认按 DashScope 文生图的配额限流，可用环境变量调整
+DASHSCOPE_SUBMIT_RATE = float(os.getenv("DASHSCOPE_SUBMIT_RATE", 2))     # 每秒提交的任务数
+DASHSCOPE_MAX_TASKS = int(os.getenv("DASHSCOPE_MAX_TASKS", 4))           # 服务端同时在途的任务数
+DASHSCOPE_POLL_INTERVAL = float(os.getenv("DASHSCOPE_POLL_INTERVAL", 2))  # 查询任务状态的间隔（秒）
+
+
+def text_to_images(prompts, out_paths, backend=None, rate: Optional[float] = None,
+                   max_in_flight: Optional[int] = None, poll_interval: Optional[float] = None,
+                   task_timeout: float = 600.0):
+    """
+    批量文生图，按完成顺序逐个产出 (序号, 图像路径或异常对象)
+
+    支持异步任务的后端（DashScope）走 提交 -> 轮询 -> 下载 流程：提交受令牌桶
+    限流，同时在途的任务数有上限，一个轮询循环统一查询所有在途任务，
+    下载在线程池中进行；其他后端在线程池中并发调用 text_to_image，同样受令牌桶限流。
+
+    Args:
+        prompts: 提示词列表
+        out_paths: 与 prompts 一一对应的输出路径
+        backend: 后端实例，默认 get_backend("image")
+        rate: 每秒最多提交的请求数
+        max_in_flight: 同时在途的任务数
+        poll_interval: 轮询任务状态的间隔（秒）
+        task_timeout: 单个任务从提交起的最长等待时间（秒）
+    """
+    prompts, out_paths = list(prompts), [Path(p) for p in out_paths]
+    if len(prompts) != len(out_paths):
+        raise ValueError("prompts 与 out_paths 数量不一致")
+    import http_client
+
+    backend = backend or get_backend("image")
+    bucket = http_client.TokenBucket(rate or DASHSCOPE_SUBMIT_RATE)
+    max_in_flight = max_in_flight or DASHSCOPE_MAX_TASKS
+
+    if hasattr(backend, "submit") and hasattr(backend, "poll"):
+        yield from _batch_async_tasks(backend, prompts, out_paths, bucket, max_in_flight,
+                                      poll_interval or DASHSCOPE_POLL_INTERVAL, task_timeout)
+    else:
+        yield from _batch_threads(backend, prompts, out_paths, bucket, max_in_flight)
+
+
+def _batch_threads(backend, prompts, out_paths, bucket, max_in_flight):
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    def job(prompt, out_path):
+        bucket.acquire()
+        return backend.text_to_image(prompt, out_path)
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        futures = {pool.submit(job, p, o): i for i, (p, o) in enumerate(zip(prompts, out_paths))}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except Exception as e:
+                yield futures[future], e
+
+
+def _batch_async_tasks(backend, prompts, out_paths, bucket, max_in_flight, poll_interval, task_timeout):
+    from collections import deque
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+    import http_client
+
+    pending = deque(range(len(prompts)))
+    in_flight: Dict[str, tuple] = {}   # task_id -> (序号, 提交时间)
+    downloads: Dict[object, int] = {}  # Future -> 序号
+    next_poll = 0.0
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        while pending or in_flight or downloads:
+            # 有配额就提交，提交失败的任务直接产出异常
+            while pending and len(in_flight) < max_in_flight and bucket.try_acquire():
+                i = pending.popleft()
+                try:
+                    in_flight[backend.submit(prompts[i])] = (i, time.monotonic())
+                except Exception as e:
+                    yield i, e
+
+            now = time.monotonic()
+            if in_flight and now >= next_poll:
+                next_poll = now + poll_interval
+                for task_id, (i, submitted) in list(in_flight.items()):
+                    try:
+                        status, url = backend.poll(task_id)
+                        if status != "SUCCEEDED" and now - submitted > task_timeout:
+                            raise BackendError(f"任务 {task_id} 超过 {task_timeout} 秒仍未完成")
+                    except Exception as e:
+                        del in_flight[task_id]
+                        yield i, e
+                        continue
+                    if status == "SUCCEEDED":
+                        del in_flight[task_id]
+                        downloads[pool.submit(http_client.download, url, out_paths[i])] = i
+
+            # 等待下载完成、下一次轮询或下一个令牌，取最早的一个
+            waits = [poll_interval if not in_flight else max(next_poll - time.monotonic(), 0)]
+            if pending and len(in_flight) < max_in_flight:
+                waits.append(bucket.wait_time())
+            timeout = min(waits)
+            if downloads:
+                done, _ = wait(list(downloads), timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i = downloads.pop(future)
+                    try:
+                        yield i, str(future.result())
+                    except Exception as e:
+                        yield i, e
+            elif timeout > 0:
+                time.sleep(timeout)
@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+"""媒体工具的基准测试。
+
+用 ffmpeg 的 lavfi 源（testsrc 画面 + sine 正弦音）在本地生成不同时长、
+不同分辨率的合成素材，结果可复现，不依赖仓库里的样例视频。然后分别以
+单文件和批量模式计时各个工具，记录耗时、吞吐量、子进程数量、子进程 CPU
+时间和峰值内存，输出为 JSON，便于发现性能回退、对比新旧实现。
+
+子进程的 CPU 时间和峰值内存取自 tracing 用 wait4 记录的逐个子进程资源用量，
+是每个用例自己的数值；清理输出目录在计时之外进行；工具返回 False、抛出异常
+或没有生成预期的输出文件时，该用例记为错误而不是成功。
+
+工具自己的磁盘缓存（audio_fit、prepare_audio、场景分析）都指向本次的临时目录，
+冷启动模式下每次运行前连同内存缓存一起清空，不会用到或污染当前目录下的 ./tmp。
+
+--imports 模式不跑媒体用例，而是在全新的解释器里用 ``python -X importtime``
+逐个导入各模块，记录导入耗时和最重的直接依赖，用来发现拖慢命令行启动的导入。
+
+用法:
+    python benchmark.py -o bench.json
+    python benchmark.py --durations 5 30 --resolutions 640x360 1920x1080 --repeat 5
+    python benchmark.py --imports                    # main.py 中所有子命令对应的模块
+    python benchmark.py --imports pipline backends --repeat 5
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import media_probe
+import tracing
+
+# 被测工具的磁盘缓存目录对应的环境变量，基准测试时都指向临时目录下的同名子目录
+TOOL_CACHE_ENV = ('AUDIO_FIT_CACHE', 'ENCODE_AUDIO_CACHE', 'SCENE_CACHE')
+
+
+def _ffmpeg_version():
+    try:
+        output = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True, check=True).stdout
+        return output.splitlines()[0] if output else None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def make_video(path, duration, size, fps=30):
+    """生成带正弦音轨的测试视频（testsrc 画面，每 2 秒一个关键帧）"""
+    cmd = [
+        'ffmpeg', '-y', '-v', 'error',
+        '-f', 'lavfi', '-i', f"testsrc=size={size}:rate={fps}:duration={duration}",
+        '-f', 'lavfi', '-i', f"sine=frequency=440:sample_rate=44100:duration={duration}",
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-g', str(fps * 2), '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac', '-shortest',
+        str(path)
+    ]
+    subprocess.run(cmd, check=True, stdin=subprocess.DEVNULL)
+    return path
+
+
+def make_audio(path, duration, frequency=440):
+    """生成正弦波测试音频"""
+    cmd = [
+        'ffmpeg', '-y', '-v', 'error',
+        '-f', 'lavfi', '-i', f"sine=frequency={frequency}:sample_rate=44100:duration={duration}",
+        '-ac', '2',
+        str(path)
+    ]
+    subprocess.run(cmd, check=True, stdin=subprocess.DEVNULL)
+    return path
+
+
+def make_synthetic_media(work_dir, durations, resolutions, batch_size):
+    """按 时长 x 分辨率 生成测试素材，每种组合 batch_size 个视频，另外生成若干音频"""
+    media = {'videos': {}, 'audio': []}
+    for duration in durations:
+        for size in resolutions:
+            key = f"{size}_{duration}s"
+            media['videos'][key] = [
+                make_video(work_dir / f"{key}_{i}.mp4", duration, size) for i in range(batch_size)
+            ]
+    for i, duration in enumerate(sorted(set(durations))):
+        media['audio'].append(make_audio(work_dir / f"sine_{duration}s.mp3", max(duration / 3, 1), 220 * (i + 1)))
+    return media
+
+
+class SubprocessCounter:
+    """统计代码块内直接用 subprocess.Popen 启动的子进程数量。
+
+    subprocess.run 内部也是用模块全局的 Popen，所以只需临时替换 subprocess.Popen；
+    开启追踪时 tracing.run 使用自己的 Popen 子类，那部分子进程由 span 统计。
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._original = None
+
+    def __enter__(self):
+        counter = self
+        self._original = original = subprocess.Popen
+
+        class CountingPopen(original):
+            def __init__(self, *args, **kwargs):
+                counter.count += 1
+                super().__init__(*args, **kwargs)
+
+        subprocess.Popen = CountingPopen
+        return self
+
+    def __exit__(self, *exc):
+        subprocess.Popen = self._original
+
+
+@contextlib.contextmanager
+def silenced():
+    """把本进程和子进程写到 stdout/stderr 的输出都丢弃，避免 ffmpeg 日志干扰计时输出"""
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = os.dup(1), os.dup(2)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    try:
+        os.dup2(devnull, 1)
+        os.dup2(devnull, 2)
+        yield
+    finally:
+        os.dup2(saved[0], 1)
+        os.dup2(saved[1], 2)
+        for fd in (*saved, devnull):
+            os.close(fd)
+
+
+def _subprocess_usage(spans):
+    """汇总 tracing 记录的子进程 span：数量、CPU 时间之和、单个子进程的最大峰值内存"""
+    children = [s for s in spans if s.kind == "subprocess"]
+    cpu = sum(s.attributes.get("cpu_user_s", 0) + s.attributes.get("cpu_system_s", 0) for s in children)
+    peak = max((s.attributes.get("max_rss_kb", 0) for s in children), default=0)
+    return len(children), cpu, peak
+
+
+def _check_outputs(outputs):
+    missing = [str(p) for p in outputs if not os.path.exists(p) or os.path.getsize(p) == 0]
+    if missing:
+        raise Exception(f"未生成输出文件: {', '.join(missing)}")
+
+
+def _clear_caches(cache_dir):
+    """清空探测、场景分析的内存缓存，以及 cache_dir 下工具的磁盘缓存"""
+    media_probe.clear_cache()
+    scene_analysis = sys.modules.get('scene_analysis')
+    if scene_analysis is not None:
+        scene_analysis.clear_cache()
+    if cache_dir is not None:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def measure(name, func, inputs, repeat, cold=True, setup=None, outputs=(), cache_dir=None):
+    """
+    重复运行 func 并统计
+
+    Args:
+        name: 用例名称
+        func: 无参可调用对象，返回 False 或抛出异常表示失败
+        inputs: 本用例处理的输入文件列表，用于计算吞吐量
+        repeat: 重复次数
+        cold: 每次运行前清空内存缓存和 cache_dir，测量包含探测、音频编码在内的完整开销
+        cache_dir: 工具磁盘缓存所在目录（见 TOOL_CACHE_ENV），冷启动时清空
+        setup: 每次运行前调用（不计时），例如清空输出目录
+        outputs: 每次运行后必须存在且非空的输出文件
+    """
+    input_bytes = sum(os.path.getsize(p) for p in inputs)
+    walls, cpus, spawns, peaks = [], [], [], []
+    error = None
+    traced = tracing.enabled()
+    tracing.enable(True)
+    try:
+        for _ in range(repeat):
+            if setup is not None:
+                setup()
+            if cold:
+                _clear_caches(cache_dir)
+            tracing.clear()
+            with SubprocessCounter() as counter, silenced():
+                start = time.perf_counter()
+                try:
+                    if func() is False:
+                        error = "返回 False"
+                except Exception as e:
+                    error = str(e)
+                wall = time.perf_counter() - start
+            if error is None:
+                try:
+                    _check_outputs(outputs)
+                except Exception as e:
+                    error = str(e)
+            # tracing.run 启动的子进程由 span 统计，直接用 Popen 启动的（如流式拼接）由 counter 统计
+            count, cpu, peak = _subprocess_usage(tracing.spans())
+            walls.append(wall)
+            cpus.append(cpu)
+            spawns.append(count + counter.count)
+            peaks.append(peak)
+            if error:
+                break
+    finally:
+        tracing.clear()
+        tracing.enable(traced)
+
+    median = statistics.median(walls)
+    result = {
+        'name': name,
+        'files': len(inputs),
+        'input_mb': round(input_bytes / 1024 / 1024, 3),
+        'repeat': len(walls),
+        'wall_seconds': {'min': min(walls), 'median': median, 'max': max(walls)},
+        'children_cpu_seconds': statistics.median(cpus),
+        'subprocesses': max(spawns),
+        'files_per_second': len(inputs) / median if median else None,
+        'mb_per_second': input_bytes / 1024 / 1024 / median if median else None,
+        # 本用例中单个子进程的最大峰值内存（ru_maxrss，Linux 上单位为 KB）
+        'children_peak_rss_kb': max(peaks),
+    }
+    if error:
+        result['error'] = error
+    print(f"{name:<48} {median * 1000:9.1f} ms  {result['subprocesses']:3d} 个子进程"
+          + (f"  错误: {error}" if error else ""))
+    return result
+
+
+def _batch_ok(result):
+    """trim_videos 返回 (results, summary)，有失败的文件时视为失败"""
+    _, summary = result
+    if summary['failed']:
+        raise Exception(f"{summary['failed']} 个文件处理失败")
+    return result
+
+
+def _cases_for(key, videos, audio, out_dir):
+    """一种 分辨率 x 时长 素材对应的用例（单独成函数，闭包绑定本组素材）"""
+    from extract_last_frame import extract_last_frame, extract_last_frames
+    from merge_video_audio import merge_video_audio
+    from timeline_render import render
+    from trim_video import trim_video, trim_videos
+    from video_concat import concat_stream, concat_videos
+
+    video = videos[0]
+    n = len(videos)
+
+    def out(name):
+        return str(out_dir / f"{key}_{name}")
+
+    trim_batch_dir = out_dir / f"{key}_trim_batch"
+    frames_dir = out_dir / f"{key}_frames"
+    # 工具都以静默模式调用：出错时抛异常（或返回 False），而不是只打印
+    cases = [
+        (f"trim_video[copy] {key}",
+         lambda: trim_video(str(video), out("trim_copy.mp4"), 1, quiet=True, mode='copy'),
+         [video], [out("trim_copy.mp4")]),
+        (f"trim_video[smart] {key}",
+         lambda: trim_video(str(video), out("trim_smart.mp4"), 1, quiet=True, mode='smart'),
+         [video], [out("trim_smart.mp4")]),
+        (f"trim_videos[batch x{n}] {key}",
+         lambda: _batch_ok(trim_videos(videos, trim_batch_dir, 1, force=True)),
+         videos, [trim_batch_dir / f"trimmed_{v.name}" for v in videos]),
+        (f"concat_videos[x{n}] {key}",
+         lambda: concat_videos(output_file=out("concat.mp4"), files=[str(v) for v in videos], quiet=True),
+         videos, [out("concat.mp4")]),
+        (f"concat_stream[x{n}] {key}",
+         lambda: concat_stream(videos, out("concat_stream.mp4")),
+         videos, [out("concat_stream.mp4")]),
+        (f"merge_video_audio {key}",
+         lambda: merge_video_audio(str(video), str(audio), out("merge.mp4"), quiet=True),
+         [video, audio], [out("merge.mp4")]),
+        (f"timeline_render[concat+music x{n}] {key}",
+         lambda: render({'clips': [{'path': str(v)} for v in videos],
+                         'audio': [{'path': str(audio), 'loop': True}]}, out("timeline.mp4")),
+         videos + [audio], [out("timeline.mp4")]),
+        (f"extract_last_frame {key}",
+         lambda: extract_last_frame(video, out("last.png"), verbose=False),
+         [video], [out("last.png")]),
+        (f"extract_last_frames[batch x{n}] {key}",
+         lambda: extract_last_frames(videos, frames_dir),
+         videos, [frames_dir / f"{v.stem}_last_frame.png" for v in videos]),
+    ]
+    return cases
+
+
+def build_cases(media, out_dir):
+    """返回 (用例名, 可调用对象, 输入文件列表, 预期输出文件列表) 列表"""
+    from audio_concat import concat_audio_files
+
+    cases = []
+    for key, videos in media['videos'].items():
+        cases += _cases_for(key, videos, media['audio'][0], out_dir)
+
+    audio_files = media['audio']
+    audio_out = out_dir / "audio_concat.mp3"
+    # concat_audio_files 失败时返回 None
+    cases.append((f"concat_audio_files[x{len(audio_files)}]",
+                  lambda: concat_audio_files([str(a) for a in audio_files], str(audio_out)) is not None,
+                  audio_files, [audio_out]))
+    return cases
+
+
+def _parse_importtime(stderr):
+    """解析 -X importtime 输出，返回 [(自身微秒, 累计微秒, 层级, 模块名)]"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        # 格式为 "| " + 每层两个空格的缩进 + 模块名
+        name = name[1:]
+        level = (len(name) - len(name.lstrip(' '))) // 2
+        entries.append((int(self_us), int(cumulative_us), level, name.strip()))
+    return entries
+
+
+def measure_import(module, repeat):
+    """
+    在全新的解释器中导入 module，重复 repeat 次取最小值
+
+    Returns:
+        导入耗时（毫秒）、解释器总耗时，以及 module 最重的几个直接依赖
+    """
+    cwd = Path(__file__).resolve().parent
+    cumulative, walls, deps, error = [], [], [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+                              cwd=cwd, capture_output=True, text=True, stdin=subprocess.DEVNULL)
+        walls.append(time.perf_counter() - start)
+        if proc.returncode != 0:
+            lines = proc.stderr.strip().splitlines()
+            error = lines[-1] if lines else f"退出码 {proc.returncode}"
+            break
+        entries = _parse_importtime(proc.stderr)
+        index = next(i for i in range(len(entries) - 1, -1, -1) if entries[i][2] == 0 and entries[i][3] == module)
+        cumulative.append(entries[index][1])
+        # 直接依赖是紧挨在它前面、层级为 1 的条目（子模块先于父模块输出）
+        deps = []
+        for self_us, cum_us, level, name in reversed(entries[:index]):
+            if level == 0:
+                break
+            if level == 1:
+                deps.append((name, cum_us))
+
+    result = {
+        'module': module,
+        'repeat': len(walls),
+        'interpreter_seconds': min(walls),
+    }
+    if cumulative:
+        result['import_ms'] = min(cumulative) / 1000
+        result['heaviest_imports'] = [
+            {'module': name, 'ms': cum_us / 1000} for name, cum_us in sorted(deps, key=lambda d: -d[1])[:5]
+        ]
+    if error:
+        result['error'] = error
+    heaviest = ', '.join(f"{d['module']} {d['ms']:.1f}" for d in result.get('heaviest_imports', [])[:3])
+    print(f"import {module:<24} {result.get('import_ms', float('nan')):9.1f} ms  "
+          + (f"错误: {error}" if error else heaviest))
+    return result
+
+
+def _clean_outputs(out_dir):
+    """每个用例前清空输出目录，避免 ffmpeg 因输出已存在而等待确认"""
+    shutil.rmtree(out_dir, ignore_errors=True)
+    out_dir.mkdir(parents=True)
+
+
+def _write_report(args, results):
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'ffmpeg': _ffmpeg_version(),
+        },
+        'config': vars(args),
+        'results': results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(text, encoding='utf-8')
+        print(f"结果已写入 {args.output}")
+    else:
+        print(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='媒体工具基准测试')
+    parser.add_argument('--durations', type=float, nargs='+', default=[5, 20], help='测试视频时长（秒）')
+    parser.add_argument('--resolutions', nargs='+', default=['640x360', '1280x720'], help='测试视频分辨率')
+    parser.add_argument('--batch-size', type=int, default=4, help='批量用例中每种素材的文件数')
+    parser.add_argument('--repeat', type=int, default=3, help='每个用例的重复次数')
+    parser.add_argument('--filter', help='只运行名称包含该字符串的用例')
+    parser.add_argument('--warm', action='store_true', help='重复运行之间保留探测、音频适配等缓存')
+    parser.add_argument('--keep', action='store_true', help='保留生成的素材和输出目录')
+    parser.add_argument('-o', '--output', help='结果 JSON 输出路径（默认打印到终端）')
+    parser.add_argument('--imports', nargs='*', metavar='MODULE',
+                        help='只测量模块导入耗时（-X importtime），不指定模块时测量 main.py 中的所有子命令模块')
+    args = parser.parse_args()
+
+    if args.imports is not None:
+        from main import COMMANDS
+
+        modules = args.imports or [module for module, _ in COMMANDS.values()]
+        _write_report(args, [measure_import(module, args.repeat) for module in modules])
+        return
+
+    work_dir = Path(tempfile.mkdtemp(prefix='bench_'))
+    out_dir = work_dir / 'out'
+    cache_dir = work_dir / 'cache'
+    for var in TOOL_CACHE_ENV:
+        os.environ[var] = str(cache_dir / var.lower())
+    try:
+        print(f"生成测试素材到 {work_dir} ...")
+        media = make_synthetic_media(work_dir, args.durations, args.resolutions, args.batch_size)
+
+        results = []
+        for name, func, inputs, outputs in build_cases(media, out_dir):
+            if args.filter and args.filter not in name:
+                continue
+            results.append(measure(name, func, inputs, args.repeat, cold=not args.warm,
+                                   setup=lambda: _clean_outputs(out_dir), outputs=outputs, cache_dir=cache_dir))
+
+        _write_report(args, results)
+    finally:
+        if args.keep:
+            print(f"素材和输出保留在 {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""命名的编码参数档位。
+
+需要重编码的地方（合并音视频、时间线渲染、智能裁剪的边界 GOP、整体重编码裁剪）
+统一从这里取参数，不再各自写死或依赖 ffmpeg 默认值：
+
+    fast-preview  预览用，ultrafast + 高 CRF，CPU 开销最小
+    delivery      交付用，veryfast + CRF 20，速度和体积的折中（默认）
+    archive       存档用，slow + 低 CRF，体积更小、画质更高，CPU 开销最大
+
+所有档位都使用显式的线程数（默认等于 CPU 核数，可用 ENCODE_THREADS 覆盖；
+批量并发时由调用方按并发数分摊），输出 MP4 都带 +faststart。
+
+音频：输入已经是 AAC 时直接流复制；否则按档位编码一次并缓存（按文件内容
+和音频参数命名，默认在 ./tmp/audio_cache，可用 ENCODE_AUDIO_CACHE 修改），
+同一音轨再次合并时直接复用。
+"""
+import os
+import subprocess
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, TypedDict
+
+import media_probe
+import tracing
+
+
+class EncodingProfile(TypedDict):
+    preset: str        # x264/x265 preset
+    crf: int
+    pix_fmt: str
+    audio_bitrate: str
+    faststart: bool
+
+
+PROFILES: Dict[str, EncodingProfile] = {
+    "fast-preview": EncodingProfile(preset="ultrafast", crf=28, pix_fmt="yuv420p", audio_bitrate="96k", faststart=True),
+    "delivery": EncodingProfile(preset="veryfast", crf=20, pix_fmt="yuv420p", audio_bitrate="192k", faststart=True),
+    "archive": EncodingProfile(preset="slow", crf=16, pix_fmt="yuv420p", audio_bitrate="256k", faststart=True),
+}
+DEFAULT_PROFILE = "delivery"
+
+# 可以直接放进 MP4 的音频编码，输入是这些编码时流复制
+PASSTHROUGH_AUDIO_CODECS = ("aac",)
+
+_audio_locks: Dict[str, threading.Lock] = {}
+_audio_locks_guard = threading.Lock()
+
+
+def get_profile(name: Optional[str]) -> EncodingProfile:
+    name = name or DEFAULT_PROFILE
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(f"未知的编码档位: {name}，可选: {', '.join(PROFILES)}")
+
+
+def default_threads() -> int:
+    return int(os.getenv("ENCODE_THREADS", 0)) or os.cpu_count() or 1
+
+
+def video_args(profile=None, encoder="libx264", threads=None, pix_fmt=None) -> List[str]:
+    """视频编码参数
+
+    Args:
+        profile: 档位名
+        encoder: libx264 或 libx265
+        threads: 编码线程数，默认 default_threads()
+        pix_fmt: 覆盖档位的像素格式（例如与源视频保持一致）
+    """
+    p = get_profile(profile)
+    return [
+        "-c:v", encoder,
+        "-preset", p["preset"],
+        "-crf", str(p["crf"]),
+        "-pix_fmt", pix_fmt or p["pix_fmt"],
+        "-threads", str(threads or default_threads()),
+    ]
+
+
+def audio_args(profile=None) -> List[str]:
+    return ["-c:a", "aac", "-b:a", get_profile(profile)["audio_bitrate"]]
+
+
+def container_args(profile=None) -> List[str]:
+    return ["-movflags", "+faststart"] if get_profile(profile)["faststart"] else []
+
+
+def audio_cache_dir() -> Path:
+    return Path(os.getenv("ENCODE_AUDIO_CACHE", "./tmp/audio_cache"))
+
+
+def prepare_audio(audio_path, profile=None) -> str:
+    """
+    返回可以直接以 -c:a copy 放进 MP4 的音频文件
+
+    输入已经是 AAC 时原样返回；否则按档位编码成 AAC（.m4a），结果按
+    （文件内容, 码率）缓存，同一音轨只编码一次。
+    """
+    record = media_probe.probe(audio_path)
+    stream = media_probe.first_stream(record, "audio")
+    if stream is None:
+        raise ValueError(f"文件中没有音频流: {audio_path}")
+    if stream["codec_name"] in PASSTHROUGH_AUDIO_CODECS:
+        return str(audio_path)
+
+    from result_cache import file_digest
+
+    bitrate = get_profile(profile)["audio_bitrate"]
+    cache_dir = audio_cache_dir()
+    out_path = cache_dir / f"{file_digest(audio_path)[:32]}-aac-{bitrate}.m4a"
+    if out_path.exists():
+        return str(out_path)
+
+    with _audio_locks_guard:
+        lock = _audio_locks.setdefault(str(out_path), threading.Lock())
+    # 同一音轨并发合并时只编码一次
+    with lock:
+        if not out_path.exists():
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = out_path.with_name(f".{out_path.stem}.{threading.get_ident()}.m4a")
+            cmd = [
+                "ffmpeg", "-y", "-v", "error",
+                "-i", str(audio_path),
+                "-map", "0:a:0", "-vn",
+                *audio_args(profile),
+                str(tmp_path),
+            ]
+            try:
+                result = tracing.run(cmd, capture_output=True, stdin=subprocess.DEVNULL)
+                if result.returncode != 0:
+                    raise Exception(f"音频编码失败: {result.stderr.decode(errors='replace')}")
+                os.replace(tmp_path, out_path)
+            finally:
+                if tmp_path.exists():
+                    tmp_path.unlink()
+    return str(out_path)
@@ -1,44 +1,71 @@
 #!/usr/bin/env python3
 import os
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-import json
 import argparse
 
+import media_probe
+import tracing
+
 def get_video_duration(video_path):
     """
-    获取视频的总时长（秒）
+    获取视频的总时长（秒），结果由 media_probe 按文件缓存
     
     Args:
         video_path: 视频文件路径
     Returns:
         float: 视频时长（秒）
     """
-    cmd = [
-        'ffprobe',
-        '-v', 'quiet',
-        '-print_format', 'json',
-        '-show_format',
-        str(video_path)
-    ]
-    
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        data = json.loads(result.stdout)
-        duration = float(data['format']['duration'])
-        return duration
-    except subprocess.CalledProcessError as e:
+        return media_probe.get_duration(video_path)
+    except Exception as e:
         raise Exception(f"获取视频时长失败: {str(e)}")
-    except (KeyError, json.JSONDecodeError) as e:
-        raise Exception(f"解析视频信息失败: {str(e)}")
 
-def extract_last_frame(video_path, output_path=None):
+# 从文件末尾往前多少秒开始输出帧。-sseof 借助容器索引直接跳到该位置之前的
+# 最后一个关键帧，只解码末尾的 GOP，且只有最后这一小段的帧会被编码成图片
+LAST_FRAME_WINDOW = 0.5
+
+def tail_seek_args(window=LAST_FRAME_WINDOW, accurate=True):
+    """
+    返回定位到视频末尾的 ffmpeg 输入参数
+
+    Args:
+        window: 从末尾往前的秒数；超过视频时长时 ffmpeg 会忽略定位，从头解码
+        accurate: 为 False 时不丢弃关键帧到定位点之间的帧，
+                  用于最后一帧早于窗口起点的可变帧率视频
+    """
+    args = ['-sseof', f"-{window}"]
+    if not accurate:
+        args.insert(0, '-noaccurate_seek')
+    return args
+
+def _write_last_frame(video_path, output_path, seek_args):
+    cmd = [
+        'ffmpeg',
+        '-y',  # 覆盖已存在的文件
+        '-v', 'error',
+        *seek_args,
+        '-i', str(video_path),
+        '-map', '0:v:0',
+        '-fps_mode', 'passthrough',
+        '-update', '1',  # 每一帧都覆盖写同一张图片，最终留下的就是最后一帧
+        str(output_path)
+    ]
+    tracing.run(cmd, check=True, capture_output=True, stdin=subprocess.DEVNULL)
+    return output_path.exists()
+
+def extract_last_frame(video_path, output_path=None, verbose=True):
     """
     提取视频的最后一帧
+
+    只启动一个 ffmpeg 进程：用 -sseof 从文件末尾定位，不需要先用 ffprobe 获取时长，
+    对短视频和可变帧率视频同样有效。
     
     Args:
         video_path: 视频文件路径
         output_path: 输出图片路径，如果不指定则在同目录下创建
+        verbose: 是否打印处理结果
     Returns:
         str: 输出图片的路径
     """
@@ -51,26 +78,19 @@ def extract_last_frame(video_path, output_path=None):
         output_path = Path(output_path)
     
     try:
-        # 获取视频时长
-        duration = get_video_duration(video_path)
-        
-        # 构建 ffmpeg 命令（输出PNG格式，无需-q:v参数）
-        cmd = [
-            'ffmpeg',
-            '-y',  # 覆盖已存在的文件
-            '-ss', str(duration - 0.1),  # 定位到最后 0.1 秒
-            '-i', str(video_path),
-            '-vframes', '1',  # 只提取一帧
-            str(output_path)
-        ]
-        
-        # 执行命令
-        subprocess.run(cmd, check=True, capture_output=True)
+        # 先删除旧文件，用是否生成了新文件判断是否取到了帧
+        output_path.unlink(missing_ok=True)
+
+        if not _write_last_frame(video_path, output_path, tail_seek_args()):
+            # 末尾窗口内没有帧（可变帧率视频最后一帧持续时间较长），
+            # 改为输出最后一个 GOP 的全部帧
+            if not _write_last_frame(video_path, output_path, tail_seek_args(accurate=False)):
+                raise Exception(f"视频 {video_path} 中没有可提取的帧")
         
-        print(f"✓ 成功提取最后一帧:")
-        print(f"  - 输入视频: {video_path}")
-        print(f"  - 视频时长: {duration:.2f} 秒")
-        print(f"  - 输出图片: {output_path}")
+        if verbose:
+            print(f"✓ 成功提取最后一帧:")
+            print(f"  - 输入视频: {video_path}")
+            print(f"  - 输出图片: {output_path}")
         
         return str(output_path)
         
@@ -79,22 +99,57 @@ def extract_last_frame(video_path, output_path=None):
     except Exception as e:
         raise Exception(f"处理过程出错: {str(e)}")
 
+def extract_last_frames(video_paths, output_dir=None, max_workers=None):
+    """
+    批量并发提取多个视频的最后一帧
+
+    用于多段续写生成：每一段视频的最后一帧作为下一段的首帧输入。
+    
+    Args:
+        video_paths: 视频文件路径列表（按段落顺序）
+        output_dir: 输出目录，不指定时每张图片放在对应视频同目录下
+        max_workers: 并发的 ffmpeg 进程数，默认 CPU 核数
+    Returns:
+        list: 与 video_paths 顺序一致的图片路径列表
+    """
+    def output_for(video_path):
+        if output_dir is None:
+            return None
+        return Path(output_dir) / f"{Path(video_path).stem}_last_frame.png"
+
+    if output_dir is not None:
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+        return list(pool.map(
+            lambda p: extract_last_frame(p, output_for(p), verbose=False), video_paths
+        ))
+
 def main():
     # 创建命令行参数解析器
     parser = argparse.ArgumentParser(description='提取视频最后一帧')
-    parser.add_argument('video_path', help='输入视频的路径')
-    parser.add_argument('-o', '--output', help='输出图片的路径（可选）')
+    parser.add_argument('video_paths', nargs='+', help='输入视频的路径（可以多个）')
+    parser.add_argument('-o', '--output', help='输出图片的路径（仅单个视频时可用）')
+    parser.add_argument('-d', '--output-dir', help='批量提取时的输出目录')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='批量提取的并发数')
     
     # 解析命令行参数
     args = parser.parse_args()
     
     try:
         # 确认输入视频存在
-        if not Path(args.video_path).exists():
-            raise FileNotFoundError(f"找不到视频文件: {args.video_path}")
+        for video_path in args.video_paths:
+            if not Path(video_path).exists():
+                raise FileNotFoundError(f"找不到视频文件: {video_path}")
             
         # 提取最后一帧
-        extract_last_frame(args.video_path, args.output)
+        if len(args.video_paths) == 1 and not args.output_dir:
+            extract_last_frame(args.video_paths[0], args.output)
+        else:
+            if args.output:
+                raise ValueError("批量提取时请使用 --output-dir 指定输出目录")
+            for video_path, frame_path in zip(args.video_paths, extract_last_frames(args.video_paths, args.output_dir, args.jobs)):
+                print(f"{video_path} -> {frame_path}")
         
     except Exception as e:
         print(f"错误: {str(e)}")
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""从视频中直接读取原始帧到内存。
+
+ffmpeg 以 rawvideo 格式把帧写到 stdout，这里按帧大小逐帧读入独立的缓冲区，
+再零拷贝地包装成 NumPy 数组（安装了 numpy 时）或多维 memoryview，
+省掉 PNG 编码、写盘、再读回解码的开销。
+
+支持首帧、末帧、第 N 帧、每隔 k 帧，以及多个视频的批量提取。
+"""
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import media_probe
+from extract_last_frame import tail_seek_args
+
+try:
+    import numpy as np
+except ImportError:  # numpy 为可选依赖，缺失时返回 memoryview
+    np = None
+
+PIX_FMT_CHANNELS = {
+    'rgb24': 3,
+    'bgr24': 3,
+    'rgba': 4,
+    'bgra': 4,
+    'gray': 1,
+}
+
+
+def _frame_shape(video_path, size, pix_fmt):
+    if pix_fmt not in PIX_FMT_CHANNELS:
+        raise ValueError(f"不支持的像素格式: {pix_fmt}，可选: {', '.join(PIX_FMT_CHANNELS)}")
+    if size:
+        width, height = size
+    else:
+        stream = media_probe.first_stream(media_probe.probe(video_path), 'video')
+        if stream is None:
+            raise Exception(f"视频 {video_path} 中没有视频流")
+        width, height = stream['width'], stream['height']
+    return height, width, PIX_FMT_CHANNELS[pix_fmt]
+
+
+def _wrap(buf, shape, as_array):
+    if as_array and np is not None:
+        # frombuffer 与 bytearray 共享内存，不发生拷贝
+        return np.frombuffer(buf, dtype=np.uint8).reshape(shape)
+    return memoryview(buf).cast('B', shape)
+
+
+def iter_frames(video_path, input_args=(), filters=(), size=None, pix_fmt='rgb24', max_frames=None, as_array=True):
+    """
+    逐帧读取视频，返回生成器
+
+    Args:
+        video_path: 视频文件路径
+        input_args: 放在 -i 之前的 ffmpeg 输入参数（如 -ss、-sseof）
+        filters: 额外的视频滤镜列表（如 select 表达式）
+        size: (宽, 高)，指定时缩放到该尺寸，否则使用源尺寸
+        pix_fmt: 输出像素格式，rgb24/bgr24/rgba/bgra/gray
+        max_frames: 最多读取的帧数
+        as_array: 为 True 且安装了 numpy 时返回 ndarray，否则返回 memoryview
+    Yields:
+        形状为 (高, 宽, 通道) 的帧
+    """
+    shape = _frame_shape(video_path, size, pix_fmt)
+    frame_bytes = shape[0] * shape[1] * shape[2]
+
+    vf = list(filters)
+    if size:
+        vf.append(f"scale={size[0]}:{size[1]}")
+
+    cmd = [
+        'ffmpeg', '-v', 'error',
+        # 不自动旋转，保证输出尺寸与探测到的编码尺寸一致
+        '-noautorotate',
+        *input_args,
+        '-i', str(video_path),
+        '-map', '0:v:0',
+    ]
+    if vf:
+        cmd += ['-vf', ','.join(vf), '-fps_mode', 'passthrough']
+    if max_frames:
+        cmd += ['-frames:v', str(max_frames)]
+    cmd += ['-f', 'rawvideo', '-pix_fmt', pix_fmt, 'pipe:1']
+
+    process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        while True:
+            buf = bytearray(frame_bytes)
+            view = memoryview(buf)
+            read = 0
+            while read < frame_bytes:
+                n = process.stdout.readinto(view[read:])
+                if not n:
+                    break
+                read += n
+            if read < frame_bytes:
+                break
+            yield _wrap(buf, shape, as_array)
+
+        # 读到结尾才检查退出码；调用方提前停止迭代时 ffmpeg 会被直接终止
+        stderr = process.stderr.read().decode(errors='replace')
+        if process.wait() != 0:
+            raise Exception(f"读取视频帧失败: {video_path}: {stderr.strip()}")
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.stdout.close()
+        process.stderr.close()
+        process.wait()
+
+
+def first_frame(video_path, **kwargs):
+    """读取第一帧"""
+    for frame in iter_frames(video_path, max_frames=1, **kwargs):
+        return frame
+    raise Exception(f"视频 {video_path} 中没有可读取的帧")
+
+
+def nth_frame(video_path, n, **kwargs):
+    """读取第 n 帧（从 0 开始计数）"""
+    for frame in iter_frames(video_path, filters=[f"select=eq(n\\,{int(n)})"], max_frames=1, **kwargs):
+        return frame
+    raise Exception(f"视频 {video_path} 中不存在第 {n} 帧")
+
+
+def every_kth_frame(video_path, k, max_frames=None, **kwargs):
+    """每隔 k 帧读取一帧（第 0、k、2k... 帧），返回列表"""
+    return list(iter_frames(video_path, filters=[f"select=not(mod(n\\,{int(k)}))"], max_frames=max_frames, **kwargs))
+
+
+def last_frame(video_path, **kwargs):
+    """读取最后一帧，只解码文件末尾的 GOP"""
+    frame = None
+    for accurate in (True, False):
+        for frame in iter_frames(video_path, input_args=tail_seek_args(accurate=accurate), **kwargs):
+            pass
+        if frame is not None:
+            return frame
+    raise Exception(f"视频 {video_path} 中没有可读取的帧")
+
+
+FRAME_READERS = {
+    'first': first_frame,
+    'last': last_frame,
+}
+
+
+def read_frames_batch(video_paths, which='first', max_workers=None, **kwargs):
+    """
+    批量从多个视频中读取帧，返回与 video_paths 顺序一致的列表
+
+    Args:
+        video_paths: 视频路径列表
+        which: 'first'、'last'，或整数表示第 N 帧
+        max_workers: 并发的 ffmpeg 进程数
+    """
+    if isinstance(which, int):
+        reader = lambda path: nth_frame(path, which, **kwargs)
+    elif which in FRAME_READERS:
+        reader = lambda path: FRAME_READERS[which](path, **kwargs)
+    else:
+        raise ValueError(f"未知的帧位置: {which}")
+
+    media_probe.probe_many(video_paths)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(reader, video_paths))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='从视频读取原始帧并打印尺寸信息')
+    parser.add_argument('video_paths', nargs='+', help='输入视频路径')
+    parser.add_argument('--which', default='first', help='first、last 或帧序号')
+    parser.add_argument('--size', help='缩放尺寸，如 224x224')
+    parser.add_argument('--pix-fmt', default='rgb24', choices=sorted(PIX_FMT_CHANNELS))
+    args = parser.parse_args()
+
+    which = int(args.which) if args.which.isdigit() else args.which
+    size = tuple(int(v) for v in args.size.split('x')) if args.size else None
+    frames = read_frames_batch(args.video_paths, which, size=size, pix_fmt=args.pix_fmt)
+    for path, frame in zip(args.video_paths, frames):
+        print(f"{path}: shape={tuple(frame.shape)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""进程内共享的 gradio Client 池。
+
+构造 ``gradio_client.Client`` 要拉取 Space 的配置并完成握手，每次调用都新建
+一个会让每个请求多花几秒。这里按 Space 维护一个小型客户端池：
+
+- 懒加载：第一次使用时才创建客户端，也可以调用 warm_up() 在后台预先创建
+- 负载均衡：每次取当前在途任务最少的客户端，一个客户端可以同时提交多个任务
+- 健康检查：客户端空闲超过 health_interval 秒后，使用前先请求一次 Space 地址确认可用
+- 重连：健康检查失败或调用出现连接类错误时丢弃该客户端，下次使用时重新创建
+
+环境变量：
+    GRADIO_POOL_SIZE         每个 Space 的客户端数（默认 2）
+    GRADIO_JOBS_PER_CLIENT   每个客户端同时在途的任务数（默认 2）
+    GRADIO_HEALTH_INTERVAL   健康检查间隔（秒，默认 300）
+"""
+from __future__ import annotations
+
+import contextlib
+import functools
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+# 出现这些错误时认为连接已不可用，丢弃客户端重连。任务等待超时（TimeoutError）
+# 不在其中：那只说明 Space 排队慢，客户端本身是好的，由调用方取消任务
+RECONNECT_ERRORS = (ConnectionError,)
+
+
+@functools.lru_cache(maxsize=None)
+def _reconnect_errors() -> tuple:
+    """RECONNECT_ERRORS 加上 httpx 的传输错误（gradio_client 通过 httpx 请求 Space，
+    它的异常不继承内置的连接错误）。用到客户端时 httpx 已经随 gradio_client 导入"""
+    try:
+        import httpx
+    except ImportError:
+        return RECONNECT_ERRORS
+    return RECONNECT_ERRORS + (httpx.TransportError,)
+
+
+class _Slot:
+    def __init__(self, jobs_per_client: int):
+        self.client = None
+        self.inflight = 0
+        self.last_ok = 0.0
+        self.lock = threading.Lock()
+        self.capacity = threading.Semaphore(jobs_per_client)
+
+
+class GradioClientPool:
+    """
+    Args:
+        space: HuggingFace Space 名称或 URL
+        size: 客户端数
+        jobs_per_client: 每个客户端同时在途的任务数
+        health_interval: 空闲多久后使用前做健康检查（秒）
+    """
+
+    def __init__(self, space: str, size: Optional[int] = None, jobs_per_client: Optional[int] = None,
+                 health_interval: Optional[float] = None):
+        self.space = space
+        size = size or int(os.getenv("GRADIO_POOL_SIZE", 2))
+        jobs_per_client = jobs_per_client or int(os.getenv("GRADIO_JOBS_PER_CLIENT", 2))
+        self.health_interval = health_interval or float(os.getenv("GRADIO_HEALTH_INTERVAL", 300))
+        self._slots: List[_Slot] = [_Slot(jobs_per_client) for _ in range(size)]
+        self._lock = threading.Lock()
+
+    def _create(self):
+        from gradio_client import Client
+        return Client(self.space, verbose=False)
+
+    def _healthy(self, client) -> bool:
+        """请求一次 Space 地址，能连上且不是 5xx 即视为可用"""
+        import http_client
+
+        try:
+            response = http_client.get(client.src, timeout=(5, 10))
+            return response.status_code < 500
+        except Exception:
+            return False
+
+    def _ensure(self, slot: _Slot):
+        with slot.lock:
+            if slot.client is not None and time.monotonic() - slot.last_ok > self.health_interval:
+                if not self._healthy(slot.client):
+                    slot.client = None
+            if slot.client is None:
+                slot.client = self._create()
+            slot.last_ok = time.monotonic()
+            return slot.client
+
+    def warm_up(self, background: bool = True):
+        """预先创建所有客户端（默认在后台线程中进行，不阻塞调用方）"""
+        def run():
+            for slot in self._slots:
+                try:
+                    self._ensure(slot)
+                except Exception as e:
+                    print(f"预热 gradio 客户端失败: {self.space}: {e}")
+        if background:
+            threading.Thread(target=run, name="gradio-warm-up", daemon=True).start()
+        else:
+            run()
+
+    @contextlib.contextmanager
+    def client(self):
+        """取一个客户端使用，出现连接类错误时丢弃它，下次使用时重连"""
+        with self._lock:
+            slot = min(self._slots, key=lambda s: s.inflight)
+            slot.inflight += 1
+        try:
+            with slot.capacity:
+                client = self._ensure(slot)
+                try:
+                    yield client
+                except Exception as e:
+                    if isinstance(e, _reconnect_errors()):
+                        with slot.lock:
+                            if slot.client is client:
+                                slot.client = None
+                    raise
+                else:
+                    slot.last_ok = time.monotonic()
+        finally:
+            with self._lock:
+                slot.inflight -= 1
+
+
+_pools: Dict[str, GradioClientPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(space: str) -> GradioClientPool:
+    """返回某个 Space 的进程内共享客户端池"""
+    with _pools_lock:
+        pool = _pools.get(space)
+        if pool is None:
+            pool = _pools[space] = GradioClientPool(space)
+        return pool
@@ -0,0 +1,164 @@
+"""进程内共享的 HTTP 连接池客户端。
+
+所有远程调用共用一个 requests.Session：连接保持长连接复用（省掉每次 TLS 握手），
+连接池大小和超时可配置，遇到 429/5xx 按指数退避自动重试，并遵守 Retry-After。
+POST 不是幂等的（生成接口按次计费），只在连接失败和 429/503 时重试。
+下载大文件时按块流式写入磁盘，不在内存中缓冲整张图片。
+
+环境变量：
+    HTTP_POOL_SIZE        每个主机的连接池大小（默认 16）
+    HTTP_CONNECT_TIMEOUT  连接超时秒数（默认 10）
+    HTTP_READ_TIMEOUT     读取超时秒数（默认 120）
+    HTTP_MAX_RETRIES      最大重试次数（默认 3）
+    HTTP_BACKOFF_FACTOR   退避系数（默认 0.5，即 0.5s、1s、2s...）
+"""
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# 服务端明确表示没有处理请求的状态码；500/502/504 时任务可能已经提交
+POST_RETRY_STATUSES = (429, 503)
+CHUNK_SIZE = 256 * 1024
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def default_timeout():
+    """返回 (连接超时, 读取超时)。"""
+    return (
+        float(os.getenv("HTTP_CONNECT_TIMEOUT", 10)),
+        float(os.getenv("HTTP_READ_TIMEOUT", 120)),
+    )
+
+
+class _Retry(Retry):
+    """GET/HEAD 按 RETRY_STATUSES 重试，POST 只按 POST_RETRY_STATUSES 重试。"""
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if method.upper() == "POST":
+            return status_code in POST_RETRY_STATUSES
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+def create_session(pool_size=None, max_retries=None, backoff_factor=None):
+    """创建一个带连接池和重试策略的 Session。"""
+    pool_size = pool_size or int(os.getenv("HTTP_POOL_SIZE", 16))
+    total = int(os.getenv("HTTP_MAX_RETRIES", 3)) if max_retries is None else max_retries
+    retry = _Retry(
+        total=total,
+        # 连接没建立起来时请求一定没发出去，任何方法都可以重试
+        connect=total,
+        backoff_factor=float(os.getenv("HTTP_BACKOFF_FACTOR", 0.5)) if backoff_factor is None else backoff_factor,
+        status_forcelist=RETRY_STATUSES,
+        # 读超时等发生在请求发出之后的错误只对幂等方法重试；POST 的状态码重试见 _Retry
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session():
+    """返回进程内共享的 Session，首次调用时创建。"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+
+def request(method, url, **kwargs):
+    """使用共享 Session 发送请求，未指定 timeout 时使用默认超时。"""
+    kwargs.setdefault("timeout", default_timeout())
+    return get_session().request(method, url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+class TokenBucket:
+    """线程安全的令牌桶限流器。
+
+    Args:
+        rate: 每秒补充的令牌数（即长期平均请求速率）
+        capacity: 桶容量，即允许的突发请求数，默认等于 max(rate, 1)
+    """
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError(f"速率必须为正数: {rate}")
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(rate, 1))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens=1):
+        """有足够令牌时取走并返回 True，否则立即返回 False。"""
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def wait_time(self, tokens=1):
+        """距离有足够令牌还需等待的秒数。"""
+        with self._lock:
+            self._refill()
+            return max(tokens - self._tokens, 0) / self.rate
+
+    def acquire(self, tokens=1):
+        """阻塞直到取得令牌。"""
+        while not self.try_acquire(tokens):
+            time.sleep(self.wait_time(tokens))
+
+
+def download(url, out_path, chunk_size=CHUNK_SIZE, **kwargs):
+    """
+    流式下载 url 到 out_path。
+
+    先写入同目录下的临时文件，完成后原子替换，失败时不会留下半个文件。
+    Returns:
+        输出文件路径
+    """
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with request("GET", url, stream=True, **kwargs) as response:
+        response.raise_for_status()
+        fd, tmp_path = tempfile.mkstemp(dir=out_path.parent, prefix=f".{out_path.name}.", suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+            os.replace(tmp_path, out_path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+    return out_path
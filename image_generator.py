@@ -1,49 +1,72 @@
+import argparse
 import json
 import os
-import dashscope
-import requests
-from dashscope import MultiModalConversation
-
-messages = [
-    {
-        "role": "user",
-        "content": [
-            {"text":  "宁静的森林景观，郁郁葱葱的绿色植物，参天大树和茂密的树叶，斑驳的阳光透过树冠，一条温柔的溪流蜿蜒穿过场景，河岸两旁生机勃勃的野花和蕨类植物，宁静而未受破坏的荒野，比较高视角"}
-        ]
-    }
-]
-
-# 若没有配置环境变量，请用百炼API Key将下行替换为：api_key="sk-xxx"
-api_key = 'sk-60b22327f9a7438b99245a48ac098f1b'
-
-response = MultiModalConversation.call(
-    api_key=api_key,
-    model="qwen-image",
-    messages=messages,
-    result_format='message',
-    stream=False,
-    watermark=True,
-    prompt_extend=True,
-    negative_prompt='',
-    size='1328*1328'
-)
-
-if response.status_code == 200:
+from pathlib import Path
+
+DEFAULT_PROMPT = "宁静的森林景观，郁郁葱葱的绿色植物，参天大树和茂密的树叶，斑驳的阳光透过树冠，一条温柔的溪流蜿蜒穿过场景，河岸两旁生机勃勃的野花和蕨类植物，宁静而未受破坏的荒野，比较高视角"
+
+
+def text_to_image(prompt, output_path='./temp/downloaded_image.png', size='1328*1328'):
+    """
+    调用 DashScope qwen-image 生成图片并下载到 output_path
+
+    API Key 从 DASHSCOPE_API_KEY 环境变量读取；dashscope 和 http_client
+    在调用时才导入，导入本模块不会发起任何请求。
+    Returns:
+        下载后的图片路径
+    """
+    api_key = os.getenv('DASHSCOPE_API_KEY')
+    if not api_key:
+        raise ValueError("请设置 DASHSCOPE_API_KEY 环境变量")
+
+    from dashscope import MultiModalConversation
+    import http_client
+
+    messages = [
+        {
+            "role": "user",
+            "content": [
+                {"text": prompt}
+            ]
+        }
+    ]
+    response = MultiModalConversation.call(
+        api_key=api_key,
+        model="qwen-image",
+        messages=messages,
+        result_format='message',
+        stream=False,
+        watermark=True,
+        prompt_extend=True,
+        negative_prompt='',
+        size=size
+    )
+
+    if response.status_code != 200:
+        raise Exception(f"HTTP返回码：{response.status_code}，错误码：{response.code}，错误信息：{response.message}"
+                        "（请参考文档：https://help.aliyun.com/zh/model-studio/developer-reference/error-code）")
+
     print(json.dumps(response, ensure_ascii=False))
     # 提取图片URL
     image_url = response['output']['choices'][0]['message']['content'][0]['image']
-    # 下载图片
-    response = requests.get(image_url)
-    if response.status_code == 200:
-        os.makedirs('./temp', exist_ok=True)
-        image_path = './temp/downloaded_image.png'
-        with open(image_path, 'wb') as f:
-            f.write(response.content)
+    # 下载图片（复用连接池，按块写入磁盘）
+    return str(http_client.download(image_url, Path(output_path)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='使用 DashScope qwen-image 文生图')
+    parser.add_argument('prompt', nargs='?', default=DEFAULT_PROMPT, help='提示词')
+    parser.add_argument('-o', '--output', default='./temp/downloaded_image.png', help='图片保存路径')
+    parser.add_argument('--size', default='1328*1328', help='图片尺寸，如 1328*1328')
+    args = parser.parse_args()
+
+    try:
+        image_path = text_to_image(args.prompt, args.output, args.size)
         print(f"图片已下载到: {image_path}")
-    else:
-        print(f"图片下载失败，HTTP返回码: {response.status_code}")
-else:
-    print(f"HTTP返回码：{response.status_code}")
-    print(f"错误码：{response.code}")
-    print(f"错误信息：{response.message}")
-    print("请参考文档：https://help.aliyun.com/zh/model-studio/developer-reference/error-code")
\ No newline at end of file
+    except Exception as e:
+        print(f"图片生成失败: {e}")
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+"""基于 SQLite 的持久化任务队列，支持断点续跑。
+
+每个任务有独立的工作目录（JOBS_ROOT/<job_id>/），流水线每个阶段完成后把产物
+路径记为检查点。任务失败重试时，已完成且产物仍在的阶段直接复用，
+不会重复调用昂贵的远程生成（text_to_image、image_to_video）。
+
+多个 worker 进程（或同一进程内的多个线程）可以同时从同一个数据库领取任务：
+领取在 BEGIN IMMEDIATE 事务中完成，同一任务只会被一个 worker 领到；worker
+运行期间定期续租，进程崩溃后租约过期，任务会被其他 worker 重新领取。
+
+用法:
+    python job_queue.py submit "赛博朋克城市夜景" --duration 8
+    python job_queue.py work -j 2
+    python job_queue.py status
+    python job_queue.py retry <job_id>
+
+环境变量：
+    JOBS_DB     数据库路径（默认 ./tmp/jobs.sqlite3）
+    JOBS_ROOT   任务工作目录的根目录（默认 ./tmp/jobs）
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+
+JOB_STATUSES = ("queued", "running", "done", "failed")
+
+
+class LeaseLost(Exception):
+    """续租失败：任务已被其他 worker 重新领取，本 worker 应停止运行它"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    prompt TEXT NOT NULL,
+    options TEXT NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    next_run REAL NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_expires REAL,
+    result TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, next_run, created);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    job_id TEXT NOT NULL REFERENCES jobs (id),
+    stage TEXT NOT NULL,
+    artifact TEXT NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (job_id, stage)
+);
+"""
+
+
+class JobQueue:
+    """
+    Args:
+        db_path: SQLite 数据库路径
+        root: 任务工作目录的根目录
+        lease: 领取任务的租约时长（秒），worker 运行期间自动续租
+        retry_backoff: 失败重试的退避基数（秒），第 n 次重试等待 retry_backoff * 2^(n-1)
+    """
+
+    def __init__(self, db_path=None, root=None, lease: float = 120.0, retry_backoff: float = 5.0):
+        self.db_path = Path(db_path or os.getenv("JOBS_DB", "./tmp/jobs.sqlite3"))
+        self.root = Path(root or os.getenv("JOBS_ROOT", "./tmp/jobs"))
+        self.lease = lease
+        self.retry_backoff = retry_backoff
+        self._local = threading.local()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程一个连接（sqlite3 连接不能跨线程使用）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            # WAL 模式下读写互不阻塞，多个 worker 进程可以同时访问
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def workspace(self, job_id: str) -> Path:
+        path = self.root / job_id
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    # ---- 提交与查询 ----
+
+    def submit(self, prompt: str, max_attempts: int = 3, job_id: Optional[str] = None, **options) -> str:
+        job_id = job_id or uuid.uuid4().hex[:12]
+        now = time.time()
+        self._connect().execute(
+            "INSERT INTO jobs (id, prompt, options, max_attempts, created, updated) VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, prompt, json.dumps(options, ensure_ascii=False), max_attempts, now, now),
+        )
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["options"] = json.loads(job["options"])
+        job["checkpoints"] = self.checkpoints(job_id)
+        return job
+
+    def list_jobs(self, status: Optional[str] = None) -> List[Dict]:
+        if status:
+            rows = self._connect().execute("SELECT * FROM jobs WHERE status = ? ORDER BY created", (status,))
+        else:
+            rows = self._connect().execute("SELECT * FROM jobs ORDER BY created")
+        return [dict(row) for row in rows]
+
+    def retry(self, job_id: str) -> bool:
+        """把失败的任务重新放回队列（保留检查点，从上次完成的阶段继续）"""
+        cursor = self._connect().execute(
+            "UPDATE jobs SET status = 'queued', attempts = 0, next_run = 0, error = NULL, updated = ? "
+            "WHERE id = ? AND status = 'failed'",
+            (time.time(), job_id),
+        )
+        return cursor.rowcount == 1
+
+    # ---- 领取与完成 ----
+
+    def claim(self, worker: str) -> Optional[Dict]:
+        """领取一个可运行的任务：排队中且到了重试时间，或运行中但租约已过期
+
+        租约过期说明 worker 在运行任务时崩溃了（例如被 OOM 杀掉），这也算一次尝试；
+        已经用完重试次数的过期任务标记为 failed，不再领取，避免反复拖垮 worker。
+        """
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, lease_expires = NULL, updated = ? "
+                "WHERE status = 'running' AND lease_expires < ? AND attempts >= max_attempts",
+                ("worker 运行期间退出，租约过期且已达到最大尝试次数", now, now),
+            )
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE ((status = 'queued' AND next_run <= ?) "
+                "OR (status = 'running' AND lease_expires < ?)) AND attempts < max_attempts "
+                "ORDER BY created LIMIT 1",
+                (now, now),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated = ? WHERE id = ?",
+                (worker, now + self.lease, now, row["id"]),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        job = dict(row)
+        job["options"] = json.loads(job["options"])
+        job["attempts"] += 1
+        return job
+
+    def renew(self, job_id: str, worker: str) -> bool:
+        cursor = self._connect().execute(
+            "UPDATE jobs SET lease_expires = ?, updated = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            (time.time() + self.lease, time.time(), job_id, worker),
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: str, worker: str, result: str):
+        self._connect().execute(
+            "UPDATE jobs SET status = 'done', result = ?, error = NULL, lease_expires = NULL, updated = ? "
+            "WHERE id = ? AND worker = ?",
+            (result, time.time(), job_id, worker),
+        )
+
+    def fail(self, job_id: str, worker: str, error: str):
+        """记录失败：还有重试次数时按指数退避重新排队，否则标记为 failed"""
+        conn = self._connect()
+        row = conn.execute("SELECT attempts, max_attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        now = time.time()
+        if row["attempts"] < row["max_attempts"]:
+            delay = self.retry_backoff * 2 ** (row["attempts"] - 1)
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', next_run = ?, error = ?, lease_expires = NULL, updated = ? "
+                "WHERE id = ? AND worker = ?",
+                (now + delay, error, now, job_id, worker),
+            )
+        else:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, lease_expires = NULL, updated = ? "
+                "WHERE id = ? AND worker = ?",
+                (error, now, job_id, worker),
+            )
+
+    # ---- 检查点 ----
+
+    def checkpoints(self, job_id: str) -> Dict[str, str]:
+        rows = self._connect().execute("SELECT stage, artifact FROM checkpoints WHERE job_id = ?", (job_id,))
+        return {row["stage"]: row["artifact"] for row in rows}
+
+    def save_checkpoint(self, job_id: str, stage: str, artifact: str):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO checkpoints (job_id, stage, artifact, created) VALUES (?, ?, ?, ?)",
+            (job_id, stage, str(artifact), time.time()),
+        )
+
+    def checkpointed(self, job_id: str, lease_lost: Optional[threading.Event] = None):
+        """返回给 pipline.build_pipeline_graph 用的 stage_wrapper：
+
+        阶段已有检查点且产物文件仍在时直接返回产物路径，否则执行阶段并记录检查点。
+        lease_lost 被设置后（租约已被其他 worker 接手），阶段开始前和记录检查点前抛出 LeaseLost。
+        """
+        def check(stage):
+            if lease_lost is not None and lease_lost.is_set():
+                raise LeaseLost(f"任务 {job_id} 的租约已被其他 worker 接手，停止阶段 {stage}")
+
+        def wrapper(stage, func):
+            def run_stage(ctx, **deps):
+                check(stage)
+                artifact = self.checkpoints(job_id).get(stage)
+                if artifact and Path(artifact).exists():
+                    print(f"[{job_id}] 阶段 {stage} 已完成，复用 {artifact}")
+                    return artifact
+                result = func(ctx, **deps)
+                check(stage)
+                self.save_checkpoint(job_id, stage, result)
+                return result
+            return run_stage
+        return wrapper
+
+
+class _Heartbeat:
+    """任务运行期间在后台线程中定期续租；续租失败时设置 lost 并停止"""
+
+    def __init__(self, queue: JobQueue, job_id: str, worker: str):
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(queue, job_id, worker), daemon=True)
+
+    def _run(self, queue, job_id, worker):
+        while not self._stop.wait(queue.lease / 3):
+            if not queue.renew(job_id, worker):
+                self.lost.set()
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_job(queue: JobQueue, job: Dict, worker: str) -> Optional[str]:
+    """在任务的工作目录中运行流水线，已完成的阶段从检查点恢复"""
+    import pipline
+
+    job_id = job["id"]
+    options = {**job["options"], "job_id": job_id, "workspace": str(queue.workspace(job_id))}
+    with _Heartbeat(queue, job_id, worker) as heartbeat:
+        graph = pipline.build_pipeline_graph(stage_wrapper=queue.checkpointed(job_id, heartbeat.lost))
+        try:
+            result = asyncio.run(pipline.run_pipeline_async(job["prompt"], graph=graph, **options))
+        except LeaseLost as e:
+            # 任务已归其他 worker，不记失败也不计入重试
+            print(f"[{job_id}] {e}")
+            return None
+        except Exception as e:
+            queue.fail(job_id, worker, f"{type(e).__name__}: {e}\n{traceback.format_exc()}")
+            print(f"[{job_id}] 第 {job['attempts']} 次运行失败: {e}")
+            return None
+    queue.complete(job_id, worker, result)
+    print(f"[{job_id}] 完成: {result}")
+    return result
+
+
+def work(queue: JobQueue, jobs: int = 1, poll_interval: float = 2.0, once: bool = False):
+    """
+    worker 主循环：每个线程反复领取并运行任务
+
+    Args:
+        jobs: 本进程内并发运行的任务数
+        poll_interval: 队列为空时的等待间隔（秒）
+        once: 队列为空时退出，而不是继续等待
+    """
+    worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+
+    def loop(n):
+        worker = f"{worker_prefix}:{n}"
+        while True:
+            job = queue.claim(worker)
+            if job is None:
+                if once:
+                    return
+                time.sleep(poll_interval)
+                continue
+            run_job(queue, job, worker)
+
+    threads = [threading.Thread(target=loop, args=(n,), name=f"job-worker-{n}") for n in range(jobs)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='持久化流水线任务队列')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('submit', help='提交任务')
+    p.add_argument('prompts', nargs='+', help='提示词（每个提示词一个任务）')
+    p.add_argument('--duration', type=float, help='视频时长（秒）')
+    p.add_argument('--mood', help='音乐情绪')
+    p.add_argument('--profile', help='编码档位')
+    p.add_argument('--max-attempts', type=int, default=3, help='最多运行次数')
+
+    p = sub.add_parser('work', help='运行 worker')
+    p.add_argument('-j', '--jobs', type=int, default=1, help='本进程内并发运行的任务数')
+    p.add_argument('--once', action='store_true', help='队列为空时退出')
+
+    p = sub.add_parser('status', help='查看任务状态')
+    p.add_argument('job_id', nargs='?', help='任务 ID（默认列出全部）')
+    p.add_argument('--status', choices=JOB_STATUSES, help='按状态过滤')
+
+    p = sub.add_parser('retry', help='重新运行失败的任务（从检查点继续）')
+    p.add_argument('job_ids', nargs='+')
+
+    args = parser.parse_args()
+    queue = JobQueue()
+
+    if args.command == 'submit':
+        options = {k: v for k, v in (('duration_s', args.duration), ('mood', args.mood), ('profile', args.profile))
+                   if v is not None}
+        for prompt in args.prompts:
+            print(queue.submit(prompt, max_attempts=args.max_attempts, **options))
+    elif args.command == 'work':
+        work(queue, args.jobs, once=args.once)
+    elif args.command == 'status':
+        if args.job_id:
+            print(json.dumps(queue.get(args.job_id), ensure_ascii=False, indent=2))
+        else:
+            for job in queue.list_jobs(args.status):
+                print(f"{job['id']}  {job['status']:<8} 第 {job['attempts']}/{job['max_attempts']} 次  {job['prompt'][:40]}")
+    elif args.command == 'retry':
+        for job_id in args.job_ids:
+            print(f"{job_id}: {'已重新排队' if queue.retry(job_id) else '不是失败状态，未处理'}")
+
+
+if __name__ == "__main__":
+    main()
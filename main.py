@@ -1,6 +1,62 @@
-def main():
-    print("Hello from tools!")
+"""统一命令行入口。
+
+每个子命令对应一个模块的 main()，只有真正执行的那个子命令才会导入对应模块，
+所以 ``python main.py trim`` 不会加载 langchain、gradio_client、requests 或 fastmcp：
+
+    python main.py trim video.mp4 -s 1
+    python main.py merge video.mp4 music.mp3 -o out.mp4
+    python main.py jobs work
+
+子命令的参数原样交给对应模块的 argparse，``python main.py <子命令> -h`` 查看用法。
+导入耗时可以用 ``python benchmark.py --imports`` 测量（基于 ``python -X importtime``）。
+"""
+import importlib
+import sys
+
+# 子命令 -> (模块名, 说明)
+COMMANDS = {
+    "trim": ("trim_video", "批量从视频末尾切除指定秒数"),
+    "concat": ("video_concat", "拼接视频（流复制）"),
+    "merge": ("merge_video_audio", "把音频循环/截断后铺到视频上"),
+    "audio-concat": ("audio_concat", "拼接音频文件"),
+    "fit-audio": ("audio_fit", "把音频适配到指定时长"),
+    "last-frame": ("extract_last_frame", "提取视频最后一帧"),
+    "render": ("timeline_render", "按 JSON 时间线渲染视频"),
+    "dedup": ("scene_analysis", "分析片段，去掉重复/静止画面后拼接"),
+    "probe": ("media_probe", "批量探测媒体文件信息"),
+    "frames": ("frame_reader", "读取原始帧并打印尺寸信息"),
+    "image": ("image_generator", "DashScope 文生图"),
+    "pipeline": ("pipline", "文本 -> 图像 -> 视频 + 配乐 的完整流水线"),
+    "jobs": ("job_queue", "持久化流水线任务队列（submit / work / status / retry）"),
+    "mcp": ("video_mcp", "启动视频 MCP 服务"),
+    "bench": ("benchmark", "媒体工具基准测试"),
+}
+
+
+def _usage():
+    lines = ["用法: python main.py <子命令> [参数...]", "", "子命令:"]
+    width = max(len(name) for name in COMMANDS)
+    for name, (module, help_text) in COMMANDS.items():
+        lines.append(f"  {name:<{width}}  {help_text}（{module}.py）")
+    lines += ["", "python main.py <子命令> -h 查看子命令的参数"]
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if not argv or argv[0] in ("-h", "--help"):
+        print(_usage())
+        return 0
+    command, args = argv[0], argv[1:]
+    if command not in COMMANDS:
+        print(f"未知的子命令: {command}\n\n{_usage()}", file=sys.stderr)
+        return 2
+
+    module = importlib.import_module(COMMANDS[command][0])
+    # 子命令的 argparse 从 sys.argv 读取参数，prog 显示为 "main.py <子命令>"
+    sys.argv = [f"main.py {command}", *args]
+    return module.main()
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
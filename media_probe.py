@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""统一的媒体探测模块。
+
+一次 ffprobe 调用返回完整的元数据记录（时长、各路流、编码、帧率，可选关键帧索引），
+结果按解析后的路径在内存中缓存，记录里的 (mtime, size) 与文件一致时不会再启动 ffprobe。
+设置 MEDIA_PROBE_CACHE 环境变量（JSON 文件路径）后，结果还会持久化到磁盘，
+跨进程复用：probe_many 在批量探测结束时写一次，单独的 probe() 调用攒到进程退出时写一次。
+批量探测只对未命中的文件并发启动 ffprobe。
+"""
+import argparse
+import atexit
+import json
+import os
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import tracing
+
+# 磁盘缓存格式版本，记录字段变化时递增，旧缓存自动失效
+CACHE_VERSION = 1
+
+_memo = {}  # 解析后的路径 -> 记录
+_lock = threading.Lock()
+_disk_loaded = False
+_dirty = False
+_atexit_registered = False
+
+
+def _stat_key(path):
+    path = Path(path)
+    st = path.stat()
+    return str(path.resolve()), st.st_mtime_ns, st.st_size
+
+
+def _parse_rate(rate):
+    """把 ffprobe 的 "30000/1001" 形式的帧率转为浮点数，无效时返回 None。"""
+    try:
+        num, den = rate.split("/")
+        return float(num) / float(den) if float(den) else None
+    except (AttributeError, ValueError):
+        return None
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _run_ffprobe(path):
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-print_format', 'json',
+        '-show_format',
+        '-show_streams',
+        str(path)
+    ]
+    try:
+        result = tracing.run(cmd, capture_output=True, text=True, check=True)
+        return json.loads(result.stdout)
+    except subprocess.CalledProcessError as e:
+        raise Exception(f"获取媒体信息失败: {path}: {e.stderr.strip()}")
+    except json.JSONDecodeError as e:
+        raise Exception(f"解析媒体信息失败: {path}: {str(e)}")
+
+
+def _read_keyframes(path):
+    """读取第一路视频流的关键帧时间戳（秒）。只读包头，不解码。"""
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,flags',
+        '-of', 'csv=p=0',
+        str(path)
+    ]
+    try:
+        output = tracing.run(cmd, capture_output=True, text=True, check=True).stdout
+    except subprocess.CalledProcessError as e:
+        raise Exception(f"读取关键帧索引失败: {path}: {e.stderr.strip()}")
+
+    keyframes = []
+    for line in output.splitlines():
+        pts, _, flags = line.partition(',')
+        if 'K' in flags and pts not in ('', 'N/A'):
+            keyframes.append(float(pts))
+    keyframes.sort()
+    return keyframes
+
+
+def _build_record(path, data, stat_key):
+    fmt = data.get('format', {})
+    streams = []
+    for s in data.get('streams', []):
+        streams.append({
+            'index': s.get('index'),
+            'codec_type': s.get('codec_type'),
+            'codec_name': s.get('codec_name'),
+            'profile': s.get('profile'),
+            'pix_fmt': s.get('pix_fmt'),
+            'width': s.get('width'),
+            'height': s.get('height'),
+            'fps': _parse_rate(s.get('avg_frame_rate')) or _parse_rate(s.get('r_frame_rate')),
+            'sample_rate': _to_int(s.get('sample_rate')),
+            'channels': s.get('channels'),
+            'channel_layout': s.get('channel_layout'),
+            'bit_rate': _to_int(s.get('bit_rate')),
+            'duration': _to_float(s.get('duration')),
+            'nb_frames': _to_int(s.get('nb_frames')),
+        })
+
+    duration = _to_float(fmt.get('duration'))
+    if duration is None:
+        stream_durations = [s['duration'] for s in streams if s['duration']]
+        duration = max(stream_durations) if stream_durations else None
+
+    return {
+        'path': str(path),
+        'mtime_ns': stat_key[1],
+        'size': stat_key[2],
+        'duration': duration,
+        # 容器的起始时间；包的 pts（包括关键帧时间戳）是相对它的绝对值，而 -ss 从它开始计
+        'start_time': _to_float(fmt.get('start_time')) or 0.0,
+        'format_name': fmt.get('format_name'),
+        'bit_rate': _to_int(fmt.get('bit_rate')),
+        'streams': streams,
+        'keyframes': None,
+    }
+
+
+def _cache_file():
+    path = os.getenv('MEDIA_PROBE_CACHE')
+    return Path(path) if path else None
+
+
+def _load_disk_cache():
+    """首次访问时把磁盘缓存中仍然有效的记录载入内存。"""
+    global _disk_loaded
+    if _disk_loaded:
+        return
+    _disk_loaded = True
+    cache_file = _cache_file()
+    if cache_file is None or not cache_file.exists():
+        return
+    try:
+        data = json.loads(cache_file.read_text(encoding='utf-8'))
+    except (OSError, json.JSONDecodeError):
+        return
+    if isinstance(data, dict) and data.get('version') == CACHE_VERSION:
+        _memo.update(data['records'])
+
+
+def _save_disk_cache():
+    """有新记录时把内存缓存整体写回磁盘。"""
+    global _dirty
+    cache_file = _cache_file()
+    if cache_file is None:
+        return
+    with _lock:
+        if not _dirty:
+            return
+        _dirty = False
+        records = dict(_memo)
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_file.parent, prefix=f".{cache_file.name}.", suffix=".part")
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump({'version': CACHE_VERSION, 'records': records}, f, ensure_ascii=False)
+    os.replace(tmp_path, cache_file)
+
+
+def _lookup(stat_key):
+    """返回与文件当前 (mtime, size) 一致的缓存记录，没有时返回 None。"""
+    resolved, mtime_ns, size = stat_key
+    with _lock:
+        _load_disk_cache()
+        record = _memo.get(resolved)
+    if record is None or record['mtime_ns'] != mtime_ns or record['size'] != size:
+        return None
+    return record
+
+
+def _store(stat_key, record):
+    global _dirty, _atexit_registered
+    with _lock:
+        # 同一路径只保留最新版本的记录
+        _memo[stat_key[0]] = record
+        _dirty = True
+        if not _atexit_registered and _cache_file() is not None:
+            _atexit_registered = True
+            atexit.register(_save_disk_cache)
+
+
+def _probe_uncached(path, stat_key, keyframes):
+    record = _lookup(stat_key)
+    if record is None:
+        record = _build_record(path, _run_ffprobe(path), stat_key)
+    if keyframes and record['keyframes'] is None:
+        record = {**record, 'keyframes': _read_keyframes(path)}
+    _store(stat_key, record)
+    return record
+
+
+def probe(path, keyframes=False):
+    """
+    获取媒体文件的完整元数据记录
+
+    Args:
+        path: 媒体文件路径
+        keyframes: 是否同时读取视频关键帧索引
+    Returns:
+        dict: 包含 duration、streams、format_name 等字段，keyframes 为时间戳列表或 None
+    """
+    stat_key = _stat_key(path)
+    record = _lookup(stat_key)
+    if record is not None and (not keyframes or record['keyframes'] is not None):
+        return record
+
+    return _probe_uncached(path, stat_key, keyframes)
+
+
+def probe_many(paths, keyframes=False, max_workers=None):
+    """
+    批量探测多个文件，返回与 paths 顺序一致的记录列表
+
+    已缓存的文件直接返回，未命中的文件并发探测，磁盘缓存只在最后写一次。
+    """
+    keys = [_stat_key(p) for p in paths]
+    results = [_lookup(k) for k in keys]
+    missing = [
+        i for i, r in enumerate(results)
+        if r is None or (keyframes and r['keyframes'] is None)
+    ]
+    if not missing:
+        return results
+
+    workers = max_workers or min(32, (os.cpu_count() or 1) * 2)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        probed = pool.map(lambda i: _probe_uncached(paths[i], keys[i], keyframes), missing)
+        for i, record in zip(missing, probed):
+            results[i] = record
+
+    _save_disk_cache()
+    return results
+
+
+def get_duration(path):
+    """获取媒体时长（秒）"""
+    duration = probe(path)['duration']
+    if duration is None:
+        raise Exception(f"无法确定媒体时长: {path}")
+    return duration
+
+
+def get_keyframes(path):
+    """获取视频关键帧时间戳列表（秒）"""
+    return probe(path, keyframes=True)['keyframes']
+
+
+def first_stream(record, codec_type):
+    """返回记录中第一路指定类型（video/audio）的流，没有时返回 None。"""
+    for stream in record['streams']:
+        if stream['codec_type'] == codec_type:
+            return stream
+    return None
+
+
+def clear_cache():
+    """清空内存中的探测缓存。"""
+    with _lock:
+        _memo.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批量探测媒体文件信息')
+    parser.add_argument('paths', nargs='+', help='媒体文件或目录（目录下的 mp4/mp3 文件）')
+    parser.add_argument('--keyframes', action='store_true', help='同时输出关键帧索引')
+    args = parser.parse_args()
+
+    files = []
+    for p in map(Path, args.paths):
+        if p.is_dir():
+            files += sorted(f for f in p.iterdir() if f.suffix.lower() in ('.mp4', '.mp3'))
+        else:
+            files.append(p)
+
+    print(json.dumps(probe_many(files, keyframes=args.keyframes), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
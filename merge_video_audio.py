@@ -1,24 +1,20 @@
+import argparse
 import subprocess
 import os
-import json
+
+import audio_fit
+import encoding_profiles
+import media_probe
+import tracing
 
 def get_duration(file_path):
     """
-    Get the duration of a media file using ffprobe
+    Get the duration of a media file (cached by media_probe)
     """
-    command = [
-        'ffprobe',
-        '-v', 'quiet',
-        '-print_format', 'json',
-        '-show_format',
-        file_path
-    ]
-    
-    result = subprocess.run(command, capture_output=True, text=True)
-    data = json.loads(result.stdout)
-    return float(data['format']['duration'])
+    return media_probe.get_duration(file_path)
 
-def merge_video_audio(video_path, audio_path, output_path):
+def merge_video_audio(video_path, audio_path, output_path, profile=encoding_profiles.DEFAULT_PROFILE,
+                      crossfade=0.0, fade_out=0.0, quiet=False):
     """
     Merge video and audio files using ffmpeg, with audio loop if needed
     
@@ -26,46 +22,62 @@ def merge_video_audio(video_path, audio_path, output_path):
         video_path (str): Path to the video file
         audio_path (str): Path to the audio file
         output_path (str): Path for the output video
+        profile (str): Encoding profile name (see encoding_profiles), sets the AAC bitrate
+        crossfade (float): Crossfade between audio loop repetitions, in seconds
+        fade_out (float): Fade out at the end of the audio, in seconds
+        quiet (bool): Print nothing and raise on failure instead (for MCP and other services)
     """
     try:
-        # Get durations
+        # Video duration comes from the cached probe record
         video_duration = get_duration(video_path)
-        audio_duration = get_duration(audio_path)
-        
-        # Calculate how many times to loop the audio
-        loop_times = int(video_duration / audio_duration + 0.5)  # Round to nearest integer
-        
-        print(f"Video duration: {video_duration:.2f} seconds")
-        print(f"Audio duration: {audio_duration:.2f} seconds")
-        print(f"Will loop audio {loop_times} times")
+        if not quiet:
+            print(f"Video duration: {video_duration:.2f} seconds")
+
+        # Loop/trim/crossfade the audio to exactly the video duration (cached per track and duration)
+        fitted_audio = audio_fit.fit_audio(audio_path, video_duration, crossfade, fade_out, profile)
         
-        # Construct the ffmpeg command with audio loop
+        # Both streams are copied, the fitted audio is already AAC of the right length
         command = [
-            'ffmpeg',
+            'ffmpeg', '-y',
             '-i', video_path,    # Input video
-            '-stream_loop', str(loop_times - 1),  # Loop times minus 1 (0 means play once)
-            '-i', audio_path,    # Input audio
+            '-i', fitted_audio,  # Fitted audio (AAC)
+            '-map', '0:v:0',
+            '-map', '1:a:0',
             '-c:v', 'copy',      # Copy the video stream without re-encoding
-            '-c:a', 'aac',       # Convert audio to AAC codec
-            '-shortest',         # Cut off at shortest input
-            '-strict', 'experimental',
+            '-c:a', 'copy',
+            *encoding_profiles.container_args(profile),
             output_path
         ]
         
         # Execute the command
-        subprocess.run(command, check=True)
-        print(f"Successfully merged video and audio to: {output_path}")
+        tracing.run(command, check=True, stdin=subprocess.DEVNULL)
+        if not quiet:
+            print(f"Successfully merged video and audio to: {output_path}")
         
     except subprocess.CalledProcessError as e:
+        if quiet:
+            raise
         print(f"Error occurred while merging: {e}")
     except Exception as e:
+        if quiet:
+            raise
         print(f"An unexpected error occurred: {e}")
 
 def main():
-    # Get input from user
-    video_path = input("Enter the path to the video file (.mp4): ")
-    audio_path = input("Enter the path to the audio file (.mp3): ")
-    output_path = input("Enter the path for output file (.mp4): ")
+    parser = argparse.ArgumentParser(description='Merge a video with an audio track looped/trimmed to its length')
+    parser.add_argument('video', nargs='?', help='Video file (.mp4), prompted for when omitted')
+    parser.add_argument('audio', nargs='?', help='Audio file (.mp3), prompted for when omitted')
+    parser.add_argument('-o', '--output', help='Output file (.mp4), prompted for when omitted')
+    parser.add_argument('-p', '--profile', choices=list(encoding_profiles.PROFILES),
+                        default=encoding_profiles.DEFAULT_PROFILE, help='Encoding profile (sets the AAC bitrate)')
+    parser.add_argument('--crossfade', type=float, default=0.0, help='Crossfade between audio loops, in seconds')
+    parser.add_argument('--fade-out', type=float, default=0.0, help='Fade out at the end, in seconds')
+    args = parser.parse_args()
+
+    # Fall back to asking the user for anything not given on the command line
+    video_path = args.video or input("Enter the path to the video file (.mp4): ")
+    audio_path = args.audio or input("Enter the path to the audio file (.mp3): ")
+    output_path = args.output or input("Enter the path for output file (.mp4): ")
     
     # Validate input files exist
     if not os.path.exists(video_path):
@@ -76,7 +88,7 @@ def main():
         return
     
     # Merge video and audio
-    merge_video_audio(video_path, audio_path, output_path)
+    merge_video_audio(video_path, audio_path, output_path, args.profile, args.crossfade, args.fade_out)
 
 if __name__ == "__main__":
     main()
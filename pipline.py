@@ -1,98 +1,106 @@
 # pipeline.py
-from langchain_core.tools import tool
-from langchain.agents import create_tool_calling_agent, AgentExecutor
-from langchain.chains import SequentialChain
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_deepseek import ChatDeepSeek 
-
-import subprocess
-import requests
+# 工具都是普通函数：导入本模块不会加载 langchain / gradio_client / requests，
+# 也不会创建目录；需要 LangChain 工具对象（例如交给 agent）时调用 get_tools()。
+import asyncio
+import functools
 import os
+import uuid
 from pathlib import Path
-from gradio_client import Client, handle_file
+
+import audio_fit
+import backends
+import encoding_profiles
+import media_probe
+import tracing
+from result_cache import cached_tool, get_cache
+from stage_graph import StageGraph
 
 TMP = Path("./tmp")
-TMP.mkdir(exist_ok=True)
+
+def _out_path(out_name) -> Path:
+    """TMP 下的输出路径（out_name 为绝对路径时即其本身），写入前才创建目录"""
+    path = TMP / out_name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path
 
 # ---- Tool 1: text -> image ----
-@tool
+@tracing.traced("tool.text_to_image", kind="tool")
+@cached_tool(TMP, variant=lambda: backends.backend_name("image"))
 def text_to_image(prompt: str, out_name: str = "img.png") -> str:
     """
-    使用阿里云 DashScope API 将文本转换为图像。
+    将文本转换为图像（默认使用阿里云 DashScope API，可通过 TOOLS_BACKEND 切换到本地替身）。
     Args:
         prompt: 图像描述文本
         out_name: 输出图像文件名
     Returns:
         生成的图像本地路径
     """
-    api_key = os.getenv('DASHSCOPE_API_KEY')
-    if not api_key:
-        raise ValueError("请设置 DASHSCOPE_API_KEY 环境变量")
-
-    url = "https://dashscope.aliyuncs.com/api/v1/services/aigc/multimodal-generation/generation"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}"
-    }
-    
-    payload = {
-        "model": "qwen-image",
-        "input": {
-            "messages": [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "text": prompt
-                        }
-                    ]
-                }
-            ]
-        },
-        "parameters": {
-            "negative_prompt": "",
-            "prompt_extend": True,
-            "watermark": True,
-            "size": "1328*1328"
-        }
-    }
+    return backends.get_backend("image").text_to_image(prompt, _out_path(out_name))
 
-    try:
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()
-        result = response.json()
-        
-        # 从响应中获取图像 URL 并下载
-        if 'output' in result and 'results' in result['output']:
-            image_url = result['output']['results'][0].get('url')
-            if image_url:
-                image_response = requests.get(image_url)
-                image_response.raise_for_status()
-                
-                out_path = TMP / out_name
-                with open(out_path, "wb") as f:
-                    f.write(image_response.content)
-                return str(out_path)
-            
-        raise Exception("未能从 API 响应中获取图像 URL")
-    except Exception as e:
-        raise Exception(f"调用 DashScope API 失败: {str(e)}")
+# ---- Tool 1b: 批量 text -> image ----
+def text_to_image_batch(prompts, out_names=None, **options):
+    """
+    批量文生图，按完成顺序逐个产出 (序号, 图像路径或异常对象)
+
+    缓存命中的直接产出，其余提交给 backends.text_to_images 并发生成
+    （令牌桶限流 + 异步任务轮询），生成结果写入缓存，与 text_to_image 共用缓存键。
+    Args:
+        prompts: 提示词列表
+        out_names: 输出文件名列表，默认 frame_000.png、frame_001.png ...
+        options: 透传给 backends.text_to_images（rate、max_in_flight、poll_interval 等）
+    """
+    prompts = list(prompts)
+    out_names = list(out_names) if out_names is not None else [f"frame_{i:03d}.png" for i in range(len(prompts))]
+    cache = get_cache()
+    variant = backends.backend_name("image")
+
+    keys, misses = {}, []
+    for i, prompt in enumerate(prompts):
+        if cache is not None:
+            keys[i] = cache.key("text_to_image", {"prompt": prompt, "__variant__": variant})
+            hit = cache.get(keys[i], _out_path(out_names[i]))
+            if hit is not None:
+                yield i, str(hit)
+                continue
+        misses.append(i)
+
+    results = backends.text_to_images(
+        [prompts[i] for i in misses], [_out_path(out_names[i]) for i in misses], **options
+    )
+    for j, result in results:
+        i = misses[j]
+        if cache is not None and not isinstance(result, BaseException):
+            cache.put(keys[i], result)
+        yield i, result
 
 # ---- Tool 2: image -> video ----
-@tool
+@tracing.traced("tool.image_to_video", kind="tool")
+@cached_tool(TMP, file_args=("image_path",), variant=lambda: backends.backend_name("video"))
 def image_to_video(image_path: str, prompt: str = "", duration_s: int = 8, out_name: str = "out.mp4") -> str:
     """
     输入图片路径，调用 image->video 服务，返回视频本地路径
-    TODO: 用 Runway/Gen-2 等 API 替换伪代码
     """
-    out_path = TMP / out_name
-    # 伪代码：调用 Runway 的 image->video 接口并将返回二进制写入 out_path
-    # e.g. requests.post("https://api.runwayml.com/v1/generate_video", files=..., data=...)
-    open(out_path, "wb").write(b"MP4-DUMMY")
-    return str(out_path)
+    return backends.get_backend("video").image_to_video(image_path, prompt, duration_s, _out_path(out_name))
+
+# ---- Tool 3: image -> music ----
+@tracing.traced("tool.image_to_music", kind="tool")
+@cached_tool(TMP, file_args=("image_path",), variant=lambda: backends.backend_name("music"))
+def image_to_music(image_path: str, mood: str = "epic", length_s: int = 8, out_name: str = "music.mp3") -> str:
+    """
+    使用 HuggingFace 的 image-to-music 模型（或本地替身），从参考图像生成音乐
+    Args:
+        image_path: 参考图像路径
+        mood: 音乐情绪（暂未使用）
+        length_s: 期望的音乐长度（秒）
+        out_name: 输出音频文件名
+    Returns:
+        生成的音频文件路径
+    """
+    return backends.get_backend("music").image_to_music(image_path, mood, length_s, _out_path(out_name))
 
-# ---- Tool 3: video -> music ----
-@tool
+# ---- Tool 3b: video -> music ----
+@tracing.traced("tool.video_to_music", kind="tool")
+@cached_tool(TMP, file_args=("video_path",), variant=lambda: backends.backend_name("music"))
 def video_to_music(video_path: str, mood: str = "epic", length_s: int = 8, out_name: str = "music.mp3") -> str:
     """
     使用 HuggingFace 的 image-to-music 模型，从视频的第一帧生成音乐
@@ -104,76 +112,154 @@ def video_to_music(video_path: str, mood: str = "epic", length_s: int = 8, out_n
     Returns:
         生成的音频文件路径
     """
-    # 确保输出目录存在
-    out_path = TMP / out_name
-    
+    # 从视频提取第一帧作为参考图像（按输出名区分，避免并发任务互相覆盖）
+    frame_path = _out_path(f"{Path(out_name).stem}_reference_frame.jpg")
+    extract_cmd = [
+        "ffmpeg", "-y",
+        "-i", str(video_path),
+        "-vframes", "1",
+        "-f", "image2",
+        str(frame_path)
+    ]
+
+    try:
+        tracing.run(extract_cmd, check=True)
+    except Exception as e:
+        raise Exception(f"生成音乐失败: {str(e)}")
+
     try:
-        # 创建 HuggingFace 客户端
-        client = Client("fffiloni/image-to-music-v2")
-        
-        # 从视频提取第一帧作为参考图像
-        frame_path = TMP / "reference_frame.jpg"
-        extract_cmd = [
-            "ffmpeg", "-y",
-            "-i", str(video_path),
-            "-vframes", "1",
-            "-f", "image2",
-            str(frame_path)
-        ]
-        subprocess.run(extract_cmd, check=True)
-        
-        # 调用 image-to-music API
-        # 使用 ACE Step 模型，它通常产生较好的结果
-        prompt, audio_path = client.predict(
-            image_in=handle_file(str(frame_path)),
-            chosen_model="ACE Step",
-            api_name="/infer"
+        return image_to_music(
+            image_path=str(frame_path), mood=mood, length_s=length_s, out_name=out_name
         )
-        
-        # 将生成的音频移动到指定位置
-        import shutil
-        shutil.copy(audio_path, out_path)
-        
+    finally:
         # 清理临时文件
         frame_path.unlink(missing_ok=True)
-        Path(audio_path).unlink(missing_ok=True)
-        
-        return str(out_path)
-        
-    except Exception as e:
-        raise Exception(f"生成音乐失败: {str(e)}")
-        
-    return str(out_path)
 
 # ---- Tool 4: merge audio + video using ffmpeg ----
-@tool
-def merge_audio_video(video_path: str, audio_path: str, out_name: str = "final.mp4") -> str:
+@tracing.traced("tool.merge_audio_video", kind="tool")
+@cached_tool(TMP, file_args=("video_path", "audio_path"))
+def merge_audio_video(video_path: str, audio_path: str, out_name: str = "final.mp4", profile: str = "delivery") -> str:
     """
     使用 ffmpeg 把音频铺到视频上，返回合成后视频路径
+    音频先循环/截断到与视频等长（按音轨和时长缓存），再与视频一起流复制；
+    profile 为编码档位（fast-preview / delivery / archive）
     """
-    out_path = TMP / out_name
+    out_path = _out_path(out_name)
+    fitted_audio = audio_fit.fit_audio(audio_path, media_probe.get_duration(video_path), profile=profile)
     cmd = [
         "ffmpeg", "-y",
         "-i", str(video_path),
-        "-i", str(audio_path),
+        "-i", fitted_audio,
         "-c:v", "copy",
-        "-c:a", "aac",
+        "-c:a", "copy",
         "-map", "0:v:0",
         "-map", "1:a:0",
-        "-shortest",
+        *encoding_profiles.container_args(profile),
         str(out_path)
     ]
-    subprocess.run(cmd, check=True)
+    tracing.run(cmd, check=True)
     return str(out_path)
 
-# ---- Orchestration: 顺序执行（SequentialChain 风格，或者直接调用）----
+# ---- LangChain 工具：第一次调用时才导入 langchain ----
+@functools.lru_cache(maxsize=None)
+def get_tools():
+    """返回上面各工具对应的 LangChain 工具对象"""
+    from langchain_core.tools import tool
+
+    return [tool(func) for func in (text_to_image, image_to_video, image_to_music, video_to_music, merge_audio_video)]
+
+# ---- Orchestration: 阶段依赖图并发执行 ----
+# image ──┬─> video ──┐
+#         └─> music ──┴─> merge
+# 首帧就是生成的静态图，所以音乐直接从静态图生成，与视频渲染并发进行。
+def _out_name(ctx, name):
+    """阶段输出文件名：有独立工作目录时写到工作目录（绝对路径，TMP / 绝对路径 即其本身），
+    否则以 job_id 为前缀写到 TMP，并发任务互不覆盖"""
+    if ctx.get("workspace"):
+        return str(Path(ctx["workspace"]).resolve() / name)
+    return f"{ctx['job_id']}_{name}"
+
+def _stage_image(ctx):
+    return text_to_image(prompt=ctx["prompt"], out_name=_out_name(ctx, "frame.png"))
+
+def _stage_video(ctx, image):
+    return image_to_video(
+        image_path=image, prompt=ctx["prompt"], duration_s=ctx.get("duration_s", 10),
+        out_name=_out_name(ctx, "anim.mp4"),
+    )
+
+def _stage_music(ctx, image):
+    return image_to_music(
+        image_path=image, mood=ctx.get("mood", "ambient"), length_s=ctx.get("duration_s", 10),
+        out_name=_out_name(ctx, "bgm.mp3"),
+    )
+
+def _stage_merge(ctx, video, music):
+    return merge_audio_video(
+        video_path=video, audio_path=music, out_name=_out_name(ctx, "final_with_music.mp4"),
+        profile=ctx.get("profile", "delivery"),
+    )
+
+# 每个阶段跨任务的默认并发上限：远程生成受配额限制，本地 ffmpeg 受 CPU 限制
+DEFAULT_STAGE_LIMITS = {
+    "image": 4,
+    "video": 2,
+    "music": 2,
+    "merge": os.cpu_count() or 1,
+}
+
+def build_pipeline_graph(stage_limits=None, stage_wrapper=None):
+    """
+    构建 text -> image -> (video, music) -> merge 的阶段图
+    Args:
+        stage_limits: 覆盖 DEFAULT_STAGE_LIMITS 中的并发上限
+        stage_wrapper: 可选的 wrapper(name, func) -> func，用于给阶段加检查点等逻辑
+    """
+    limits = {**DEFAULT_STAGE_LIMITS, **(stage_limits or {})}
+    wrap = stage_wrapper or (lambda name, func: func)
+    graph = StageGraph()
+    graph.add_stage("image", wrap("image", _stage_image), limit=limits["image"])
+    graph.add_stage("video", wrap("video", _stage_video), deps=["image"], limit=limits["video"])
+    graph.add_stage("music", wrap("music", _stage_music), deps=["image"], limit=limits["music"])
+    graph.add_stage("merge", wrap("merge", _stage_merge), deps=["video", "music"], limit=limits["merge"])
+    return graph
+
+def _new_context(user_prompt: str, **options):
+    return {"prompt": user_prompt, "job_id": options.pop("job_id", None) or uuid.uuid4().hex[:8], **options}
+
+async def run_pipeline_async(user_prompt: str, graph: StageGraph | None = None, **options) -> str:
+    """异步执行单个 prompt 的完整流水线，返回最终视频路径"""
+    graph = graph or build_pipeline_graph()
+    ctx = _new_context(user_prompt, **options)
+    with tracing.span("pipeline", job_id=ctx["job_id"]):
+        results = await graph.run(ctx)
+    return results["merge"]
+
+async def run_pipelines(prompts, max_jobs: int | None = None, stage_limits=None) -> list:
+    """
+    并发执行多个 prompt，各阶段按 stage_limits 限流
+    Returns:
+        与 prompts 顺序一致的列表，成功为最终视频路径，失败为异常对象
+    """
+    graph = build_pipeline_graph(stage_limits)
+    results = await graph.run_many([_new_context(p) for p in prompts], max_jobs=max_jobs)
+    return [r if isinstance(r, BaseException) else r["merge"] for r in results]
+
 def run_pipeline(user_prompt: str):
-    img = text_to_image(prompt=user_prompt, out_name="frame.png")
-    vid = image_to_video(image_path=img, prompt=user_prompt, duration_s=10, out_name="anim.mp4")
-    music = video_to_music(video_path=vid, mood="ambient", length_s=10, out_name="bgm.mp3")
-    final = merge_audio_video(video_path=vid, audio_path=music, out_name="final_with_music.mp4")
-    return final
+    return asyncio.run(run_pipeline_async(user_prompt))
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='文本 -> 图像 -> 视频 + 配乐 的完整流水线')
+    parser.add_argument('prompts', nargs='*', default=["赛博朋克城市夜景，霓虹，雨中慢镜头"], help='提示词（可以多个）')
+    args = parser.parse_args()
+
+    if len(args.prompts) == 1:
+        print("输出文件：", run_pipeline(args.prompts[0]))
+        return
+    for prompt, res in zip(args.prompts, asyncio.run(run_pipelines(args.prompts))):
+        print(f"{prompt}: {res}")
 
 if __name__ == "__main__":
-    res = run_pipeline("赛博朋克城市夜景，霓虹，雨中慢镜头")
-    print("输出文件：", res)
+    main()
@@ -0,0 +1,185 @@
+"""下一轮视频的预取调度器。
+
+用户观看第 N 轮视频时，后台提前准备第 N+1 轮（可配置向前看几轮）：
+探测元数据和关键帧、提取最后一帧、转封装成交付格式（faststart MP4），
+可选地调用生成回调先生成下一段视频。用户跳到别的轮次时，不再需要的
+预取任务会被取消（排队中的直接取消，运行中的在步骤之间或 ffmpeg 运行中终止）。
+
+预算：同时运行的预取任务数（max_workers）、向前看的轮数（lookahead）、
+单个任务的最长耗时（time_budget，超时即终止）。
+"""
+from __future__ import annotations
+
+import subprocess
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+import media_probe
+import tracing
+from video_catalog import VideoCatalog
+
+
+class PrefetchCancelled(Exception):
+    """预取任务被取消或超出时间预算。"""
+
+
+class _Task:
+    def __init__(self, turn: int, deadline: float):
+        self.turn = turn
+        self.deadline = deadline
+        self.cancel_event = threading.Event()
+        self.future: Optional[Future] = None
+
+    def check(self):
+        if self.cancel_event.is_set():
+            raise PrefetchCancelled(f"第 {self.turn} 轮的预取已取消")
+        if time.monotonic() > self.deadline:
+            raise PrefetchCancelled(f"第 {self.turn} 轮的预取超出时间预算")
+
+
+def run_cancellable(cmd, task: _Task, poll_interval: float = 0.1):
+    """运行子进程，任务被取消或超时时终止子进程。"""
+    with tracing.span(f"subprocess.{Path(cmd[0]).name}", kind="subprocess", argv=" ".join(map(str, cmd))) as s:
+        process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        try:
+            while True:
+                try:
+                    _, stderr = process.communicate(timeout=poll_interval)
+                    break
+                except subprocess.TimeoutExpired:
+                    task.check()
+        except BaseException:
+            process.kill()
+            process.wait()
+            raise
+        s.set(exit_code=process.returncode)
+    if process.returncode != 0:
+        raise Exception(f"预取命令失败: {stderr.decode(errors='replace')}")
+
+
+class PrefetchScheduler:
+    """
+    Args:
+        catalog: 视频目录索引
+        frame_dir: 最后一帧图片的缓存目录
+        delivery_dir: 交付格式视频的输出目录，None 表示不转封装
+        lookahead: 向前预取的轮数
+        max_workers: 同时运行的预取任务数
+        time_budget: 单个预取任务的最长耗时（秒）
+        generate: 可选的生成回调 generate(turn, seed_frame_path)，
+                  目标轮次的视频还不存在时调用，用上一轮的最后一帧生成下一段
+    """
+
+    def __init__(
+        self,
+        catalog: VideoCatalog,
+        frame_dir: Path,
+        delivery_dir: Optional[Path] = None,
+        lookahead: int = 1,
+        max_workers: int = 2,
+        time_budget: float = 60.0,
+        generate: Optional[Callable[[int, Path], Path]] = None,
+    ):
+        self.catalog = catalog
+        self.frame_dir = Path(frame_dir)
+        self.delivery_dir = Path(delivery_dir) if delivery_dir else None
+        self.lookahead = lookahead
+        self.time_budget = time_budget
+        self.generate = generate
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._tasks: Dict[int, _Task] = {}
+        self._lock = threading.Lock()
+
+    def delivery_path(self, turn: int) -> Optional[Path]:
+        """返回某一轮已准备好的交付文件路径，尚未准备好时返回 None。"""
+        if self.delivery_dir is None:
+            return None
+        entry = self.catalog.get(turn)
+        path = self.delivery_dir / f"{entry['path'].stem}-{entry['mtime_ns']}.mp4"
+        return path if path.exists() else None
+
+    def _prepare(self, task: _Task) -> Dict:
+        turn = task.turn
+        if turn >= len(self.catalog):
+            if self.generate is None or turn == 0:
+                return {"turn": turn, "status": "unavailable"}
+            # 用上一轮的最后一帧作为首帧生成下一段
+            seed_frame = self.catalog.last_frame(turn - 1, self.frame_dir)
+            task.check()
+            self.generate(turn, seed_frame)
+            self.catalog.refresh(force=True)
+            task.check()
+
+        entry = self.catalog.get(turn)
+        media_probe.probe(entry["path"], keyframes=True)
+        task.check()
+
+        frame_path = self.catalog.last_frame(turn, self.frame_dir)
+        task.check()
+
+        result = {"turn": turn, "status": "ready", "video_path": str(entry["path"]), "last_frame_path": str(frame_path)}
+        if self.delivery_dir is not None:
+            delivery = self.delivery_dir / f"{entry['path'].stem}-{entry['mtime_ns']}.mp4"
+            if not delivery.exists():
+                self.delivery_dir.mkdir(parents=True, exist_ok=True)
+                tmp_path = delivery.with_name(f".{delivery.name}")
+                # 无损转封装，把 moov 移到文件开头，播放器可以边下边播
+                try:
+                    run_cancellable([
+                        "ffmpeg", "-y", "-v", "error",
+                        "-i", str(entry["path"]),
+                        "-map", "0", "-c", "copy",
+                        "-movflags", "+faststart",
+                        "-f", "mp4", str(tmp_path),
+                    ], task)
+                    tmp_path.replace(delivery)
+                except BaseException:
+                    # 被取消或失败时不在交付目录里留下半截的临时文件
+                    tmp_path.unlink(missing_ok=True)
+                    raise
+            result["delivery_path"] = str(delivery)
+        return result
+
+    def _run(self, task: _Task) -> Dict:
+        try:
+            task.check()
+            return self._prepare(task)
+        finally:
+            with self._lock:
+                if self._tasks.get(task.turn) is task:
+                    del self._tasks[task.turn]
+
+    def on_turn(self, turn: int) -> Dict[int, Future]:
+        """通知当前正在观看第 turn 轮：取消不再需要的预取，调度接下来几轮的预取。"""
+        wanted = set(range(turn + 1, turn + 1 + self.lookahead))
+        scheduled = {}
+        with self._lock:
+            for other, task in list(self._tasks.items()):
+                if other not in wanted:
+                    task.cancel_event.set()
+                    task.future.cancel()
+                    del self._tasks[other]
+
+            for target in sorted(wanted):
+                if target in self._tasks:
+                    scheduled[target] = self._tasks[target].future
+                    continue
+                task = _Task(target, time.monotonic() + self.time_budget)
+                task.future = self._executor.submit(self._run, task)
+                self._tasks[target] = task
+                scheduled[target] = task.future
+        return scheduled
+
+    def cancel_all(self):
+        with self._lock:
+            for task in self._tasks.values():
+                task.cancel_event.set()
+                task.future.cancel()
+            self._tasks.clear()
+
+    def shutdown(self):
+        self.cancel_all()
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,199 @@
+"""生成类工具的内容寻址结果缓存。
+
+缓存键 = 工具名 + 规范化后的参数 + 输入文件内容摘要，命中时直接把缓存的
+产物复制到调用方要求的输出路径，跳过远程调用。缓存目录按总大小做 LRU 淘汰：
+进程内第一次写入时扫描一次目录得到总大小，之后按写入量累加，超过上限时才
+重新扫描并淘汰到上限的 EVICT_LOW_WATER 以下。写入先落到临时文件再原子替换，多个进程共享同一目录也不会读到半个文件。
+
+环境变量：
+    TOOLS_CACHE_DIR        缓存目录（默认 ./tmp/cache）
+    TOOLS_CACHE_MAX_BYTES  缓存总大小上限（默认 2GB）
+    TOOLS_CACHE_DISABLE    设为 1 时关闭缓存
+"""
+import functools
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+# 淘汰时降到上限的这个比例以下，留出余量，避免缓存满后每次写入都扫描目录
+EVICT_LOW_WATER = 0.8
+
+# 输入文件摘要缓存：(真实路径, mtime_ns, size) -> sha256
+_digest_memo = {}
+_digest_lock = threading.Lock()
+
+
+def file_digest(path):
+    """计算文件内容的 sha256，同一文件未修改时只计算一次。"""
+    path = Path(path)
+    st = path.stat()
+    memo_key = (str(path.resolve()), st.st_mtime_ns, st.st_size)
+    with _digest_lock:
+        if memo_key in _digest_memo:
+            return _digest_memo[memo_key]
+
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+
+    with _digest_lock:
+        _digest_memo[memo_key] = digest
+    return digest
+
+
+def _atomic_copy(src, dest):
+    """复制到目标目录下的临时文件，再原子替换为目标路径。"""
+    dest = Path(dest)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=dest.parent, prefix=f".{dest.name}.", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out, open(src, "rb") as f:
+            shutil.copyfileobj(f, out, 1024 * 1024)
+        os.replace(tmp_path, dest)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+    return dest
+
+
+class ResultCache:
+    """基于目录的内容寻址缓存，按最近访问时间淘汰。"""
+
+    def __init__(self, root, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # 缓存目录总大小的估计值，None 表示还没有扫描过
+        self._size = None
+
+    def key(self, tool_name, args, file_args=()):
+        """根据工具名、参数和输入文件内容计算缓存键。"""
+        normalized = {}
+        for name, value in sorted(args.items()):
+            if name in file_args and value:
+                normalized[name] = {"sha256": file_digest(value)}
+            else:
+                normalized[name] = value
+        blob = json.dumps([tool_name, normalized], sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def _object_path(self, key):
+        return self.root / "objects" / key[:2] / key
+
+    def get(self, key, dest):
+        """命中时把缓存产物复制到 dest 并返回 dest，未命中返回 None。"""
+        obj = self._object_path(key)
+        try:
+            # 更新访问时间，供 LRU 淘汰使用
+            os.utime(obj)
+            return _atomic_copy(obj, dest)
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, src):
+        """把 src 存入缓存，累计大小超出容量时淘汰最久未访问的条目。"""
+        obj = self._object_path(key)
+        try:
+            replaced = obj.stat().st_size
+        except FileNotFoundError:
+            replaced = 0
+        _atomic_copy(src, obj)
+        with self._lock:
+            if self._size is not None:
+                self._size += obj.stat().st_size - replaced
+        if self._size is None or self._size > self.max_bytes:
+            self.evict()
+        return obj
+
+    def evict(self):
+        """扫描缓存目录；总大小超过上限时淘汰最久未访问的条目，直到降到 EVICT_LOW_WATER 以下。"""
+        with self._lock:
+            entries = []
+            total = 0
+            for obj in (self.root / "objects").glob("*/*"):
+                if obj.name.startswith("."):
+                    continue
+                try:
+                    st = obj.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, obj))
+                total += st.st_size
+
+            entries.sort()
+            target = self.max_bytes * EVICT_LOW_WATER if total > self.max_bytes else total
+            for _, size, obj in entries:
+                if total <= target:
+                    break
+                obj.unlink(missing_ok=True)
+                total -= size
+            self._size = total
+
+
+_default_cache = None
+
+
+def get_cache():
+    """返回进程内共享的默认缓存，关闭缓存时返回 None。"""
+    global _default_cache
+    if os.getenv("TOOLS_CACHE_DISABLE", "").lower() in ("1", "true", "yes"):
+        return None
+    if _default_cache is None:
+        _default_cache = ResultCache(
+            os.getenv("TOOLS_CACHE_DIR", "./tmp/cache"),
+            int(os.getenv("TOOLS_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)),
+        )
+    return _default_cache
+
+
+def cached_tool(out_dir, file_args=(), out_arg="out_name", name=None, variant=None):
+    """为返回输出文件路径的工具函数加上结果缓存。
+
+    放在 @tool 下方使用，保留原函数签名和文档字符串。
+
+    Args:
+        out_dir: 输出目录，输出路径为 out_dir / 参数 out_arg 的值
+        file_args: 值为输入文件路径的参数名，按文件内容参与缓存键
+        out_arg: 输出文件名参数，不参与缓存键
+        name: 缓存键中使用的工具名，默认为函数名
+        variant: 可选的无参函数，返回值参与缓存键（例如当前使用的后端），
+                 使同一组参数在不同实现下的结果互不混用
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+        tool_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            cache = get_cache()
+            if cache is None:
+                return func(*args, **kwargs)
+
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            call_args = dict(bound.arguments)
+            dest = Path(out_dir) / call_args.pop(out_arg)
+            if variant is not None:
+                call_args["__variant__"] = variant()
+
+            key = cache.key(tool_name, call_args, file_args)
+            hit = cache.get(key, dest)
+            if hit is not None:
+                return str(hit)
+
+            result = func(*args, **kwargs)
+            cache.put(key, result)
+            return result
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""生成片段的场景分析、去重与自适应裁剪。
+
+vedios/、video/ 中的生成片段经常首尾重叠（下一段从上一段的末帧续写），
+或者带有长时间几乎静止的画面，直接整段拼接会让成片更长、后续每一步编码更多。
+这里对每个片段只解码一次：ffmpeg 按 ANALYSIS_FPS 抽帧并缩成 72x40 灰度图，
+经 frame_reader 零拷贝读入后用 NumPy 整批计算
+
+    相邻帧差    平均绝对差（0~1），用来找静止片段和场景切换点
+    dHash       8x8 差值感知哈希（64 位），用来找与前面片段重复的画面
+
+然后按片段顺序挑选保留区间：
+
+    - 片段开头与前面已保留片段重复的部分（汉明距离不超过 duplicate_distance）整体去掉，
+      完全重复的片段直接丢弃；切点落在场景切换附近时对齐到切换点
+    - 超过 min_frozen 秒的静止片段只保留开头 hold 秒
+    - 短于 min_segment 秒的零碎区间丢弃
+
+结果是一条 timeline_render 时间线，单次 ffmpeg 调用完成裁剪和拼接；
+没有任何改动的片段不设起止点，全部如此时仍走流复制。
+
+分析结果按（真实路径, mtime_ns, 大小, 采样参数）缓存为 JSON，默认在
+./tmp/scene_cache，可用 SCENE_CACHE 修改，同一片段不会被解码两次。
+numpy 与 frame_reader 中一样是可选依赖：导入本模块不需要，分析和去重时才必须安装。
+
+用法:
+    python scene_analysis.py vedios -o deduped.mp4
+    python scene_analysis.py video/*.mp4 --dry-run
+"""
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import encoding_profiles
+import frame_reader
+import media_probe
+
+try:
+    import numpy as np
+except ImportError:  # numpy 为可选依赖，用到时再报错
+    np = None
+
+# 分析用的抽帧频率和缩放尺寸：72x40 正好分成 9x8 个 8x5 的块，用于 dHash
+ANALYSIS_FPS = 10
+ANALYSIS_SIZE = (72, 40)
+HASH_GRID = (9, 8)
+
+# 缓存格式版本，分析方法变化时递增，旧缓存自动失效
+CACHE_VERSION = 1
+
+# 默认阈值
+FROZEN_THRESHOLD = 0.004   # 相邻帧平均绝对差低于该值视为静止（约 1 个灰度级）
+MIN_FROZEN = 1.0           # 静止超过该时长（秒）才压缩
+HOLD = 0.5                 # 静止片段保留的时长（秒）
+SCENE_THRESHOLD = 0.25     # 相邻帧平均绝对差超过该值视为场景切换
+SNAP_TOLERANCE = 0.5       # 去重切点与场景切换点相距不超过该值（秒）时对齐到切换点
+DUPLICATE_DISTANCE = 6     # dHash 汉明距离不超过该值视为重复画面
+MIN_SEGMENT = 0.5          # 保留区间的最短时长（秒）
+
+# 每个字节中 1 的个数，用于向量化计算汉明距离
+_POPCOUNT = None
+
+_memo = {}
+_memo_lock = threading.Lock()
+
+
+def cache_dir() -> Path:
+    return Path(os.getenv("SCENE_CACHE", "./tmp/scene_cache"))
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("场景分析需要 numpy，请先安装: pip install numpy")
+
+
+def _cache_file(path, fps, size):
+    resolved = os.path.realpath(path)
+    st = os.stat(resolved)
+    key = f"{resolved}|{st.st_mtime_ns}|{st.st_size}|{fps}|{size[0]}x{size[1]}|v{CACHE_VERSION}"
+    return cache_dir() / f"{hashlib.sha1(key.encode('utf-8')).hexdigest()}.json"
+
+
+def _load(cache_file):
+    with _memo_lock:
+        if cache_file in _memo:
+            return _memo[cache_file]
+    try:
+        analysis = json.loads(cache_file.read_text(encoding='utf-8'))
+    except (OSError, json.JSONDecodeError):
+        return None
+    with _memo_lock:
+        _memo[cache_file] = analysis
+    return analysis
+
+
+def _save(cache_file, analysis):
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_file.parent, prefix=f".{cache_file.name}.", suffix=".part")
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(analysis, f)
+    os.replace(tmp_path, cache_file)
+    with _memo_lock:
+        _memo[cache_file] = analysis
+
+
+def clear_cache():
+    """清空内存中的分析结果（磁盘缓存不受影响）。"""
+    with _memo_lock:
+        _memo.clear()
+
+
+def _dhash(frames):
+    """整批计算 dHash：块平均缩到 9x8，比较水平相邻块，得到 (N,) 的 uint64"""
+    n, height, width = frames.shape
+    cols, rows = HASH_GRID
+    blocks = frames.reshape(n, rows, height // rows, cols, width // cols).mean(axis=(2, 4))
+    bits = blocks[:, :, 1:] > blocks[:, :, :-1]
+    return np.packbits(bits.reshape(n, 64), axis=1).view('>u8').ravel().astype(np.uint64)
+
+
+def _hamming(a, b):
+    """a (M,) 与 b (K,) 两两之间的汉明距离，返回 (M, K)"""
+    global _POPCOUNT
+    if _POPCOUNT is None:
+        _POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
+    xor = np.bitwise_xor(a[:, None], b[None, :])
+    return _POPCOUNT[xor.view(np.uint8)].reshape(*xor.shape, 8).sum(axis=-1)
+
+
+def analyze(video_path, fps=ANALYSIS_FPS, size=ANALYSIS_SIZE):
+    """
+    分析一个片段，返回可 JSON 序列化的字典（命中缓存时不解码）
+
+    Returns:
+        {'path', 'duration', 'fps', 'hashes': [十六进制 dHash], 'diffs': [相邻帧平均绝对差]}
+    """
+    cache_file = _cache_file(video_path, fps, size)
+    analysis = _load(cache_file)
+    if analysis is not None:
+        return analysis
+
+    _require_numpy()
+    # 一次解码：抽帧 + 缩放 + 灰度都在 ffmpeg 中完成，Python 端只收到很小的帧
+    frames = list(frame_reader.iter_frames(video_path, filters=[f"fps={fps}"], size=size, pix_fmt='gray'))
+    if not frames:
+        raise Exception(f"视频 {video_path} 中没有可读取的帧")
+    stack = np.stack(frames)[..., 0]
+    diffs = np.abs(np.diff(stack.astype(np.int16), axis=0)).mean(axis=(1, 2)) / 255.0
+
+    duration = media_probe.get_duration(video_path) or len(frames) / fps
+    analysis = {
+        'path': str(video_path),
+        'duration': duration,
+        'fps': fps,
+        'hashes': [f"{h:016x}" for h in _dhash(stack).tolist()],
+        'diffs': [round(d, 5) for d in diffs.tolist()],
+    }
+    _save(cache_file, analysis)
+    return analysis
+
+
+def analyze_many(video_paths, max_workers=None):
+    """并发分析多个片段，返回与 video_paths 顺序一致的列表"""
+    media_probe.probe_many(video_paths)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(analyze, video_paths))
+
+
+def _hashes(analysis):
+    return np.array([int(h, 16) for h in analysis['hashes']], dtype=np.uint64)
+
+
+def scene_cuts(analysis, threshold=SCENE_THRESHOLD):
+    """场景切换的时间点（秒）"""
+    diffs = np.asarray(analysis['diffs'])
+    return ((np.flatnonzero(diffs > threshold) + 1) / analysis['fps']).tolist()
+
+
+def frozen_spans(analysis, threshold=FROZEN_THRESHOLD, min_duration=MIN_FROZEN):
+    """静止画面的区间 [(起点, 终点)]（秒）"""
+    still = np.asarray(analysis['diffs']) < threshold
+    # 连续静止的相邻帧差 [a, b) 对应第 a 到第 b 帧完全相同
+    edges = np.diff(np.concatenate(([0], still.astype(np.int8), [0])))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    fps, duration = analysis['fps'], analysis['duration']
+    spans = []
+    for a, b in zip(starts.tolist(), ends.tolist()):
+        start, end = a / fps, min((b + 1) / fps, duration)
+        if end - start >= min_duration:
+            spans.append((start, end))
+    return spans
+
+
+def duplicate_prefix(analysis, reference, max_distance=DUPLICATE_DISTANCE, chunk=256):
+    """
+    片段开头有多少秒与 reference（前面已保留画面的 dHash 数组）重复
+
+    逐帧判断是否与 reference 中任意一帧足够接近，遇到第一帧不重复的画面即停止；
+    按块计算，片段只在开头重复时不会为整段构造距离矩阵。
+    """
+    hashes = _hashes(analysis)
+    if reference.size == 0 or hashes.size == 0:
+        return 0.0
+    matched = 0
+    for offset in range(0, hashes.size, chunk):
+        close = _hamming(hashes[offset:offset + chunk], reference).min(axis=1) <= max_distance
+        misses = np.flatnonzero(~close)
+        if misses.size:
+            matched = offset + int(misses[0])
+            break
+        matched = offset + close.size
+    if matched >= hashes.size:
+        return analysis['duration']
+    return matched / analysis['fps']
+
+
+def _snap(t, cuts, tolerance):
+    nearest = min(cuts, key=lambda c: abs(c - t), default=None)
+    return nearest if nearest is not None and abs(nearest - t) <= tolerance else t
+
+
+def keep_segments(analysis, reference, frozen_threshold=FROZEN_THRESHOLD, min_frozen=MIN_FROZEN, hold=HOLD,
+                  duplicate_distance=DUPLICATE_DISTANCE, min_segment=MIN_SEGMENT):
+    """
+    片段中要保留的区间 [(起点, 终点)]（秒）
+
+    Args:
+        analysis: analyze() 的结果
+        reference: 前面已保留画面的 dHash 数组，用于去掉与之重复的开头
+    """
+    duration = analysis['duration']
+    start = duplicate_prefix(analysis, reference, duplicate_distance)
+    if 0 < start < duration:
+        start = _snap(start, scene_cuts(analysis), SNAP_TOLERANCE)
+
+    segments = []
+    cursor = start
+    for frozen_start, frozen_end in frozen_spans(analysis, frozen_threshold, min_frozen):
+        if frozen_end <= cursor:
+            continue
+        cut_from = max(frozen_start + hold, cursor)
+        if cut_from > cursor:
+            segments.append((cursor, cut_from))
+        cursor = max(cursor, frozen_end)
+    if cursor < duration:
+        segments.append((cursor, duration))
+    return [(round(s, 3), round(e, 3)) for s, e in segments if e - s >= min_segment]
+
+
+def plan(video_paths, max_workers=None, **options):
+    """
+    分析所有片段并生成去重、裁剪后的时间线
+
+    Args:
+        video_paths: 按播放顺序排列的片段路径
+        max_workers: 并发分析的 ffmpeg 进程数
+        options: 透传给 keep_segments 的阈值
+    Returns:
+        (timeline_render 时间线, 统计信息)
+    """
+    _require_numpy()
+    analyses = analyze_many(video_paths, max_workers)
+    fps = analyses[0]['fps'] if analyses else ANALYSIS_FPS
+
+    clips, kept_hashes = [], []
+    stats = {'input_seconds': 0.0, 'output_seconds': 0.0, 'dropped_clips': 0}
+    for analysis in analyses:
+        duration = analysis['duration']
+        reference = np.concatenate(kept_hashes) if kept_hashes else np.zeros(0, dtype=np.uint64)
+        segments = keep_segments(analysis, reference, **options)
+        stats['input_seconds'] += duration
+        if not segments:
+            stats['dropped_clips'] += 1
+            print(f"丢弃重复/静止片段: {analysis['path']}")
+            continue
+
+        hashes = _hashes(analysis)
+        for start, end in segments:
+            stats['output_seconds'] += end - start
+            if start <= 0 and end >= round(duration, 3):
+                # 整段保留时不设起止点，timeline_render 可以走流复制
+                clips.append({'path': analysis['path']})
+            else:
+                clips.append({'path': analysis['path'], 'start': start, 'end': end})
+            kept_hashes.append(hashes[int(start * fps):int(end * fps) + 1])
+
+    print(f"片段 {len(analyses)} 个，保留 {len(analyses) - stats['dropped_clips']} 个，"
+          f"时长 {stats['input_seconds']:.1f}s -> {stats['output_seconds']:.1f}s")
+    return {'clips': clips}, stats
+
+
+def render_deduplicated(video_paths, output_path, profile=None, max_workers=None, **options):
+    """去重、裁剪后单次渲染成片，返回输出路径"""
+    from timeline_render import render
+
+    timeline, _ = plan(video_paths, max_workers, **options)
+    if not timeline['clips']:
+        raise Exception("去重后没有剩余片段")
+    return render(timeline, output_path, profile=profile)
+
+
+def _expand(inputs):
+    """目录展开为其中的 MP4（按文件名中的数字排序）"""
+    from video_catalog import video_sort_key
+
+    paths = []
+    for item in inputs:
+        item = Path(item)
+        if item.is_dir():
+            paths += sorted(item.glob('*.mp4'), key=video_sort_key)
+        else:
+            paths.append(item)
+    return [str(p) for p in paths]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='分析生成片段，去掉重复/静止画面后拼接')
+    parser.add_argument('inputs', nargs='+', help='片段或片段所在目录（按顺序）')
+    parser.add_argument('-o', '--output', help='输出视频路径')
+    parser.add_argument('--dry-run', action='store_true', help='只打印时间线 JSON，不渲染')
+    parser.add_argument('-p', '--profile', choices=list(encoding_profiles.PROFILES),
+                        default=encoding_profiles.DEFAULT_PROFILE, help='编码档位')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='并发分析的片段数')
+    parser.add_argument('--frozen-threshold', type=float, default=FROZEN_THRESHOLD, help='静止判定的帧差阈值（0~1）')
+    parser.add_argument('--min-frozen', type=float, default=MIN_FROZEN, help='静止超过该时长（秒）才压缩')
+    parser.add_argument('--hold', type=float, default=HOLD, help='静止片段保留的时长（秒）')
+    parser.add_argument('--duplicate-distance', type=int, default=DUPLICATE_DISTANCE,
+                        help='dHash 汉明距离不超过该值视为重复画面（0~64）')
+    parser.add_argument('--min-segment', type=float, default=MIN_SEGMENT, help='保留区间的最短时长（秒）')
+    args = parser.parse_args()
+
+    paths = _expand(args.inputs)
+    if not paths:
+        print("没有找到视频片段")
+        exit(1)
+    options = dict(frozen_threshold=args.frozen_threshold, min_frozen=args.min_frozen, hold=args.hold,
+                   duplicate_distance=args.duplicate_distance, min_segment=args.min_segment)
+
+    try:
+        if args.dry_run or not args.output:
+            timeline, _ = plan(paths, args.jobs, **options)
+            print(json.dumps(timeline, ensure_ascii=False, indent=2))
+        else:
+            render_deduplicated(paths, args.output, args.profile, args.jobs, **options)
+    except Exception as e:
+        print(f"错误: {str(e)}")
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
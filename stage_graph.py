@@ -0,0 +1,142 @@
+"""基于 asyncio 的阶段依赖图调度器。
+
+每个阶段声明自己依赖的上游阶段，调度器在依赖就绪后立即启动该阶段，
+互不依赖的阶段并发执行。同步函数放到线程中运行，这样网络等待和 ffmpeg
+子进程可以与其他阶段重叠；每个阶段可以设置全局并发上限，多个任务
+（多个用户 prompt）共享同一个图时按阶段限流。
+"""
+import asyncio
+import inspect
+import time
+
+import tracing
+
+
+class StageGraph:
+    """阶段依赖图。
+
+    用法::
+
+        graph = StageGraph()
+        graph.add_stage("image", make_image, limit=4)
+        graph.add_stage("video", make_video, deps=["image"], limit=2)
+        results = await graph.run({"prompt": "..."})
+
+    阶段函数的签名为 ``func(ctx, **deps)``：``ctx`` 是本次运行的上下文字典，
+    ``deps`` 以上游阶段名为键传入上游的返回值。
+    """
+
+    def __init__(self):
+        self._stages = {}
+        self._limits = {}
+        self._semaphores = {}
+
+    def add_stage(self, name, func, deps=(), limit=None):
+        """注册一个阶段。
+
+        Args:
+            name: 阶段名，在图内唯一
+            func: 阶段函数，同步或 async 均可
+            deps: 依赖的上游阶段名列表
+            limit: 该阶段同时运行的最大数量（跨所有任务），None 表示不限
+        """
+        if name in self._stages:
+            raise ValueError(f"阶段已存在: {name}")
+        self._stages[name] = (func, tuple(deps))
+        self.set_limit(name, limit)
+
+    def set_limit(self, name, limit):
+        """调整某个阶段的并发上限。"""
+        self._limits[name] = limit
+        self._semaphores.pop(name, None)
+
+    def order(self):
+        """返回拓扑排序后的阶段名列表，发现缺失依赖或环时抛出 ValueError。"""
+        ordered = []
+        state = {}
+
+        def visit(name, path):
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "visiting":
+                raise ValueError(f"阶段依赖存在环: {' -> '.join(path + [name])}")
+            if name not in self._stages:
+                raise ValueError(f"未知的依赖阶段: {name}")
+            state[name] = "visiting"
+            for dep in self._stages[name][1]:
+                visit(dep, path + [name])
+            state[name] = "done"
+            ordered.append(name)
+
+        for name in self._stages:
+            visit(name, [])
+        return ordered
+
+    def _semaphore(self, name):
+        limit = self._limits.get(name)
+        if not limit:
+            return None
+        if name not in self._semaphores:
+            self._semaphores[name] = asyncio.Semaphore(limit)
+        return self._semaphores[name]
+
+    async def _run_stage(self, name, ctx, tasks):
+        func, deps = self._stages[name]
+        kwargs = {dep: await tasks[dep] for dep in deps}
+
+        semaphore = self._semaphore(name)
+        if semaphore is not None:
+            await semaphore.acquire()
+        try:
+            start = time.perf_counter()
+            # to_thread 会复制 contextvars，线程中的工具和子进程 span 挂在阶段 span 下
+            with tracing.span(f"stage.{name}", kind="stage", job_id=str(ctx.get("job_id", ""))):
+                if inspect.iscoroutinefunction(func):
+                    result = await func(ctx, **kwargs)
+                else:
+                    result = await asyncio.to_thread(func, ctx, **kwargs)
+            ctx.setdefault("timings", {})[name] = time.perf_counter() - start
+            return result
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+
+    async def run(self, ctx=None):
+        """执行一次完整的图，返回 {阶段名: 返回值}。
+
+        任一阶段失败时取消其余未完成的阶段并抛出原始异常。
+        """
+        ctx = {} if ctx is None else ctx
+        tasks = {}
+        for name in self.order():
+            tasks[name] = asyncio.create_task(self._run_stage(name, ctx, tasks))
+
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        return {name: task.result() for name, task in tasks.items()}
+
+    async def run_many(self, contexts, max_jobs=None):
+        """并发执行多个任务，返回与 contexts 顺序一致的结果列表。
+
+        单个任务失败不影响其他任务，失败的位置上返回异常对象。
+
+        Args:
+            contexts: 每个任务的上下文字典
+            max_jobs: 同时在途的任务数上限，None 表示不限
+        """
+        job_semaphore = asyncio.Semaphore(max_jobs) if max_jobs else None
+
+        async def run_one(ctx):
+            if job_semaphore is None:
+                return await self.run(ctx)
+            async with job_semaphore:
+                return await self.run(ctx)
+
+        return await asyncio.gather(
+            *(run_one(ctx) for ctx in contexts), return_exceptions=True
+        )
@@ -1,10 +1,10 @@
 import os
 import time
 from pathlib import Path
-from image_generator import text_to_image
+from backends import text_to_images
 def test_text_to_image():
     """
-    测试 text_to_image 函数的各种场景
+    测试批量文生图：所有提示词并发提交（令牌桶限流），按完成顺序输出结果
     """
     # 测试用的提示词列表
     test_prompts = [
@@ -22,45 +22,38 @@ def test_text_to_image():
     output_dir = Path("./test_results")
     output_dir.mkdir(exist_ok=True)
     
-    for i, prompt in enumerate(test_prompts, 1):
-        try:
-            # 为每个提示词生成不同的输出文件名
-            timestamp = time.strftime("%Y%m%d_%H%M%S")
-            output_file = output_dir / f"test_image_{i}_{timestamp}.png"
-            
-            print(f"\n测试 {i}/{len(test_prompts)}:")
-            print(f"提示词: {prompt[:100]}...")
-            print("生成图像中...")
-            
-            # 记录开始时间
-            start_time = time.time()
-            
-            # 调用函数生成图像
-            result_path = text_to_image(prompt, str(output_file))
-            
-            # 计算耗时
-            generation_time = time.time() - start_time
-            
-            # 验证文件是否生成
-            if Path(result_path).exists():
-                file_size = Path(result_path).stat().st_size
-                print(f"✓ 成功生成图像:")
-                print(f"  - 保存路径: {result_path}")
-                print(f"  - 文件大小: {file_size/1024:.2f}KB")
-                print(f"  - 生成耗时: {generation_time:.2f}秒")
-                successful_tests += 1
-            else:
-                print(f"✗ 错误: 文件未生成: {result_path}")
-                failed_tests += 1
-                
-        except Exception as e:
-            print(f"✗ 错误: {str(e)}")
+    # 为每个提示词生成不同的输出文件名
+    timestamp = time.strftime("%Y%m%d_%H%M%S")
+    output_files = [output_dir / f"test_image_{i}_{timestamp}.png" for i in range(1, len(test_prompts) + 1)]
+
+    print("并发生成图像中...")
+    # 记录开始时间
+    start_time = time.time()
+
+    # 批量提交，结果按完成顺序返回，不需要在请求之间等待
+    for index, result in text_to_images(test_prompts, output_files):
+        i = index + 1
+        # 计算耗时（从批量开始算起）
+        generation_time = time.time() - start_time
+
+        print(f"\n测试 {i}/{len(test_prompts)}:")
+        print(f"提示词: {test_prompts[index][:100]}...")
+        if isinstance(result, Exception):
+            print(f"✗ 错误: {str(result)}")
             failed_tests += 1
-        
-        # 测试间隔，避免请求过快
-        if i < len(test_prompts):
-            print("\n等待 3 秒后继续下一个测试...")
-            time.sleep(3)
+        # 验证文件是否生成
+        elif Path(result).exists():
+            file_size = Path(result).stat().st_size
+            print(f"✓ 成功生成图像:")
+            print(f"  - 保存路径: {result}")
+            print(f"  - 文件大小: {file_size/1024:.2f}KB")
+            print(f"  - 完成耗时: {generation_time:.2f}秒")
+            successful_tests += 1
+        else:
+            print(f"✗ 错误: 文件未生成: {result}")
+            failed_tests += 1
+
+    print(f"\n全部完成，总耗时: {time.time() - start_time:.2f}秒")
     
     # 打印测试总结
     print("\n=== 测试结果总结 ===")
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""单次 ffmpeg 调用完成 裁剪 + 拼接 + 配乐 的时间线渲染器。
+
+原来的成片流程是 trim_video -> concat_videos -> concat_audio_files ->
+merge_video_audio，每一步都启动一个 ffmpeg 并写一个完整的中间文件。
+这里把整条时间线描述成一个字典，一次性生成 -filter_complex（或 concat
+demuxer）命令，只解复用/复用一次，不落中间文件。
+
+时间线示例::
+
+    {
+        "clips": [
+            {"path": "video/001.mp4", "trim_end": 10},
+            {"path": "video/002.mp4", "start": 1.5, "end": 6},
+            {"path": "video/003.mp4", "loop": 1}
+        ],
+        "audio": [
+            {"path": "yinpin.mp3", "loop": true, "volume": 0.8}
+        ],
+        "width": 1280, "height": 720, "fps": 30
+    }
+"""
+import argparse
+import json
+import os
+import subprocess
+import tempfile
+from typing import List, TypedDict
+
+import encoding_profiles
+import media_probe
+import tracing
+
+
+class Clip(TypedDict, total=False):
+    path: str
+    start: float      # 片段起点（秒），默认 0
+    end: float        # 片段终点（秒），默认到文件末尾
+    trim_end: float   # 从末尾切掉的秒数，与 trim_video 的 seconds_to_trim 含义相同
+    loop: int         # 额外重复播放的次数，默认 0
+
+
+class AudioTrack(TypedDict, total=False):
+    path: str
+    loop: bool        # 循环铺满整条时间线
+    volume: float     # 音量倍数，默认 1.0
+    offset: float     # 在时间线上开始的位置（秒），默认 0
+
+
+class Timeline(TypedDict, total=False):
+    clips: List[Clip]
+    audio: List[AudioTrack]
+    width: int        # 统一输出分辨率（片段分辨率不一致时需要）
+    height: int
+    fps: float        # 统一输出帧率
+    keep_clip_audio: bool  # 保留片段自带的音轨（要求每个片段都有音轨）
+
+
+def _clip_window(clip):
+    """返回片段的 (起点, 单次播放时长)。"""
+    start = float(clip.get("start", 0))
+    end = clip.get("end")
+    if end is None:
+        end = media_probe.get_duration(clip["path"]) - float(clip.get("trim_end", 0))
+    duration = float(end) - start
+    if duration <= 0:
+        raise ValueError(f"片段 {clip['path']} 的有效时长小于等于 0")
+    return start, duration
+
+
+def _can_stream_copy(timeline):
+    """片段都是完整文件且不需要统一分辨率/帧率时，视频可以直接流复制。"""
+    if timeline.get("width") or timeline.get("height") or timeline.get("fps"):
+        return False
+    if timeline.get("keep_clip_audio"):
+        return False
+    for clip in timeline["clips"]:
+        if clip.get("start") or clip.get("end") is not None or clip.get("trim_end") or clip.get("loop"):
+            return False
+    return True
+
+
+def _escape_concat_path(path):
+    return os.path.abspath(path).replace("'", r"'\''")
+
+
+def _video_normalize_filters(timeline):
+    filters = ["setpts=PTS-STARTPTS"]
+    width, height = timeline.get("width"), timeline.get("height")
+    if width and height:
+        filters += [
+            f"scale={width}:{height}:force_original_aspect_ratio=decrease",
+            f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2",
+            "setsar=1",
+        ]
+    if timeline.get("fps"):
+        filters.append(f"fps={timeline['fps']}")
+    return ",".join(filters)
+
+
+def build_command(timeline, output_path, video_args=None, audio_args=None, list_dir=None, profile=None):
+    """
+    根据时间线生成完整的 ffmpeg 命令。
+
+    Args:
+        timeline: 时间线描述，见模块文档
+        output_path: 输出文件路径
+        video_args: 视频编码参数，默认取自编码档位
+        audio_args: 音频编码参数，默认取自编码档位
+        list_dir: 流复制模式下 concat 列表文件存放的目录
+        profile: 编码档位名（见 encoding_profiles），默认 delivery
+    Returns:
+        (命令参数列表, 需要调用方清理的临时文件列表)
+    """
+    clips = timeline.get("clips") or []
+    if not clips:
+        raise ValueError("时间线中没有任何片段")
+    tracks = timeline.get("audio") or []
+
+    cmd = ["ffmpeg", "-y", "-hide_banner"]
+    filters = []
+    temp_files = []
+    copy_video = _can_stream_copy(timeline)
+
+    if copy_video:
+        # 视频走 concat demuxer 直接流复制，列表文件每次调用唯一，避免并发互相覆盖
+        fd, list_path = tempfile.mkstemp(prefix="timeline_", suffix=".txt", dir=list_dir)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for clip in clips:
+                f.write(f"file '{_escape_concat_path(clip['path'])}'\n")
+        temp_files.append(list_path)
+        total = sum(record["duration"] for record in media_probe.probe_many([clip["path"] for clip in clips]))
+        cmd += ["-f", "concat", "-safe", "0", "-i", list_path]
+        video_label = "0:v:0"
+        next_input = 1
+    else:
+        normalize = _video_normalize_filters(timeline)
+        # 需要源时长的片段一次性批量探测，结果进入缓存供 _clip_window 使用
+        media_probe.probe_many([clip["path"] for clip in clips if clip.get("end") is None])
+        keep_audio = timeline.get("keep_clip_audio", False)
+        concat_inputs = []
+        total = 0.0
+        n = 0
+        for clip in clips:
+            start, duration = _clip_window(clip)
+            loops = int(clip.get("loop", 0))
+            trimmed = bool(start or clip.get("end") is not None or clip.get("trim_end"))
+            if loops and trimmed:
+                # -stream_loop 重新播放时从文件开头开始，-ss/-t 只作用于第一遍，
+                # 所以裁剪过的片段改为把裁剪后的输入重复列出 loop + 1 次
+                passes = [(start, duration)] * (loops + 1)
+            else:
+                if loops:
+                    cmd += ["-stream_loop", str(loops)]
+                passes = [(start, duration * (loops + 1))]
+
+            for pass_start, pass_duration in passes:
+                # 输入端 -ss/-t：直接定位，不解码被裁掉的部分
+                if pass_start:
+                    cmd += ["-ss", f"{pass_start:.3f}"]
+                cmd += ["-t", f"{pass_duration:.3f}", "-i", clip["path"]]
+                total += pass_duration
+
+                filters.append(f"[{n}:v:0]{normalize}[v{n}]")
+                concat_inputs.append(f"[v{n}]")
+                if keep_audio:
+                    filters.append(f"[{n}:a:0]asetpts=PTS-STARTPTS[ca{n}]")
+                    concat_inputs.append(f"[ca{n}]")
+                n += 1
+
+        if keep_audio:
+            filters.append(f"{''.join(concat_inputs)}concat=n={n}:v=1:a=1[vout][clipaudio]")
+        else:
+            filters.append(f"{''.join(concat_inputs)}concat=n={n}:v=1:a=0[vout]")
+        video_label = "[vout]"
+        next_input = n
+
+    audio_labels = ["[clipaudio]"] if not copy_video and timeline.get("keep_clip_audio") else []
+    for j, track in enumerate(tracks):
+        index = next_input + j
+        if track.get("loop"):
+            cmd += ["-stream_loop", "-1"]
+        cmd += ["-i", track["path"]]
+
+        offset = float(track.get("offset", 0))
+        chain = [f"atrim=0:{max(total - offset, 0):.3f}", "asetpts=PTS-STARTPTS"]
+        if track.get("volume", 1.0) != 1.0:
+            chain.append(f"volume={track['volume']}")
+        if offset:
+            chain.append(f"adelay={int(offset * 1000)}:all=1")
+        filters.append(f"[{index}:a:0]{','.join(chain)}[t{j}]")
+        audio_labels.append(f"[t{j}]")
+
+    audio_label = None
+    if len(audio_labels) == 1:
+        audio_label = audio_labels[0]
+    elif audio_labels:
+        filters.append(
+            f"{''.join(audio_labels)}amix=inputs={len(audio_labels)}:duration=longest:normalize=0,"
+            f"atrim=0:{total:.3f}[aout]"
+        )
+        audio_label = "[aout]"
+
+    if filters:
+        cmd += ["-filter_complex", ";".join(filters)]
+    cmd += ["-map", video_label]
+    if audio_label:
+        cmd += ["-map", audio_label]
+
+    cmd += ["-c:v", "copy"] if copy_video else list(video_args or encoding_profiles.video_args(profile))
+    if audio_label:
+        cmd += list(audio_args or encoding_profiles.audio_args(profile))
+    cmd += ["-t", f"{total:.3f}", *encoding_profiles.container_args(profile), str(output_path)]
+    return cmd, temp_files
+
+
+def render(timeline, output_path, video_args=None, audio_args=None, profile=None):
+    """
+    按时间线一次性渲染出成片
+
+    Args:
+        timeline: 时间线描述，见模块文档
+        output_path: 输出视频路径
+        profile: 编码档位名（见 encoding_profiles），默认 delivery
+    Returns:
+        str: 输出视频路径
+    """
+    cmd, temp_files = build_command(timeline, output_path, video_args, audio_args, profile=profile)
+    try:
+        tracing.run(cmd, check=True, capture_output=True, stdin=subprocess.DEVNULL)
+        print(f"成功渲染时间线: {output_path}")
+        return str(output_path)
+    except subprocess.CalledProcessError as e:
+        raise Exception(f"渲染时间线失败: {e.stderr.decode(errors='replace')}")
+    finally:
+        for path in temp_files:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='按 JSON 时间线单次渲染视频')
+    parser.add_argument('timeline', help='时间线 JSON 文件路径')
+    parser.add_argument('output', help='输出视频路径')
+    parser.add_argument('-p', '--profile', choices=list(encoding_profiles.PROFILES),
+                        default=encoding_profiles.DEFAULT_PROFILE, help='编码档位')
+    parser.add_argument('--dry-run', action='store_true', help='只打印 ffmpeg 命令，不执行')
+    args = parser.parse_args()
+
+    with open(args.timeline, encoding='utf-8') as f:
+        timeline = json.load(f)
+
+    try:
+        if args.dry_run:
+            cmd, temp_files = build_command(timeline, args.output, profile=args.profile)
+            print(" ".join(cmd))
+            for path in temp_files:
+                os.remove(path)
+        else:
+            render(timeline, args.output, profile=args.profile)
+    except Exception as e:
+        print(f"错误: {str(e)}")
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
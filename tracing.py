@@ -0,0 +1,384 @@
+"""轻量的链路追踪和指标。
+
+为工具调用、流水线阶段和子进程（ffmpeg/ffprobe）记录 span：墙钟时间、子进程
+CPU 时间、输入/输出字节数、退出码，以及 ffmpeg ``-progress`` 报告的 fps、
+speed 等统计。span 可以导出为 OpenTelemetry（OTLP/JSON）格式，或按名称聚合
+成 Prometheus 文本格式的指标。
+
+默认关闭，关闭时 span() 返回共享的空对象、run() 直接调用 subprocess.run，
+几乎没有额外开销。
+
+环境变量：
+    TOOLS_TRACE             设为 1/true 开启
+    TOOLS_TRACE_FILE        进程退出时把结果写到该文件
+    TOOLS_TRACE_FORMAT      otlp（默认）或 prometheus
+    TOOLS_TRACE_MAX_SPANS   内存中最多保留的 span 数（默认 10000，超出丢弃最旧的）
+
+用法::
+
+    with tracing.span("merge", video=path) as s:
+        tracing.run(["ffmpeg", ...], check=True)
+        s.set(output=out_path)
+
+    @tracing.traced("tool.text_to_image")
+    def text_to_image(...): ...
+"""
+from __future__ import annotations
+
+import atexit
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import os
+import secrets
+import subprocess
+import tempfile
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Optional
+
+_enabled = os.getenv("TOOLS_TRACE", "").lower() in ("1", "true", "yes")
+_spans: deque = deque(maxlen=int(os.getenv("TOOLS_TRACE_MAX_SPANS", 10000)))
+_spans_lock = threading.Lock()
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("tracing_span", default=None)
+
+# ffmpeg -progress 输出中保留的字段
+PROGRESS_FIELDS = ("frame", "fps", "bitrate", "total_size", "out_time_us", "speed", "dup_frames", "drop_frames")
+
+# Prometheus 直方图的桶边界（秒）
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable(flag: bool = True):
+    """在代码中开启或关闭追踪（覆盖 TOOLS_TRACE）"""
+    global _enabled
+    _enabled = flag
+
+
+class Span:
+    """一次被追踪的操作。attributes 中的值应为 str/int/float/bool。"""
+
+    __slots__ = ("name", "kind", "trace_id", "span_id", "parent_id",
+                 "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, kind: str, parent: Optional["Span"], attributes: Dict):
+        self.name = name
+        self.kind = kind
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = dict(attributes)
+        self.error: Optional[str] = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def duration(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_s": self.duration,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    """追踪关闭时使用的空 span"""
+
+    def set(self, **attributes):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+@contextlib.contextmanager
+def span(name: str, kind: str = "internal", **attributes):
+    """记录一个 span，嵌套的 span 自动成为子 span（跨线程需经 contextvars 传递）"""
+    if not _enabled:
+        yield _NOOP
+        return
+
+    current = Span(name, kind, _current.get(), attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _current.reset(token)
+        with _spans_lock:
+            _spans.append(current)
+
+
+def traced(name: Optional[str] = None, kind: str = "internal"):
+    """为函数加上 span 的装饰器，支持同步和异步函数，保留原函数签名"""
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not _enabled:
+                    return await func(*args, **kwargs)
+                with span(span_name, kind):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with span(span_name, kind):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+# ---- 子进程 ----
+
+class _RusagePopen(subprocess.Popen):
+    """回收子进程时用 wait4 顺便取得它自己的资源用量（不受并发的其他子进程影响）"""
+
+    rusage = None
+
+    def _try_wait(self, wait_flags):
+        try:
+            pid, sts, rusage = os.wait4(self.pid, wait_flags)
+        except ChildProcessError:
+            return self.pid, 0
+        if pid:
+            self.rusage = rusage
+        return pid, sts
+
+
+def _file_size(path) -> Optional[int]:
+    try:
+        return os.stat(path).st_size
+    except (OSError, TypeError, ValueError):
+        return None
+
+
+def _media_files(cmd: List[str]):
+    """从 ffmpeg/ffprobe 命令行中找出输入文件和输出文件"""
+    inputs = [cmd[i + 1] for i, arg in enumerate(cmd[:-1]) if arg == "-i"]
+    output = None
+    # ffmpeg 的最后一个参数是输出（管道输出和 -f null - 除外）
+    if Path(cmd[0]).name == "ffmpeg" and len(cmd) > 2 and cmd[-2] != "-i" \
+            and not cmd[-1].startswith(("-", "pipe:")):
+        output = cmd[-1]
+    if Path(cmd[0]).name == "ffprobe":
+        inputs.append(cmd[-1])
+    return inputs, output
+
+
+def _parse_progress(path: str) -> Dict:
+    """解析 ffmpeg -progress 的最后一组 key=value"""
+    stats = {}
+    try:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                key, sep, value = line.strip().partition("=")
+                if sep and key in PROGRESS_FIELDS:
+                    stats[key] = value
+    except OSError:
+        return {}
+
+    parsed = {}
+    for key, value in stats.items():
+        value = value.strip()
+        if key == "speed":
+            value = value.rstrip("x")
+        elif key == "bitrate":
+            value = value.replace("kbits/s", "")
+        try:
+            parsed[f"ffmpeg.{key}"] = float(value) if "." in value else int(value)
+        except ValueError:
+            continue
+    return parsed
+
+
+def run(cmd, *, input=None, capture_output=False, timeout=None, check=False, **kwargs):
+    """subprocess.run 的替代，开启追踪时为子进程记录一个 span。
+
+    ffmpeg 命令会额外加上 -progress 写到临时文件，结束后解析其中的统计。
+    """
+    if not _enabled:
+        return subprocess.run(cmd, input=input, capture_output=capture_output,
+                              timeout=timeout, check=check, **kwargs)
+
+    cmd = [str(c) for c in cmd]
+    program = Path(cmd[0]).name
+    inputs, output = _media_files(cmd)
+    progress_path = None
+    if program == "ffmpeg":
+        fd, progress_path = tempfile.mkstemp(prefix="ffprogress_", suffix=".txt")
+        os.close(fd)
+        cmd = [cmd[0], "-progress", progress_path, *cmd[1:]]
+
+    if capture_output:
+        kwargs["stdout"] = subprocess.PIPE
+        kwargs["stderr"] = subprocess.PIPE
+    if input is not None:
+        kwargs["stdin"] = subprocess.PIPE
+
+    with span(f"subprocess.{program}", kind="subprocess", argv=" ".join(cmd)) as s:
+        s.set(bytes_in=sum(_file_size(p) or 0 for p in inputs))
+        try:
+            with _RusagePopen(cmd, **kwargs) as process:
+                try:
+                    stdout, stderr = process.communicate(input, timeout=timeout)
+                except BaseException:
+                    process.kill()
+                    process.wait()
+                    raise
+                returncode = process.poll()
+        finally:
+            if progress_path:
+                s.set(**_parse_progress(progress_path))
+                os.unlink(progress_path)
+
+        s.set(exit_code=returncode)
+        if process.rusage is not None:
+            s.set(cpu_user_s=process.rusage.ru_utime, cpu_system_s=process.rusage.ru_stime,
+                  max_rss_kb=process.rusage.ru_maxrss)
+        if output is not None:
+            s.set(bytes_out=_file_size(output) or 0)
+        elif stdout is not None:
+            s.set(bytes_out=len(stdout))
+
+        result = subprocess.CompletedProcess(cmd, returncode, stdout, stderr)
+        if check:
+            result.check_returncode()
+        return result
+
+
+# ---- 导出 ----
+
+def spans() -> List[Span]:
+    with _spans_lock:
+        return list(_spans)
+
+
+def clear():
+    with _spans_lock:
+        _spans.clear()
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def export_otlp(service_name: str = "media-tools") -> Dict:
+    """导出为 OTLP/JSON（ExportTraceServiceRequest）结构"""
+    otlp_spans = []
+    for s in spans():
+        attributes = {**s.attributes, "span.kind": s.kind}
+        otlp_spans.append({
+            "traceId": s.trace_id,
+            "spanId": s.span_id,
+            **({"parentSpanId": s.parent_id} if s.parent_id else {}),
+            "name": s.name,
+            # 子进程视为对外调用（CLIENT=3），其余为内部操作（INTERNAL=1）
+            "kind": 3 if s.kind == "subprocess" else 1,
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in attributes.items()],
+            "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+        })
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]},
+            "scopeSpans": [{"scope": {"name": "tracing"}, "spans": otlp_spans}],
+        }]
+    }
+
+
+def _labels(**labels) -> str:
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return ",".join(f'{k}="{escape(v)}"' for k, v in labels.items())
+
+
+def export_prometheus() -> str:
+    """按 (kind, name) 聚合成 Prometheus 文本格式"""
+    groups: Dict[tuple, List[Span]] = {}
+    for s in spans():
+        groups.setdefault((s.kind, s.name), []).append(s)
+
+    lines = [
+        "# HELP tools_span_duration_seconds Span wall time.",
+        "# TYPE tools_span_duration_seconds histogram",
+    ]
+    for (kind, name), items in sorted(groups.items()):
+        durations = [s.duration for s in items]
+        for bound in DURATION_BUCKETS:
+            count = sum(1 for d in durations if d <= bound)
+            lines.append(f'tools_span_duration_seconds_bucket{{{_labels(kind=kind, name=name, le=bound)}}} {count}')
+        lines.append(f'tools_span_duration_seconds_bucket{{{_labels(kind=kind, name=name, le="+Inf")}}} {len(items)}')
+        lines.append(f'tools_span_duration_seconds_sum{{{_labels(kind=kind, name=name)}}} {sum(durations)}')
+        lines.append(f'tools_span_duration_seconds_count{{{_labels(kind=kind, name=name)}}} {len(items)}')
+
+    counters = [
+        ("tools_span_errors_total", "Spans that ended with an error.", lambda s: 1 if s.error else 0),
+        ("tools_subprocess_cpu_seconds_total", "Subprocess user+system CPU time.",
+         lambda s: s.attributes.get("cpu_user_s", 0) + s.attributes.get("cpu_system_s", 0)),
+        ("tools_subprocess_bytes_in_total", "Bytes of subprocess input files.", lambda s: s.attributes.get("bytes_in", 0)),
+        ("tools_subprocess_bytes_out_total", "Bytes of subprocess output.", lambda s: s.attributes.get("bytes_out", 0)),
+    ]
+    for metric, help_text, value in counters:
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+        for (kind, name), items in sorted(groups.items()):
+            lines.append(f'{metric}{{{_labels(kind=kind, name=name)}}} {sum(value(s) for s in items)}')
+    return "\n".join(lines) + "\n"
+
+
+def flush(path=None, fmt: Optional[str] = None):
+    """把当前收集到的 span 写到文件（默认 TOOLS_TRACE_FILE），返回写入的路径"""
+    path = path or os.getenv("TOOLS_TRACE_FILE")
+    if not path:
+        return None
+    fmt = fmt or os.getenv("TOOLS_TRACE_FORMAT", "otlp")
+    if fmt == "prometheus":
+        text = export_prometheus()
+    elif fmt == "otlp":
+        text = json.dumps(export_otlp(), ensure_ascii=False, indent=2)
+    else:
+        raise ValueError(f"不支持的导出格式: {fmt}，可选: otlp, prometheus")
+    Path(path).write_text(text, encoding="utf-8")
+    return path
+
+
+@atexit.register
+def _flush_at_exit():
+    if _enabled and spans():
+        flush()
@@ -1,26 +1,141 @@
+import argparse
+import json
 import subprocess
 import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
+import encoding_profiles
+import media_probe
+import tracing
+
 def get_video_duration(video_path):
-    """获取视频时长（秒）"""
+    """获取视频时长（秒），结果由 media_probe 按文件缓存"""
+    return media_probe.get_duration(video_path)
+
+# 智能裁剪时，与源视频编码对应的重编码器
+SMART_CUT_ENCODERS = {
+    'h264': ('libx264', 'h264_mp4toannexb'),
+    'hevc': ('libx265', 'hevc_mp4toannexb'),
+}
+TRIM_MODES = ('copy', 'smart', 'reencode')
+KEYFRAME_EPSILON = 0.001
+
+def _encode_args(stream, profile=None, threads=None):
+    """重编码边界片段时尽量与源视频流的参数保持一致，便于直接拼接"""
+    encoder, _ = SMART_CUT_ENCODERS.get(stream['codec_name'], ('libx264', None))
+    args = encoding_profiles.video_args(profile, encoder, threads, pix_fmt=stream.get('pix_fmt'))
+    if stream.get('fps'):
+        args += ['-r', f"{stream['fps']:.6f}"]
+    profile = (stream.get('profile') or '').lower()
+    if encoder == 'libx264' and profile in ('baseline', 'constrained baseline', 'main', 'high'):
+        args += ['-profile:v', profile.replace('constrained ', '')]
+    return args
+
+def _cut_segment(input_path, segment_path, start, duration, video_args, quiet):
+    """把 [start, start+duration) 的视频流写成一个 MPEG-TS 片段"""
     cmd = [
-        'ffprobe', 
-        '-v', 'error',
-        '-show_entries', 'format=duration',
-        '-of', 'default=noprint_wrappers=1:nokey=1',
-        video_path
+        'ffmpeg', '-y',
+        '-ss', f"{start:.6f}",
+        '-i', str(input_path),
+        '-t', f"{duration:.6f}",
+        '-map', '0:v:0',
+        *video_args,
+        '-avoid_negative_ts', 'make_zero',
+        '-f', 'mpegts',
+        str(segment_path)
     ]
-    output = subprocess.check_output(cmd).decode().strip()
-    return float(output)
+    tracing.run(cmd, check=True, capture_output=quiet, stdin=subprocess.DEVNULL)
 
-def trim_video(input_path, output_path, seconds_to_trim=10):
+def smart_cut(input_path, output_path, start=0.0, end=None, quiet=False, profile=None, threads=None):
+    """
+    帧精确裁剪 [start, end)，只重编码切点所在的不完整 GOP
+
+    两个切点之间的完整 GOP 直接流复制，切点到相邻关键帧之间的部分用与源一致的
+    参数重编码，最后把几段视频和源音频在一次 ffmpeg 调用中拼接输出。
+    :param input_path: 输入视频路径
+    :param output_path: 输出视频路径
+    :param start: 起点（秒）
+    :param end: 终点（秒），默认到视频末尾
+    :param quiet: 不把 ffmpeg 的输出打印到终端
+    :param profile: 边界片段的编码档位（见 encoding_profiles）
+    :param threads: 编码线程数，默认见 encoding_profiles.default_threads
+    """
+    record = media_probe.probe(input_path, keyframes=True)
+    stream = media_probe.first_stream(record, 'video')
+    if stream is None:
+        raise Exception(f"视频 {input_path} 中没有视频流")
+    end = record['duration'] if end is None else end
+    if end - start <= 0:
+        raise ValueError(f"裁剪区间无效: [{start}, {end})")
+
+    # 关键帧时间是绝对 pts，-ss 相对容器的 start_time，先换算到同一时间轴
+    keyframes = [k - record['start_time'] for k in record['keyframes']]
+    keyframes = [k for k in keyframes if start - KEYFRAME_EPSILON <= k <= end + KEYFRAME_EPSILON]
+    encode_args = _encode_args(stream, profile, threads)
+    bsf = SMART_CUT_ENCODERS.get(stream['codec_name'], (None, None))[1]
+
+    # 片段列表: (起点, 时长, 是否流复制)
+    segments = []
+    if stream['codec_name'] not in SMART_CUT_ENCODERS or not keyframes:
+        segments.append((start, end - start, False))
+    else:
+        first_key, last_key = keyframes[0], keyframes[-1]
+        if first_key - start > KEYFRAME_EPSILON:
+            segments.append((start, first_key - start, False))
+        if last_key - first_key > KEYFRAME_EPSILON:
+            segments.append((first_key, last_key - first_key, True))
+        if end - last_key > KEYFRAME_EPSILON:
+            segments.append((last_key, end - last_key, False))
+
+    work_dir = Path(tempfile.mkdtemp(prefix='smart_cut_', dir=Path(output_path).parent))
+    try:
+        list_path = work_dir / 'segments.txt'
+        with open(list_path, 'w', encoding='utf-8') as f:
+            for i, (seg_start, seg_duration, copy) in enumerate(segments):
+                segment_path = work_dir / f"{i:03d}.ts"
+                video_args = ['-c:v', 'copy', '-bsf:v', bsf] if copy else encode_args
+                _cut_segment(input_path, segment_path, seg_start, seg_duration, video_args, quiet)
+                f.write(f"file '{segment_path.name}'\n")
+
+        cmd = [
+            'ffmpeg', '-y',
+            '-f', 'concat', '-safe', '0', '-i', str(list_path),
+            '-ss', f"{start:.6f}", '-t', f"{end - start:.6f}", '-i', str(input_path),
+            '-map', '0:v:0',
+            '-map', '1:a?',
+            '-c:v', 'copy',
+            *encoding_profiles.audio_args(profile),
+            *encoding_profiles.container_args(profile),
+            str(output_path)
+        ]
+        tracing.run(cmd, check=True, capture_output=quiet, stdin=subprocess.DEVNULL)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return str(output_path)
+
+def trim_video(input_path, output_path, seconds_to_trim=10, quiet=False, mode='copy', profile=None, threads=None):
     """
     从视频末尾切除指定秒数
     :param input_path: 输入视频路径
     :param output_path: 输出视频路径
     :param seconds_to_trim: 要从末尾切除的秒数（默认10秒）
+    :param quiet: 不打印任何输出（包括 ffmpeg 的输出），出错时直接抛出异常（批量并发和服务调用时使用）
+    :param mode: copy 直接流复制（最快，切点对齐到关键帧）；
+                 smart 只重编码切点所在 GOP（帧精确，接近流复制速度）；
+                 reencode 整体重编码（帧精确，最慢）
+    :param profile: smart/reencode 模式的编码档位（见 encoding_profiles）
+    :param threads: 编码线程数，默认见 encoding_profiles.default_threads
     """
+    if mode not in TRIM_MODES:
+        raise ValueError(f"未知的裁剪模式: {mode}，可选: {', '.join(TRIM_MODES)}")
+    # 先写到同目录下的临时文件，成功后再原子替换，失败或中断时不会留下不完整的输出
+    output_path = Path(output_path)
+    tmp_path = output_path.with_name(f".{output_path.stem}.{threading.get_ident()}{output_path.suffix}")
     try:
         # 获取视频总时长
         duration = get_video_duration(input_path)
@@ -29,44 +144,200 @@ def trim_video(input_path, output_path, seconds_to_trim=10):
         new_duration = duration - seconds_to_trim
         
         if new_duration <= 0:
-            print(f"错误: 视频 {input_path} 长度小于 {seconds_to_trim} 秒")
-            return False
+            raise ValueError(f"视频 {input_path} 长度小于 {seconds_to_trim} 秒")
             
-        # 使用ffmpeg切除最后10秒
-        cmd = [
-            'ffmpeg',
-            '-i', input_path,
-            '-t', str(new_duration),
-            '-c', 'copy',  # 复制编解码器，不重新编码
-            '-y',  # 覆盖输出文件（如果存在）
-            output_path
-        ]
-        
-        subprocess.run(cmd, check=True)
-        print(f"成功处理视频: {output_path}")
+        if mode == 'smart':
+            smart_cut(input_path, tmp_path, 0.0, new_duration, quiet=quiet, profile=profile, threads=threads)
+        else:
+            # 使用ffmpeg切除最后10秒
+            if mode == 'copy':
+                codec_args = ['-c', 'copy']
+            else:
+                codec_args = [
+                    *encoding_profiles.video_args(profile, threads=threads),
+                    *encoding_profiles.audio_args(profile),
+                    *encoding_profiles.container_args(profile),
+                ]
+            cmd = [
+                'ffmpeg',
+                '-i', input_path,
+                '-t', str(new_duration),
+                *codec_args,  # copy 模式复制编解码器，不重新编码
+                '-y',  # 覆盖输出文件（如果存在）
+                str(tmp_path)
+            ]
+
+            tracing.run(cmd, check=True, capture_output=quiet, stdin=subprocess.DEVNULL)
+        # 替换输出前先删掉旧的参数记录，替换后再写新的，中途中断时输出只会被视为过期
+        params_path = _params_path(output_path)
+        params_path.unlink(missing_ok=True)
+        os.replace(tmp_path, output_path)
+        with open(params_path, 'w', encoding='utf-8') as f:
+            json.dump(_trim_params(seconds_to_trim, mode, profile), f)
+        if not quiet:
+            print(f"成功处理视频: {output_path}")
         return True
         
     except subprocess.CalledProcessError as e:
+        if quiet:
+            raise
         print(f"处理视频时出错: {e}")
         return False
     except Exception as e:
+        if quiet:
+            raise
         print(f"发生错误: {e}")
         return False
+    finally:
+        tmp_path.unlink(missing_ok=True)
 
-if __name__ == "__main__":
-    # 获取当前目录下所有mp4文件
-    video_files = list(Path('.').glob('*.mp4'))
-    
-    if not video_files:
-        print("当前目录下没有找到MP4文件")
-        exit(1)
-        
-    # 创建输出目录
-    output_dir = Path('trimmed_videos')
-    output_dir.mkdir(exist_ok=True)
-    
-    # 处理每个视频文件
+def _params_path(output_path):
+    """记录输出文件裁剪参数的旁路文件"""
+    output_path = Path(output_path)
+    return output_path.with_name(f"{output_path.name}.trim.json")
+
+def _trim_params(seconds_to_trim, mode, profile):
+    # copy 模式不重编码，编码档位不影响输出
+    return {"seconds": float(seconds_to_trim), "mode": mode, "profile": None if mode == 'copy' else profile}
+
+def is_up_to_date(input_path, output_path, seconds_to_trim=None, mode='copy', profile=None):
+    """输出文件存在、不早于输入文件，且是用相同的裁剪参数生成的时视为已是最新
+
+    不指定 seconds_to_trim 时只比较修改时间
+    """
+    try:
+        if os.path.getmtime(output_path) < os.path.getmtime(input_path):
+            return False
+        if seconds_to_trim is None:
+            return True
+        with open(_params_path(output_path), encoding='utf-8') as f:
+            return json.load(f) == _trim_params(seconds_to_trim, mode, profile)
+    except (OSError, ValueError):
+        return False
+
+def _trim_job(input_path, output_path, seconds_to_trim, mode, profile, threads):
+    start = time.perf_counter()
+    ok = trim_video(str(input_path), str(output_path), seconds_to_trim, quiet=True, mode=mode,
+                    profile=profile, threads=threads)
+    return ok, time.perf_counter() - start
+
+def trim_videos(video_files, output_dir='trimmed_videos', seconds_to_trim=10, max_workers=None, force=False, mode='copy',
+                profile=None):
+    """
+    并发批量裁剪视频
+    :param video_files: 输入视频路径列表
+    :param output_dir: 输出目录，输出文件名为 trimmed_<原文件名>
+    :param seconds_to_trim: 要从末尾切除的秒数
+    :param max_workers: 并发数，默认等于 CPU 核数
+    :param force: 为 True 时即使输出已是最新也重新处理
+    :param mode: 裁剪模式，见 trim_video
+    :param profile: smart/reencode 模式的编码档位
+    :return: 每个文件的结果列表和汇总信息 (results, summary)
+    """
+    video_files = [Path(p) for p in video_files]
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    max_workers = max_workers or os.cpu_count() or 1
+    # 并发的编码任务分摊 CPU 核，避免每个 ffmpeg 都按全部核数开线程互相争抢
+    threads = max(encoding_profiles.default_threads() // max_workers, 1)
+
+    results = []
+    jobs = []
     for video_file in video_files:
         output_path = output_dir / f"trimmed_{video_file.name}"
-        print(f"\n处理视频: {video_file}")
-        trim_video(str(video_file), str(output_path))
+        if not force and is_up_to_date(video_file, output_path, seconds_to_trim, mode, profile):
+            results.append({"input": str(video_file), "output": str(output_path), "status": "skipped", "seconds": 0.0})
+        else:
+            jobs.append((video_file, output_path))
+
+    # 先批量探测时长，避免每个任务各自排队启动 ffprobe
+    if jobs:
+        try:
+            media_probe.probe_many([video_file for video_file, _ in jobs], keyframes=mode == 'smart', max_workers=max_workers)
+        except Exception as e:
+            print(f"批量探测失败，将逐个探测: {e}")
+
+    # 每个任务的实际工作在 ffmpeg 子进程里完成，线程池只负责等待，开销比进程池小
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(_trim_job, video_file, output_path, seconds_to_trim, mode, profile, threads): (video_file, output_path)
+            for video_file, output_path in jobs
+        }
+        for future in as_completed(futures):
+            video_file, output_path = futures[future]
+            try:
+                ok, seconds = future.result()
+            except Exception as e:
+                print(f"处理视频 {video_file} 时出错: {e}")
+                ok, seconds = False, 0.0
+            print(f"[{len(results) + 1}/{len(video_files)}] {video_file.name}: {'完成' if ok else '失败'} ({seconds:.2f}秒)")
+            results.append({
+                "input": str(video_file),
+                "output": str(output_path),
+                "status": "ok" if ok else "failed",
+                "seconds": seconds,
+            })
+    wall_time = time.perf_counter() - wall_start
+
+    processed = [r for r in results if r["status"] == "ok"]
+    input_bytes = sum(os.path.getsize(r["input"]) for r in processed)
+    summary = {
+        "total": len(results),
+        "ok": len(processed),
+        "skipped": sum(r["status"] == "skipped" for r in results),
+        "failed": sum(r["status"] == "failed" for r in results),
+        "workers": max_workers,
+        "wall_seconds": wall_time,
+        "files_per_second": len(processed) / wall_time if wall_time else 0.0,
+        "mb_per_second": input_bytes / 1024 / 1024 / wall_time if wall_time else 0.0,
+    }
+    return results, summary
+
+def collect_videos(paths):
+    """把文件和目录参数展开为 mp4 文件列表"""
+    video_files = []
+    for p in map(Path, paths):
+        if p.is_dir():
+            video_files += sorted(p.glob('*.mp4'))
+        elif p.is_file():
+            video_files.append(p)
+        else:
+            print(f"警告: 找不到 {p}，已跳过")
+    return video_files
+
+def main():
+    parser = argparse.ArgumentParser(description='批量从视频末尾切除指定秒数')
+    parser.add_argument('paths', nargs='*', default=['.'], help='输入视频文件或目录（默认当前目录）')
+    parser.add_argument('-o', '--output-dir', default='trimmed_videos', help='输出目录')
+    parser.add_argument('-s', '--seconds', type=float, default=10, help='要从末尾切除的秒数')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='并发数（默认 CPU 核数）')
+    parser.add_argument('-m', '--mode', choices=TRIM_MODES, default='copy', help='裁剪模式: copy 流复制 / smart 智能裁剪 / reencode 整体重编码')
+    parser.add_argument('-p', '--profile', choices=list(encoding_profiles.PROFILES),
+                        default=encoding_profiles.DEFAULT_PROFILE, help='smart/reencode 模式的编码档位')
+    parser.add_argument('--force', action='store_true', help='忽略已是最新的输出，全部重新处理')
+    parser.add_argument('--report', help='把逐文件耗时和汇总写入 JSON 文件')
+    args = parser.parse_args()
+
+    video_files = collect_videos(args.paths)
+    if not video_files:
+        print("没有找到MP4文件")
+        exit(1)
+
+    results, summary = trim_videos(video_files, args.output_dir, args.seconds, args.jobs, args.force, args.mode,
+                                   args.profile)
+
+    print("\n=== 处理结果 ===")
+    print(f"成功: {summary['ok']}  跳过: {summary['skipped']}  失败: {summary['failed']}")
+    print(f"并发数: {summary['workers']}  总耗时: {summary['wall_seconds']:.2f}秒")
+    print(f"吞吐量: {summary['files_per_second']:.2f} 个/秒, {summary['mb_per_second']:.2f} MB/秒")
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({"results": results, "summary": summary}, f, ensure_ascii=False, indent=2)
+
+    if summary['failed']:
+        exit(1)
+
+if __name__ == "__main__":
+    main()
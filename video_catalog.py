@@ -0,0 +1,126 @@
+"""按轮次索引的视频目录缓存。
+
+目录只在内容变化时重新扫描：每次查询最多每隔 poll_interval 秒 stat 一次目录，
+目录的 mtime 没变（没有增删改名）就直接用内存中的索引，按轮次查找是 O(1)。
+视频的元数据按需通过 media_probe 探测并缓存。
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, TypedDict
+
+import media_probe
+from extract_last_frame import extract_last_frame
+
+
+class CatalogEntry(TypedDict):
+    turn: int
+    path: Path
+    size: int
+    mtime_ns: int
+
+
+def video_sort_key(path: Path):
+    """按文件名中的数字排序，不含数字的文件排在后面并按名称排序。"""
+    digits = ''.join(filter(str.isdigit, path.stem))
+    if digits:
+        return (0, int(digits), path.stem)
+    return (1, 0, path.stem)
+
+
+class VideoCatalog:
+    """视频目录的内存索引。
+
+    Args:
+        video_dir: 视频目录
+        pattern: 文件匹配模式
+        poll_interval: 两次检查目录是否变化的最小间隔（秒）
+    """
+
+    def __init__(self, video_dir: Path, pattern: str = "*.mp4", poll_interval: float = 1.0):
+        self.video_dir = Path(video_dir)
+        self.pattern = pattern
+        self.poll_interval = poll_interval
+        self._entries: tuple = ()
+        self._dir_mtime_ns: Optional[int] = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self._frame_locks: dict = {}
+
+    def _scan(self) -> tuple:
+        entries = []
+        videos = sorted(
+            (f for f in self.video_dir.glob(self.pattern) if f.is_file() and os.access(f, os.R_OK)),
+            key=video_sort_key,
+        )
+        for turn, path in enumerate(videos):
+            st = path.stat()
+            entries.append(CatalogEntry(turn=turn, path=path, size=st.st_size, mtime_ns=st.st_mtime_ns))
+        return tuple(entries)
+
+    def refresh(self, force: bool = False) -> bool:
+        """目录发生变化时重新扫描，返回是否重新扫描了。"""
+        now = time.monotonic()
+        if not force and now - self._last_check < self.poll_interval:
+            return False
+
+        with self._lock:
+            self._last_check = now
+            try:
+                dir_mtime_ns = self.video_dir.stat().st_mtime_ns
+            except FileNotFoundError:
+                raise FileNotFoundError(f"视频目录不存在: {self.video_dir}")
+            if not force and dir_mtime_ns == self._dir_mtime_ns:
+                return False
+            # 先扫描再整体替换，查询方始终看到一份完整的索引
+            self._entries = self._scan()
+            self._dir_mtime_ns = dir_mtime_ns
+            return True
+
+    def entries(self) -> List[CatalogEntry]:
+        self.refresh()
+        return list(self._entries)
+
+    def __len__(self) -> int:
+        self.refresh()
+        return len(self._entries)
+
+    def get(self, turn: int) -> CatalogEntry:
+        """按轮次获取视频，轮次越界时抛出 ValueError。"""
+        self.refresh()
+        entries = self._entries
+        if not entries:
+            raise FileNotFoundError(f"在 {self.video_dir} 目录下未找到任何 MP4 视频文件")
+        if turn < 0 or turn >= len(entries):
+            raise ValueError(f"视频轮次 {turn} 超出范围，当前共有 {len(entries)} 个视频文件")
+        return entries[turn]
+
+    def metadata(self, turn: int) -> dict:
+        """按轮次获取视频的元数据（由 media_probe 缓存）。"""
+        return media_probe.probe(self.get(turn)["path"])
+
+    def last_frame(self, turn: int, frame_dir: Path) -> Path:
+        """按轮次获取视频最后一帧图片，首次请求时提取，之后直接复用。
+
+        图片文件名包含视频的 mtime，视频被替换后会重新提取。
+        """
+        entry = self.get(turn)
+        frame_dir = Path(frame_dir)
+        frame_path = frame_dir / f"{entry['path'].stem}-{entry['mtime_ns']}.png"
+        if frame_path.exists():
+            return frame_path
+
+        with self._lock:
+            frame_lock = self._frame_locks.setdefault(frame_path, threading.Lock())
+        # 每张图片单独加锁：同一视频并发请求只提取一次，不同视频互不阻塞
+        with frame_lock:
+            if not frame_path.exists():
+                frame_dir.mkdir(parents=True, exist_ok=True)
+                # 先提取到临时文件名再改名，并发请求不会读到写了一半的图片
+                tmp_path = frame_path.with_name(f".{frame_path.stem}.{threading.get_ident()}.png")
+                extract_last_frame(entry["path"], tmp_path, verbose=False)
+                os.replace(tmp_path, frame_path)
+        return frame_path
@@ -1,52 +1,242 @@
+import argparse
+import asyncio
+import fnmatch
 import os
 import subprocess
+import tempfile
+from pathlib import Path
 
-def concat_videos(input_dir='.', output_file='output.mp4', pattern='*.mp4'):
+import media_probe
+import tracing
+
+# 流式拼接的输出格式对应的 ffmpeg 参数
+STREAM_FORMATS = ('mp4', 'hls')
+
+# 与视频编码对应的 MP4 -> Annex B 比特流过滤器，MPEG-TS 中转时需要
+ANNEXB_FILTERS = {
+    'h264': 'h264_mp4toannexb',
+    'hevc': 'hevc_mp4toannexb',
+}
+
+
+def _write_file_list(paths, list_dir=None):
+    """把待拼接的文件写入唯一命名的 concat 列表文件，返回列表文件路径"""
+    fd, list_path = tempfile.mkstemp(prefix='concat_', suffix='.txt', dir=list_dir)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        for path in paths:
+            # concat 列表中单引号需要转义
+            escaped = os.path.abspath(path).replace("'", r"'\''")
+            f.write(f"file '{escaped}'\n")
+    return list_path
+
+
+def concat_videos(input_dir='.', output_file='output.mp4', pattern='*.mp4', files=None, quiet=False):
     """
     将指定目录下的所有MP4视频按文件名顺序拼接成一个视频
-    
+
     Args:
         input_dir (str): 输入视频文件所在目录
         output_file (str): 输出视频文件名
         pattern (str): 文件匹配模式
+        files (list): 直接指定待拼接的文件列表（按给定顺序），指定时忽略 input_dir 和 pattern
+        quiet (bool): 不打印任何输出，失败时直接抛出异常（供 MCP 等服务调用）
     """
-    # 获取所有mp4文件并排序
-    video_files = [f for f in os.listdir(input_dir) if f.endswith('.mp4')]
-    video_files.sort()  # 按文件名排序
-    
-    if not video_files:
+    if files is None:
+        # 获取所有匹配的文件并排序
+        video_files = [f for f in os.listdir(input_dir) if fnmatch.fnmatch(f, pattern)]
+        video_files.sort()  # 按文件名排序
+        files = [os.path.join(input_dir, video) for video in video_files]
+
+    if not files:
+        if quiet:
+            raise ValueError("没有找到MP4文件")
         print("没有找到MP4文件")
         return
-    
-    # 创建一个临时文件列表
-    with open('temp_file_list.txt', 'w', encoding='utf-8') as f:
-        for video in video_files:
-            # 使用完整路径
-            full_path = os.path.join(input_dir, video)
-            f.write(f"file '{full_path}'\n")
-    
+
+    # 创建一个临时文件列表（每次调用唯一，并发运行时不会互相覆盖）
+    list_path = _write_file_list(files)
+
     try:
         # 使用ffmpeg的concat demuxer进行视频拼接
         cmd = [
             'ffmpeg',
             '-f', 'concat',
             '-safe', '0',
-            '-i', 'temp_file_list.txt',
+            '-i', list_path,
             '-c', 'copy',  # 直接复制流，不重新编码
             output_file
         ]
-        
-        subprocess.run(cmd, check=True)
-        print(f"视频拼接完成，输出文件: {output_file}")
-    
+
+        tracing.run(cmd, check=True, stdin=subprocess.DEVNULL)
+        if not quiet:
+            print(f"视频拼接完成，输出文件: {output_file}")
+
     except subprocess.CalledProcessError as e:
+        if quiet:
+            raise
         print(f"视频拼接失败: {e}")
-    
+
     finally:
         # 清理临时文件
-        if os.path.exists('temp_file_list.txt'):
-            os.remove('temp_file_list.txt')
+        if os.path.exists(list_path):
+            os.remove(list_path)
+
+
+class StreamingConcat:
+    """
+    边生成边拼接的视频输出
+
+    启动一个常驻的 ffmpeg 从 stdin 读取 MPEG-TS 流并直接流复制到输出；每追加一个
+    片段，就把它无损转封装成 MPEG-TS 并直接写入常驻进程的 stdin（两个进程间
+    用管道直连，数据不经过 Python）。输出为分片 MP4 或 HLS，写出的部分可以
+    立刻开始播放，不必等最后一个片段生成完。
+
+    用法::
+
+        with StreamingConcat("out.m3u8", fmt="hls") as stream:
+            for segment in generate_segments():
+                stream.append(segment)
+    """
+
+    def __init__(self, output_file, fmt='mp4', hls_time=4):
+        if fmt not in STREAM_FORMATS:
+            raise ValueError(f"不支持的输出格式: {fmt}，可选: {', '.join(STREAM_FORMATS)}")
+        self.output_file = Path(output_file)
+        self.fmt = fmt
+        self.offset = 0.0
+        self.count = 0
+
+        cmd = [
+            'ffmpeg', '-y', '-v', 'error',
+            '-f', 'mpegts', '-i', 'pipe:0',
+            '-map', '0',
+            '-c', 'copy',
+        ]
+        if fmt == 'mp4':
+            # 分片 MP4：moov 在文件开头且不依赖文件结尾，边写边可播放
+            cmd += ['-movflags', '+frag_keyframe+empty_moov+default_base_moof', '-f', 'mp4']
+        else:
+            segment_pattern = self.output_file.with_name(f"{self.output_file.stem}_%05d.ts")
+            cmd += [
+                '-f', 'hls',
+                '-hls_time', str(hls_time),
+                '-hls_list_size', '0',
+                '-hls_playlist_type', 'event',
+                '-hls_segment_filename', str(segment_pattern),
+            ]
+        cmd.append(str(self.output_file))
+
+        self.output_file.parent.mkdir(parents=True, exist_ok=True)
+        self._sink = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def append(self, segment_path):
+        """追加一个片段，返回追加后输出的总时长（秒）"""
+        if self._sink.poll() is not None:
+            raise Exception(f"视频拼接进程已退出: {self._sink.stderr.read().decode(errors='replace')}")
+
+        record = media_probe.probe(segment_path)
+        video = media_probe.first_stream(record, 'video')
+        cmd = [
+            'ffmpeg', '-v', 'error',
+            '-i', str(segment_path),
+            '-map', '0:v:0', '-map', '0:a?',
+            '-c', 'copy',
+        ]
+        if video and video['codec_name'] in ANNEXB_FILTERS:
+            cmd += ['-bsf:v', ANNEXB_FILTERS[video['codec_name']]]
+        # 每个片段的时间戳接在前面片段之后，保证输出时间戳单调递增
+        cmd += ['-output_ts_offset', f"{self.offset:.6f}", '-f', 'mpegts', 'pipe:1']
+
+        result = tracing.run(cmd, stdin=subprocess.DEVNULL, stdout=self._sink.stdin, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise Exception(f"片段转封装失败: {segment_path}: {result.stderr.decode(errors='replace')}")
+
+        self.offset += record['duration'] or 0.0
+        self.count += 1
+        return self.offset
+
+    def close(self):
+        """结束输入并等待输出写完，返回输出文件路径"""
+        if self._sink.stdin and not self._sink.stdin.closed:
+            self._sink.stdin.close()
+        stderr = self._sink.stderr.read().decode(errors='replace')
+        self._sink.stderr.close()
+        if self._sink.wait() != 0:
+            raise Exception(f"视频拼接失败: {stderr}")
+        return str(self.output_file)
+
+    def abort(self):
+        """放弃输出，终止常驻进程"""
+        if self._sink.poll() is None:
+            self._sink.kill()
+        self._sink.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def concat_stream(segments, output_file, fmt='mp4', hls_time=4):
+    """
+    流式拼接一个片段迭代器（可以是生成器，片段生成一个就拼接一个）
+
+    Args:
+        segments: 片段路径的可迭代对象
+        output_file: 输出路径，fmt 为 hls 时是 .m3u8 播放列表
+        fmt: 'mp4'（分片 MP4）或 'hls'
+        hls_time: HLS 分片时长（秒）
+    Returns:
+        str: 输出文件路径
+    """
+    with StreamingConcat(output_file, fmt, hls_time) as stream:
+        for segment in segments:
+            stream.append(segment)
+    return str(output_file)
+
+
+async def concat_stream_async(segments, output_file, fmt='mp4', hls_time=4):
+    """
+    concat_stream 的异步版本，segments 可以是异步迭代器
+
+    转封装在线程中执行，不阻塞事件循环，可以与异步的生成任务并发运行。
+    """
+    stream = await asyncio.to_thread(StreamingConcat, output_file, fmt, hls_time)
+    try:
+        if hasattr(segments, '__aiter__'):
+            async for segment in segments:
+                await asyncio.to_thread(stream.append, segment)
+        else:
+            for segment in segments:
+                await asyncio.to_thread(stream.append, segment)
+    except BaseException:
+        await asyncio.to_thread(stream.abort)
+        raise
+    return await asyncio.to_thread(stream.close)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='按文件名顺序拼接目录中的视频（流复制，不重新编码）')
+    parser.add_argument('files', nargs='*', help='待拼接的视频（按给定顺序），不指定时拼接 --input-dir 下的视频')
+    parser.add_argument('-d', '--input-dir', default='.', help='输入视频所在目录')
+    parser.add_argument('--pattern', default='*.mp4', help='文件匹配模式')
+    parser.add_argument('-o', '--output', default='combined_video.mp4', help='输出文件')
+    parser.add_argument('--stream', choices=STREAM_FORMATS, help='流式拼接输出格式（mp4 为分片 MP4，hls 输出 .m3u8）')
+    args = parser.parse_args()
+
+    if args.stream:
+        files = args.files or sorted(
+            os.path.join(args.input_dir, f) for f in os.listdir(args.input_dir) if fnmatch.fnmatch(f, args.pattern)
+        )
+        print(f"视频拼接完成，输出文件: {concat_stream(files, args.output, args.stream)}")
+    else:
+        concat_videos(args.input_dir, args.output, args.pattern, args.files or None)
+
 
 if __name__ == '__main__':
-    # 可以直接运行脚本，使用默认参数
-    concat_videos(output_file='combined_video.mp4')
+    # 不带参数运行时拼接当前目录的 MP4 到 combined_video.mp4
+    main()
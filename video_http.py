@@ -0,0 +1,173 @@
+"""支持 Range 请求的零拷贝视频/图片 HTTP 服务。
+
+响应体通过 socket.sendfile（Linux 上即 os.sendfile）直接从页缓存发到套接字，
+不经过 Python 缓冲区。支持单个字节区间的 Range/If-Range 请求（播放器可以
+立即开始播放和拖动），并返回 ETag/Last-Modified，命中 If-None-Match /
+If-Modified-Since 时返回 304。
+
+路由：
+    /videos/<文件名>   视频目录中的文件
+    /frames/<文件名>   最后一帧图片目录中的文件
+"""
+from __future__ import annotations
+
+import mimetypes
+import os
+import re
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from urllib.parse import quote, unquote
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def make_etag(st: os.stat_result) -> str:
+    return f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """解析单个字节区间，返回 [start, end]（闭区间）。
+
+    不支持或多个区间时返回 None（按完整内容响应），区间无法满足时抛出 ValueError。
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # bytes=-N 表示最后 N 个字节
+        length = int(end)
+        if length == 0:
+            raise ValueError("无法满足的区间")
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = int(end) if end else size - 1
+    if start >= size or end < start:
+        raise ValueError("无法满足的区间")
+    return start, min(end, size - 1)
+
+
+class MediaRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "VideoMock"
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def log_message(self, format, *args):
+        # 日志输出到 stderr 之外的地方会干扰 MCP 的 stdio 传输，这里保持安静
+        pass
+
+    def _resolve(self) -> Optional[Path]:
+        parts = unquote(self.path.split("?", 1)[0]).strip("/").split("/")
+        if len(parts) != 2:
+            return None
+        root = self.server.roots.get(parts[0])
+        name = parts[1]
+        if root is None or not name or name in (".", "..") or "\\" in name:
+            return None
+        path = root / name
+        return path if path.is_file() else None
+
+    def _not_modified(self, etag: str, mtime: float) -> bool:
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since:
+            try:
+                return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def _serve(self, send_body: bool):
+        path = self._resolve()
+        if path is None:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            size = st.st_size
+            etag = make_etag(st)
+            headers = {
+                "ETag": etag,
+                "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+                "Accept-Ranges": "bytes",
+                "Cache-Control": "public, max-age=3600",
+                "Content-Type": mimetypes.guess_type(path.name)[0] or "application/octet-stream",
+            }
+
+            if self._not_modified(etag, st.st_mtime):
+                self._send_headers(HTTPStatus.NOT_MODIFIED, headers)
+                return
+
+            byte_range = None
+            range_header = self.headers.get("Range")
+            if_range = self.headers.get("If-Range")
+            if range_header and (if_range is None or if_range.strip() == etag):
+                try:
+                    byte_range = parse_range(range_header, size)
+                except ValueError:
+                    headers["Content-Range"] = f"bytes */{size}"
+                    headers["Content-Length"] = "0"
+                    self._send_headers(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE, headers)
+                    return
+
+            if byte_range is None:
+                status, offset, count = HTTPStatus.OK, 0, size
+            else:
+                start, end = byte_range
+                status, offset, count = HTTPStatus.PARTIAL_CONTENT, start, end - start + 1
+                headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            headers["Content-Length"] = str(count)
+            self._send_headers(status, headers)
+
+            if send_body and count:
+                self.wfile.flush()
+                try:
+                    # 零拷贝：内核直接把文件页发到套接字
+                    self.connection.sendfile(f, offset, count)
+                except (BrokenPipeError, ConnectionResetError):
+                    # 播放器拖动时经常主动断开连接
+                    self.close_connection = True
+
+    def _send_headers(self, status: HTTPStatus, headers: Dict[str, str]):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+
+
+class MediaHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, roots: Dict[str, Path]):
+        super().__init__(address, MediaRequestHandler)
+        self.roots = {name: Path(root) for name, root in roots.items()}
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url_for(self, route: str, path: Path) -> str:
+        return f"{self.base_url}/{route}/{quote(Path(path).name)}"
+
+
+def start_http_server(host: str, port: int, roots: Dict[str, Path]) -> MediaHTTPServer:
+    """在后台守护线程中启动 HTTP 服务并返回服务对象。"""
+    server = MediaHTTPServer((host, port), roots)
+    thread = threading.Thread(target=server.serve_forever, name="video-http", daemon=True)
+    thread.start()
+    return server
@@ -1,24 +1,89 @@
 from __future__ import annotations
 
+import asyncio
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 from typing import Annotated, Dict, List, TypedDict
 
+from fastmcp import FastMCP
+
+import extract_last_frame
+import merge_video_audio
+import tracing
+import trim_video
+import video_concat
+from prefetch import PrefetchScheduler
+from video_catalog import VideoCatalog
+from video_http import MediaHTTPServer, start_http_server
+
 
 class VideoResponse(TypedDict):
     status: str
     video_url: str
     last_frame_url: str
 
-import os
-from pathlib import Path
-from typing import Annotated, List
-
-from fastmcp import FastMCP
-from fastmcp.utilities.types import File as MCPFile
 
 mcp = FastMCP("video-stream-mock")
 
+# ffmpeg 类工具放到有界线程池中执行，不阻塞事件循环
+TOOL_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("VIDEO_MCP_WORKERS", os.cpu_count() or 4)),
+    thread_name_prefix="video-mcp",
+)
+
+# 每个工具同时执行的最大数量，可用 VIDEO_MCP_LIMIT_<工具名> 环境变量覆盖
+TOOL_LIMITS = {
+    "get_video_stream": 32,
+    "trim_video": 2,
+    "concat_videos": 1,
+    "merge_video_audio": 2,
+    "extract_last_frame": 4,
+}
+_tool_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+
+def _tool_semaphore(name: str) -> asyncio.Semaphore:
+    if name not in _tool_semaphores:
+        limit = int(os.getenv(f"VIDEO_MCP_LIMIT_{name.upper()}", TOOL_LIMITS[name]))
+        _tool_semaphores[name] = asyncio.Semaphore(limit)
+    return _tool_semaphores[name]
+
+
+def _run_traced(name, func, *args, **kwargs):
+    with tracing.span(f"mcp.{name}", kind="tool"):
+        return func(*args, **kwargs)
+
+
+async def _offload(name: str, func, *args, **kwargs) -> Dict:
+    """在线程池中执行阻塞的工具函数，按工具限流，并附带请求级耗时信息。
+
+    Returns:
+        Dict: {"status": "success", "result": 返回值, "timing": {...}}，
+              出错时 status 为 "error" 并带 message
+    """
+    received = time.perf_counter()
+    async with _tool_semaphore(name):
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(
+                TOOL_EXECUTOR, lambda: _run_traced(name, func, *args, **kwargs)
+            )
+            response = {"status": "success", "result": result}
+        except Exception as e:
+            response = {"status": "error", "message": str(e)}
+    finished = time.perf_counter()
+    response["timing"] = {
+        "queued_ms": round((started - received) * 1000, 2),
+        "run_ms": round((finished - started) * 1000, 2),
+        "total_ms": round((finished - received) * 1000, 2),
+    }
+    return response
+
 
 def find_video_directory() -> Path:
     """查找可用的视频目录。
@@ -37,19 +102,88 @@ def find_video_directory() -> Path:
     raise FileNotFoundError(f"未找到视频目录，请确保以下任一目录存在：{', '.join(possible_dirs)}")
 
 
-def get_available_videos(video_dir: Path) -> List[Path]:
-    """获取指定目录下的所有 MP4 视频文件。"""
-    if not video_dir.exists():
-        return []
-        
-    return sorted(
-        [f for f in video_dir.glob("*.mp4") if f.is_file()],
-        key=lambda x: int(''.join(filter(str.isdigit, x.stem)))
-    )
+_catalog: VideoCatalog | None = None
+
+
+def get_catalog() -> VideoCatalog:
+    """返回进程内共享的视频目录索引，首次调用时定位目录并扫描。"""
+    global _catalog
+    if _catalog is None:
+        _catalog = VideoCatalog(find_video_directory())
+    return _catalog
+
+
+# 最后一帧图片的缓存目录
+FRAME_DIR = Path(os.getenv("VIDEO_FRAME_DIR", "./tmp/last_frames"))
+
+# HTTP 视频服务监听地址，设为空字符串时不启动，video_url 返回本地路径
+HTTP_ADDR = os.getenv("VIDEO_HTTP_ADDR", "127.0.0.1:8765")
+
+# 预取：观看第 N 轮时后台准备第 N+1 轮，VIDEO_PREFETCH=0 时关闭
+PREFETCH_ENABLED = os.getenv("VIDEO_PREFETCH", "1") not in ("0", "false", "no")
+DELIVERY_DIR = Path(os.getenv("VIDEO_DELIVERY_DIR", "./tmp/delivery"))
+
+# 工具的输入/输出路径都限制在工作目录内（相对路径相对于工作目录），输出只能写到工作目录；
+# 输入还可以来自视频目录和最后一帧缓存目录。工作目录与 HTTP 公开的交付目录分开，
+# 工具的输出不会被公开，也不会覆盖预取生成的交付文件
+WORKSPACE_DIR = Path(os.getenv("VIDEO_MCP_WORKSPACE", "./tmp/mcp_workspace"))
+
+_http_server: MediaHTTPServer | None = None
+_prefetcher: PrefetchScheduler | None = None
+
+
+def get_prefetcher() -> PrefetchScheduler | None:
+    global _prefetcher
+    if _prefetcher is None and PREFETCH_ENABLED:
+        _prefetcher = PrefetchScheduler(
+            get_catalog(), FRAME_DIR, DELIVERY_DIR,
+            lookahead=int(os.getenv("VIDEO_PREFETCH_LOOKAHEAD", 1)),
+            max_workers=int(os.getenv("VIDEO_PREFETCH_WORKERS", 2)),
+        )
+    return _prefetcher
+
+
+def start_http() -> MediaHTTPServer | None:
+    """按 VIDEO_HTTP_ADDR 启动支持 Range 请求的视频 HTTP 服务。"""
+    global _http_server
+    if _http_server is None and HTTP_ADDR:
+        host, _, port = HTTP_ADDR.rpartition(":")
+        _http_server = start_http_server(
+            host or "127.0.0.1", int(port),
+            {"videos": get_catalog().video_dir, "frames": FRAME_DIR, "delivery": DELIVERY_DIR},
+        )
+    return _http_server
+
+
+def _lookup_video(turns: int) -> Dict:
+    # 目录索引只在目录变化时重新扫描，不可读的文件在扫描时已被排除
+    catalog = get_catalog()
+    video_path = catalog.get(turns)["path"]
+    # 预取过的轮次，最后一帧已缓存，直接返回
+    frame_path = catalog.last_frame(turns, FRAME_DIR)
+
+    prefetcher = get_prefetcher()
+    delivery_path = None
+    if prefetcher is not None:
+        delivery_path = prefetcher.delivery_path(turns)
+        prefetcher.on_turn(turns)
+
+    if _http_server is not None:
+        return {
+            "video_url": (
+                _http_server.url_for("delivery", delivery_path) if delivery_path
+                else _http_server.url_for("videos", video_path)
+            ),
+            "last_frame_url": _http_server.url_for("frames", frame_path),
+        }
+    return {
+        "video_url": str(video_path),
+        "last_frame_url": str(frame_path),
+    }
 
 
 @mcp.tool
-def get_video_stream(
+async def get_video_stream(
     image_url: Annotated[str, "输入图片的URL或路径"] = "",
     gpt_prompt: Annotated[str, "DeepSeek提炼的核心prompt"] = "",
     is_first_frame: Annotated[bool, "是否作为首帧"] = True,
@@ -68,8 +202,9 @@ def get_video_stream(
     Returns:
         Dict: {
             "status": "success",
-            "video_url": str,  # 视频文件的路径
-            "last_frame_url": str  # 最后一帧图片的路径（mock固定值）
+            "video_url": str,  # 视频的 HTTP 地址（未启用 HTTP 服务时为本地路径）
+            "last_frame_url": str,  # 最后一帧图片的地址（首次请求时提取并缓存）
+            "timing": Dict  # 排队、执行和总耗时（毫秒）
         }
 
     Raises:
@@ -78,34 +213,124 @@ def get_video_stream(
     """
     if turns < 0:
         raise ValueError(f"视频轮次必须为非负数，当前值: {turns}")
-        
+
+    response = await _offload("get_video_stream", _lookup_video, turns)
+    if response["status"] == "success":
+        response.update(response.pop("result"))
+    return response
+
+
+def _resolve_path(path: str, output: bool = False) -> Path:
+    """把客户端传入的路径解析到允许的目录内，越界（包括经由 .. 或符号链接）时拒绝。"""
+    workspace = WORKSPACE_DIR.resolve()
+    resolved = (workspace / path).resolve()
+    roots = [workspace]
+    if not output:
+        roots.append(FRAME_DIR.resolve())
+        try:
+            roots.append(get_catalog().video_dir.resolve())
+        except FileNotFoundError:
+            pass
+    if resolved in roots or not any(resolved.is_relative_to(root) for root in roots):
+        raise PermissionError(f"路径不在允许的目录内: {path}")
+    if output and resolved.is_relative_to(DELIVERY_DIR.resolve()):
+        # 工作目录被配置成包含交付目录时，也不允许写入交付目录
+        raise PermissionError(f"不能写入交付目录: {path}")
+    return resolved
+
+
+@contextmanager
+def _atomic_output(output_path: Path):
+    """工具先写到同目录下的临时文件，成功后原子替换为目标文件，失败时目标文件保持不变。
+
+    原有的 ffmpeg 封装函数出错时不一定抛异常，所以用临时文件是否生成判断成败。
+    """
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output_path.with_name(f".{output_path.stem}.{threading.get_ident()}{output_path.suffix}")
     try:
-        video_dir = find_video_directory()
-        available_videos = get_available_videos(video_dir)
-        
-        if not available_videos:
-            raise FileNotFoundError(f"在 {video_dir} 目录下未找到任何 MP4 视频文件")
-            
-        if turns >= len(available_videos):
-            raise ValueError(f"视频轮次 {turns} 超出范围，当前共有 {len(available_videos)} 个视频文件")
-            
-        video_path = available_videos[turns]
-        
-        if not os.access(video_path, os.R_OK):
-            raise PermissionError(f"无法读取视频文件: {video_path}")
-            
-        return {
-            "status": "success",
-            "video_url": str(video_path),
-            "last_frame_url": "/outputs/last_frame.png"  # Mock的最后一帧图片路径
-        }
-        
-    except Exception as e:
-        return {
-            "status": "error",
-            "message": str(e)
-        }
+        yield tmp_path
+        if not tmp_path.exists():
+            raise RuntimeError(f"处理失败，未生成输出文件: {output_path}")
+        os.replace(tmp_path, output_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
 
 
-if __name__ == "__main__":
+def _trim(input_path: str, output_path: str, seconds_to_trim: float, mode: str) -> str:
+    source, target = _resolve_path(input_path), _resolve_path(output_path, output=True)
+    with _atomic_output(target) as tmp_path:
+        trim_video.trim_video(str(source), str(tmp_path), seconds_to_trim, quiet=True, mode=mode)
+    return str(target)
+
+
+def _concat(video_paths: List[str], output_path: str) -> str:
+    files = [str(_resolve_path(path)) for path in video_paths]
+    target = _resolve_path(output_path, output=True)
+    with _atomic_output(target) as tmp_path:
+        video_concat.concat_videos(output_file=str(tmp_path), files=files, quiet=True)
+    return str(target)
+
+
+def _merge(video_path: str, audio_path: str, output_path: str, profile: str) -> str:
+    video, audio = _resolve_path(video_path), _resolve_path(audio_path)
+    target = _resolve_path(output_path, output=True)
+    with _atomic_output(target) as tmp_path:
+        merge_video_audio.merge_video_audio(str(video), str(audio), str(tmp_path), profile, quiet=True)
+    return str(target)
+
+
+def _extract_last_frame(video_path: str, output_path: str) -> str:
+    source = _resolve_path(video_path)
+    target = _resolve_path(output_path or f"{source.stem}_last_frame.png", output=True)
+    with _atomic_output(target) as tmp_path:
+        extract_last_frame.extract_last_frame(source, tmp_path, verbose=False)
+    return str(target)
+
+
+@mcp.tool(name="trim_video")
+async def trim_video_tool(
+    input_path: Annotated[str, "输入视频路径"],
+    output_path: Annotated[str, "输出视频路径"],
+    seconds_to_trim: Annotated[float, "从末尾切除的秒数"] = 10,
+    mode: Annotated[str, "裁剪模式: copy / smart / reencode"] = "copy",
+) -> Dict:
+    """从视频末尾切除指定秒数，返回输出路径和耗时信息。"""
+    return await _offload("trim_video", _trim, input_path, output_path, seconds_to_trim, mode)
+
+
+@mcp.tool(name="concat_videos")
+async def concat_videos_tool(
+    video_paths: Annotated[List[str], "按顺序拼接的视频路径列表"],
+    output_path: Annotated[str, "输出视频路径"],
+) -> Dict:
+    """按给定顺序无损拼接多个视频，返回输出路径和耗时信息。"""
+    return await _offload("concat_videos", _concat, video_paths, output_path)
+
+
+@mcp.tool(name="merge_video_audio")
+async def merge_video_audio_tool(
+    video_path: Annotated[str, "输入视频路径"],
+    audio_path: Annotated[str, "输入音频路径"],
+    output_path: Annotated[str, "输出视频路径"],
+    profile: Annotated[str, "编码档位: fast-preview / delivery / archive"] = "delivery",
+) -> Dict:
+    """把音频循环铺到视频上，返回输出路径和耗时信息。"""
+    return await _offload("merge_video_audio", _merge, video_path, audio_path, output_path, profile)
+
+
+@mcp.tool(name="extract_last_frame")
+async def extract_last_frame_tool(
+    video_path: Annotated[str, "输入视频路径"],
+    output_path: Annotated[str, "输出图片路径（可选，默认写到工作目录）"] = "",
+) -> Dict:
+    """提取视频的最后一帧，返回图片路径和耗时信息。"""
+    return await _offload("extract_last_frame", _extract_last_frame, video_path, output_path)
+
+
+def main():
+    start_http()
     mcp.run()
+
+
+if __name__ == "__main__":
+    main()